@@ -0,0 +1,221 @@
+######### Corpus.py #########
+
+from array import array # for compact storage of sentences
+
+class CompactCorpus:
+    """
+    A class for holding tagged sentences compactly: every word and tag is
+    interned once, and sentences are stored as contiguous arrays of word and tag
+    ids with an array of sentence offsets. A sentence costs a few bytes per word
+    rather than a list of (word, tag) tuples.
+
+    Sentences have no start marker stored in them; training treats one as being
+    at the start of every sentence.
+    """
+
+    def __init__(self, tagged_sents=()):
+        """
+        Construct a CompactCorpus object
+
+        :param tagged_sents: iterable of tagged sentences to add (default: none)
+        """
+
+        # interned words and tags, indexed by id, and maps back to their ids
+        self.words = []
+        self.word_ids = {}
+        self.tags = []
+        self.tag_ids = {}
+
+        # word and tag id for every word in the corpus, one sentence after another
+        self.token_words = array('I')
+        self.token_tags = array('B')
+
+        # where each sentence starts in the token arrays, plus where the last one
+        # ends
+        self.offsets = array('L', [0])
+
+        for sent in tagged_sents:
+            self.add_sent(sent)
+
+    ######### `PUBLIC' FUNCTIONS #########
+
+    def add_sent(self, tagged_sent):
+        """
+        Add a tagged sentence to the end of the corpus
+
+        :param tagged_sent: list of (word, tag) tuples
+        """
+
+        word_ids = self.word_ids # for speed
+        tag_ids = self.tag_ids
+
+        for (word, pos) in tagged_sent:
+            if word not in word_ids:
+                word_ids[word] = len(self.words)
+                self.words.append(word)
+            if pos not in tag_ids:
+                tag_ids[pos] = len(self.tags)
+                self.tags.append(pos)
+            self.token_words.append(word_ids[word])
+            self.token_tags.append(tag_ids[pos])
+
+        self.offsets.append(len(self.token_words))
+
+    def __len__(self):
+        """
+        Return the number of sentences in the corpus
+        """
+
+        return len(self.offsets) - 1
+
+    def sent(self, i):
+        """
+        Return sentence i as a list of words
+
+        :param i: index of the sentence
+        """
+
+        words = self.words
+        return [words[w] for w in \
+            self.token_words[self.offsets[i]:self.offsets[i + 1]]]
+
+    def tagged_sent(self, i):
+        """
+        Return sentence i as a list of (word, tag) tuples
+
+        :param i: index of the sentence
+        """
+
+        start = self.offsets[i]
+        end = self.offsets[i + 1]
+        words = self.words
+        tags = self.tags
+        return [(words[w], tags[t]) for (w, t) in \
+            zip(self.token_words[start:end], self.token_tags[start:end])]
+
+    def sents(self):
+        """
+        Return a SentView of every sentence as a list of words
+        """
+
+        return SentView(self, [(0, len(self))], tagged=False)
+
+    def tagged_sents(self):
+        """
+        Return a SentView of every sentence as a list of (word, tag) tuples
+        """
+
+        return SentView(self, [(0, len(self))], tagged=True)
+
+
+class SentView:
+    """
+    A class for a read-only sequence of sentences from a CompactCorpus, which can
+    be sliced and concatenated without copying any sentences. Sentences are only
+    built as lists when they are asked for
+    """
+
+    def __init__(self, corpus, ranges, tagged=True):
+        """
+        Construct a SentView object
+
+        :param corpus: CompactCorpus object the sentences belong to
+        :param ranges: list of (start, end) sentence index ranges making up the view
+        :param tagged: whether sentences are (word, tag) tuples or just words
+            (default: True)
+        """
+
+        self.corpus = corpus
+        self.ranges = ranges
+        self.tagged = tagged
+
+    def __len__(self):
+        """
+        Return the number of sentences in the view
+        """
+
+        return sum([end - start for (start, end) in self.ranges])
+
+    def __getitem__(self, i):
+        """
+        Return a sentence, or a SentView if given a slice
+
+        :param i: index of the sentence in the view, or a slice
+        """
+
+        if isinstance(i, slice):
+            (start, stop, step) = i.indices(len(self))
+            if step != 1:
+                raise Exception("SentView slices can't have a step!")
+            return SentView(self.corpus, self._ranges_between(start, stop), \
+                self.tagged)
+
+        if i < 0:
+            i += len(self)
+        for (start, end) in self.ranges:
+            if i < end - start:
+                return self._get(start + i)
+            i -= end - start
+
+        raise IndexError("SentView index out of range")
+
+    def __iter__(self):
+        """
+        Generate each sentence in the view in turn
+        """
+
+        for (start, end) in self.ranges:
+            for i in xrange(start, end):
+                yield self._get(i)
+
+    def __add__(self, other):
+        """
+        Return a SentView of this view's sentences followed by another's
+
+        :param other: SentView of the same corpus
+        """
+
+        return SentView(self.corpus, self.ranges + other.ranges, self.tagged)
+
+    def indices(self):
+        """
+        Generate the corpus index of each sentence in the view
+        """
+
+        for (start, end) in self.ranges:
+            for i in xrange(start, end):
+                yield i
+
+    ######### `PRIVATE' FUNCTIONS #########
+
+    def _get(self, i):
+        """
+        Return sentence i of the corpus in this view's form
+
+        :param i: index of the sentence in the corpus
+        """
+
+        if self.tagged:
+            return self.corpus.tagged_sent(i)
+        return self.corpus.sent(i)
+
+    def _ranges_between(self, start, stop):
+        """
+        Return the list of corpus ranges covering view indices start to stop
+
+        :param start: first view index
+        :param stop: view index to stop before
+        """
+
+        ranges = []
+        offset = 0
+        for (range_start, range_end) in self.ranges:
+            length = range_end - range_start
+            # find the overlap of [start, stop) with this range
+            first = max(start - offset, 0)
+            last = min(stop - offset, length)
+            if first < last:
+                ranges.append((range_start + first, range_start + last))
+            offset += length
+
+        return ranges
@@ -0,0 +1,290 @@
+######### Evaluation.py #########
+
+from __future__ import division # use floating point division
+from array import array # for compact storage of counts and mistake references
+
+class Evaluation:
+    """
+    A class for accumulating tagging accuracy data over a number of test cycles.
+
+    Rather than keeping copies of every sentence we made a mistake in, we keep a
+    confusion matrix of tag ids and store each mistake as a reference into the
+    corpus, i.e. (fold, sentence index, token index). Sentence contexts are only
+    looked up again when somebody asks for them.
+    """
+
+    def __init__(self):
+        """
+        Construct an Evaluation object
+        """
+
+        # list of tags we have seen, and a map from each tag to its index (id)
+        self.tags = []
+        self.tag_ids = {}
+
+        # flattened (gold tag id x hmm tag id) matrix of tag counts
+        self.confusion = array('L')
+
+        # list of (test_pct, start_test_pct) tuples, one for each test cycle
+        self.folds = []
+
+        # number of correct and incorrect tags for each test cycle
+        self.rights = array('L')
+        self.wrongs = array('L')
+
+        # parallel arrays making up one record per mistake
+        self.mistake_folds = array('H') # index into self.folds
+        self.mistake_sents = array('L') # sentence index within the fold
+        self.mistake_tokens = array('I') # word index within the sentence
+        self.mistake_hmm_tags = array('H') # id of the tag we chose
+        self.mistake_gold_tags = array('H') # id of the gold standard tag
+
+        # indices of mistake records, indexed by (hmm tag id, gold tag id) and
+        # by word, so we can jump straight to the examples of a mistake
+        self.by_pair = {}
+        self.by_word = {}
+
+        # tag ids we chose for sentences which contained a mistake, so we can
+        # show our version of the sentence later. keyed by (fold, sent index)
+        self.hmm_tags = {}
+
+    ######### `PUBLIC' FUNCTIONS #########
+
+    def start_fold(self, test_pct, start_test_pct):
+        """
+        Begin recording a new test cycle, and return its index
+
+        :param test_pct: what pct of the corpus the cycle is tested on
+        :param start_test_pct: where in the corpus the testing sentences begin
+        """
+
+        self.folds.append((test_pct, start_test_pct))
+        self.rights.append(0)
+        self.wrongs.append(0)
+
+        return len(self.folds) - 1
+
+    def score_sent(self, fold, sent_index, hmm_tagged_sent, gold_tagged_sent):
+        """
+        Compare one tagged sentence with its gold standard, record the result,
+        and return a tuple of (right, wrong) counts for the sentence
+
+        :param fold: index of the test cycle, as returned by start_fold()
+        :param sent_index: index of the sentence within the test cycle
+        :param hmm_tagged_sent: list of (word, tag) tuples we tagged
+        :param gold_tagged_sent: list of (word, tag) tuples from the gold standard
+        """
+
+        # ensure our sentences have the same length
+        if len(hmm_tagged_sent) != len(gold_tagged_sent):
+            raise Exception("HMM-tagged sentence did not match gold \
+                standard sentence!")
+
+        right = 0 # initialize counter of correct tags
+        wrong = 0 # initialize counter of incorrect tags
+
+        # loop through words in sentence
+        for j in range(len(gold_tagged_sent)):
+            (gold_word, gold_tag) = gold_tagged_sent[j]
+            (hmm_word, hmm_tag) = hmm_tagged_sent[j]
+
+            # ensure the words are the same between the sets
+            if gold_word != hmm_word:
+                raise Exception("HMM-tagged word did not match gold \
+                    standard word!")
+
+            gold_id = self._tag_id(gold_tag)
+            hmm_id = self._tag_id(hmm_tag)
+            self.confusion[gold_id * len(self.tags) + hmm_id] += 1
+
+            # increment counters based on tag correctness, and remember where
+            # we went wrong
+            if gold_id == hmm_id:
+                right += 1
+            else:
+                n = len(self.mistake_sents) # index of this mistake record
+                self._index(self.by_pair, (hmm_id, gold_id), n)
+                self._index(self.by_word, gold_word, n)
+                self.mistake_folds.append(fold)
+                self.mistake_sents.append(sent_index)
+                self.mistake_tokens.append(j)
+                self.mistake_hmm_tags.append(hmm_id)
+                self.mistake_gold_tags.append(gold_id)
+                wrong += 1
+        # end words loop
+
+        # if we got anything wrong, keep our tags (but not the words) around
+        if wrong > 0:
+            self.hmm_tags[(fold, sent_index)] = array('H', \
+                [self.tag_ids[w[1]] for w in hmm_tagged_sent])
+
+        self.rights[fold] += right
+        self.wrongs[fold] += wrong
+
+        return (right, wrong)
+
+    def count(self, gold_tag, hmm_tag):
+        """
+        Return how many times gold_tag was tagged as hmm_tag
+
+        :param gold_tag: tag from the gold standard
+        :param hmm_tag: tag we chose
+        """
+
+        if gold_tag not in self.tag_ids or hmm_tag not in self.tag_ids:
+            return 0
+
+        return self.confusion[self.tag_ids[gold_tag] * len(self.tags) + \
+            self.tag_ids[hmm_tag]]
+
+    def mistake_types(self, threshold=0):
+        """
+        Return a list of (count, hmm_tag, gold_tag) tuples for each kind of mistake
+        that occurred more than threshold times, worst first
+
+        :param threshold: number of times a mistake must have occurred (default: 0)
+        """
+
+        num_tags = len(self.tags)
+        types = []
+
+        # read the counts off the confusion matrix, skipping the diagonal
+        for (hmm_id, gold_id) in self.by_pair.iterkeys():
+            count = self.confusion[gold_id * num_tags + hmm_id]
+            if count > threshold:
+                types.append((count, self.tags[hmm_id], self.tags[gold_id]))
+
+        return sorted(types, reverse=True)
+
+    def mistakes_of(self, hmm_tag, gold_tag):
+        """
+        Return the indices of the mistakes where gold_tag was tagged as hmm_tag
+
+        :param hmm_tag: tag we chose
+        :param gold_tag: tag from the gold standard
+        """
+
+        if hmm_tag not in self.tag_ids or gold_tag not in self.tag_ids:
+            return array('L')
+
+        return self.by_pair.get((self.tag_ids[hmm_tag], self.tag_ids[gold_tag]), \
+            array('L'))
+
+    def mistakes_for_word(self, word):
+        """
+        Return the indices of the mistakes we made tagging a word
+
+        :param word: string word
+        """
+
+        return self.by_word.get(word, array('L'))
+
+    def tabulate(self):
+        """
+        Return a string table of mistake counts, with a row for each gold standard
+        tag and a column for each tag we chose instead
+        """
+
+        num_tags = len(self.tags)
+
+        # only show tags which took part in a mistake
+        gold_ids = sorted(set(pair[1] for pair in self.by_pair), \
+            key=lambda i: self.tags[i])
+        hmm_ids = sorted(set(pair[0] for pair in self.by_pair), \
+            key=lambda i: self.tags[i])
+
+        width = max([len(self.tags[i]) for i in gold_ids + hmm_ids] + [4])
+        rows = [' ' * width + ''.join([' %*s' % (width, self.tags[h]) for h in \
+            hmm_ids])]
+        for g in gold_ids:
+            rows.append('%*s' % (width, self.tags[g]) + ''.join([' %*d' % \
+                (width, 0 if g == h else self.confusion[g * num_tags + h]) for \
+                h in hmm_ids]))
+
+        return '\n'.join(rows) + '\n'
+
+    def num_mistakes(self):
+        """
+        Return the total number of mistakes recorded
+        """
+
+        return len(self.mistake_sents)
+
+    def mistake(self, n):
+        """
+        Return a tuple like (hmm_tag, gold_tag) for mistake number n
+
+        :param n: index of the mistake
+        """
+
+        return (self.tags[self.mistake_hmm_tags[n]], \
+            self.tags[self.mistake_gold_tags[n]])
+
+    def context(self, n, tb):
+        """
+        Look up the sentence contexts for mistake number n, and return a tuple like
+        (hmm_tagged_word, gold_tagged_word, hmm_tagged_sent, gold_tagged_sent)
+
+        :param n: index of the mistake
+        :param tb: Treebank object the test cycles were drawn from
+        """
+
+        fold = self.mistake_folds[n]
+        sent_index = self.mistake_sents[n]
+        token_index = self.mistake_tokens[n]
+        (test_pct, start_test_pct) = self.folds[fold]
+
+        # we can only find sentences for test cycles drawn from a known range
+        if test_pct is None:
+            raise Exception("Test cycle was not drawn from a range of the corpus!")
+
+        # resolve the gold standard sentence from the corpus, and rebuild our
+        # version of it from the tag ids we kept
+        gold_tagged_sent = tb.testing_sent(test_pct, start_test_pct, sent_index)
+        hmm_tags = self.hmm_tags[(fold, sent_index)]
+        hmm_tagged_sent = [(gold_tagged_sent[j][0], self.tags[hmm_tags[j]]) for \
+            j in range(len(gold_tagged_sent))]
+
+        return (hmm_tagged_sent[token_index], gold_tagged_sent[token_index], \
+            hmm_tagged_sent, gold_tagged_sent)
+
+    ######### `PRIVATE' FUNCTIONS #########
+
+    def _index(self, index, key, n):
+        """
+        Add mistake number n to an index under key
+
+        :param index: dict of key -> array of mistake indices
+        :param key: key to file the mistake under
+        :param n: index of the mistake record
+        """
+
+        if key not in index:
+            index[key] = array('L')
+        index[key].append(n)
+
+    def _tag_id(self, tag):
+        """
+        Return the id for a tag, assigning a new one (and growing the confusion
+        matrix) if we haven't seen it before
+
+        :param tag: string POS tag
+        """
+
+        if tag in self.tag_ids:
+            return self.tag_ids[tag]
+
+        old_size = len(self.tags)
+        new_size = old_size + 1
+
+        # lay the existing counts out again in a matrix one row and column wider
+        confusion = array('L', [0]) * (new_size * new_size)
+        for g in range(old_size):
+            for h in range(old_size):
+                confusion[g * new_size + h] = self.confusion[g * old_size + h]
+        self.confusion = confusion
+
+        self.tag_ids[tag] = old_size
+        self.tags.append(tag)
+
+        return old_size
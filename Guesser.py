@@ -1,7 +1,8 @@
 ######### Guesser.py #########
 
 from PennTags import PennTags # for tag list
-import re # for finding word suffixes, etc...
+from UniversalTags import coarse_tag # for guessing in other tag sets
+from Shapes import Shape, ShapeCache # for word features
 
 class Guesser:
     "A class for guessing the part of speech of a word"
@@ -30,31 +31,51 @@ class Guesser:
     
     
     
-    def __init__(self, pos_tags, words_given_pos):
+    def __init__(self, pos_tags, words_given_pos, suffixes=None, shapes=None,
+        tags=PennTags):
         """
         Initialize a Guesser object
         
         :param pos_tags: a list of part of speech tags
         :param words_given_pos: a ConditionalFreqDist object representing P(Wi|Ck)
+        :param suffixes: SuffixTrie (or PackedSuffixTrie) built in training over
+            pos_tags, to guess a distribution over every tag from (default: None,
+            to guess a single tag by hand-written rules)
+        :param shapes: ShapeCache to look up word features in (default: a new one)
+        :param tags: tag set class pos_tags belong to (default: PennTags)
         """
         
         # to make this class more general, we allow different `tag classes' to be
         # used, which act as readable interfaces to possibly-different tag sets
-        self.tags = PennTags # use the penn treebank tags
+        self.tags = tags
         
         self.pos_tags = pos_tags
         
         self.words_given_pos = words_given_pos
         
+        self.suffixes = suffixes
+        
+        self.shapes = shapes if shapes is not None else ShapeCache()
+        
         # the human-friendly Guesser.punct_list is the inverse of what we want,
         # so let's turn it into something easier to look up POS tag given word
         self.inverted_punct_list = {}
         for pos, wordlist in self.punct_list.iteritems():
             for word in wordlist:
-                self.inverted_punct_list[word] = pos
+                self.inverted_punct_list[word] = coarse_tag(tags, pos)
                 
     ######### `PUBLIC' FUNCTIONS #########
         
+    def distribution(self, word):
+        """
+        Return a list of scores proportional to P(word|tag) for an unseen word, one
+        for each POS tag, looked up by the word's suffix in O(suffix length)
+        
+        :param word: string word
+        """
+        
+        return self.suffixes.distribution(word)
+        
     def guess(self, word, scores_without_word_prob):
         """
         Return a guessed part of speech for a given word
@@ -66,16 +87,17 @@ class Guesser:
         
         t = self.tags # for convenience
         
-        # create a list of features for a word, for now stored in simple variables
-        is_upper = re.search(r'[A-Z]', word[0]) is not None
-        ends_in_s = word[len(word)-1] == 's'
-        ends_in_ly = word[-2:] == 'ly'
-        ends_in_ing = word[-3:] == 'ing'
-        ends_in_er = word[-2:] == 'er'
-        ends_in_ed = word[-2:] == 'ed'
-        ends_in_ize = word[-3:] == 'ize'
-        has_hyphen = re.search(r'\-', word) is not None
-        has_number = re.search(r'[0-9]+', word) is not None
+        # look up the features of the word, all worked out at once in its shape
+        shape = self.shapes.shape(word)
+        is_upper = shape & Shape.upper
+        ends_in_s = shape & Shape.ends_s
+        ends_in_ly = shape & Shape.ends_ly
+        ends_in_ing = shape & Shape.ends_ing
+        ends_in_er = shape & Shape.ends_er
+        ends_in_ed = shape & Shape.ends_ed
+        ends_in_ize = shape & Shape.ends_ize
+        has_hyphen = shape & Shape.hyphen
+        has_number = shape & Shape.number
         
         # test for different features and guess
         
@@ -197,8 +219,9 @@ class Guesser:
         t = self.tags # for convenience
         
         # gather additional features about the word
-        ends_in_es = word[-2:] == 'es'
-        ends_in_ies = word[-3:] == 'ies'
+        shape = self.shapes.shape(word)
+        ends_in_es = shape & Shape.ends_es
+        ends_in_ies = shape & Shape.ends_ies
         
         guess_tag = def_tag # set guess_tag to default return value
         ies_tag = None # set 'ies' guess value
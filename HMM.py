@@ -1,10 +1,11 @@
 ######### HMM.py #########
 
 from __future__ import division # for floating-point division
-from Helper import * # for progress_bar(), indices_of_max(), msg()
+from Helper import * # for Progress, indices_of_max(), msg()
 from Guesser import Guesser # for word guesser
+from PennTags import PennTags # for the default tag set
+from Shapes import Shape, ShapeCache # for word shapes
 import time # for timing our tagging process
-import re # for regex
 
 class HMM:
     "A class for building Hidden Markov Models of tagged word data"
@@ -15,11 +16,13 @@ class HMM:
     punct_list = ["''", '``', ',']
     
     def __init__(self, untagged_sents, pos_tags, words_given_pos, \
-        words_given_pos_upper, pos2_given_pos1, start_tag):
+        words_given_pos_upper, pos2_given_pos1, start_tag, suffixes=None, \
+        tags=PennTags):
         """
         Construct a HMM object
         
-        :param untagged_sents: list of untagged sentences for tagging
+        :param untagged_sents: list of untagged sentences for tagging, or None if
+            sentences will be given to tag_iter() instead
         :param pos_tags: list of possible POS tags
         :param words_given_pos: nltk.ConditionalFreqDist for P(Wi|Ck) with all words
             converted to lowercase
@@ -28,66 +31,325 @@ class HMM:
         :param pos2_given_pos1: nltk.ConditionalFreqDist for P(Ci+1|Ci)
         :param default_tag: POS tag to guess for words
         :param start_tag: start tag used to mark sentence beginning
+        :param suffixes: SuffixTrie built in training to score unseen words by
+            their suffix (default: None, to guess a single tag for them instead)
+        :param tags: tag set class pos_tags belong to (default: PennTags)
         """
         
         self.start_tag = start_tag
         self.untagged_sents = untagged_sents
-        self.num_untagged_sents = len(untagged_sents)
         self.all_pos_tags = pos_tags
         self.words_given_pos = words_given_pos
         self.words_given_pos_upper = words_given_pos_upper
         self.pos2_given_pos1 = pos2_given_pos1
         
+        # one cache of word shapes, shared with our guesser
+        self.shapes = ShapeCache()
+        
         # initialize one guesser object to use for the whole test
-        self.guesser = Guesser(pos_tags, words_given_pos)
+        self.guesser = Guesser(pos_tags, words_given_pos, suffixes, self.shapes, \
+            tags)
+        
+        # Refiner to turn the tags of a coarse tag set back into Penn Treebank
+        # tags after decoding, if we're asked to
+        self.refiner = None
+        
+        # will hold the flat tables tag_sent() decodes with, built when it first
+        # runs. They are a snapshot of the transition probabilities, so make a
+        # new HMM after updating the counts behind them
+        self.tables = None
+        
+        # how tag_sent() decodes: 'viterbi' or 'greedy', and the most seconds to
+        # spend on a sentence with Viterbi before finishing it greedily (None for
+        # no limit). Set them with set_decoding()
+        self.mode = 'viterbi'
+        self.time_budget = None
+        
+        # initialize variables to track for tagging stats
+        self._reset_stats()
     
     ######### `PUBLIC' FUNCTIONS #########
         
-    def tag(self):
+    def tag(self, writer=None):
         """
         Tag all this object's sentences, return a list of tagged sentences
+        
+        :param writer: Writer object to also write each sentence to as soon as it
+            is tagged (default: None)
         """
         
         msg("Tagging sentences:\n")
-        start_time = time.time() # mark the start time for this process
         tagged_sents = [] # array to hold tagged sentences
         complete = 0 # how many sentences we have tagged
+        num_untagged_sents = len(self.untagged_sents)
+        progress = Progress(num_untagged_sents) # for showing progress now and then
         
-        # initialize variables to track for tagging stats
-        total_prob_time = 0 # time spent looking up probabilities
-        total_other_time = 0 # time spent doing other things
-        total_guess_count = 0 # words we used the guesser to guess POS for
-        total_word_count = 0 # num words tagged
-        total_unknown_count = 0 # num words with no P(Wi|Ci)
-        
-        # tag each sentence and track statistics
-        for sent in self.untagged_sents:
-            total_word_count += len(sent)
-            (tagged_sent, prob_time, other_time, guess_count, unknown_count) = \
-                self.tag_sent(sent)
-            total_prob_time += prob_time
-            total_other_time += other_time
-            total_guess_count += guess_count
-            total_unknown_count += unknown_count
+        # tag each sentence
+        for tagged_sent in self.tag_iter(self.untagged_sents):
             tagged_sents.append(tagged_sent) # append tagged sentence to array
+            if writer is not None:
+                writer.write_sent(tagged_sent)
             complete += 1 # increment our completed counter for progress bar
             # show nice progress bar
-            progress_bar(complete,self.num_untagged_sents,time.time() - start_time)
+            progress.update(complete)
             
         # print nice things to the user
-        msg("\n")
-        msg("Time spent looking up probabilities: %0.2fs\n" % total_prob_time)
-        msg("Total unseen words: %d (%0.2f%% of total)\n" % (total_unknown_count, \
-            total_unknown_count / total_word_count * 100))
-        msg("Total words guessed: %d (%0.2f%% of unseen)\n" % (total_guess_count, \
-            total_guess_count / total_unknown_count * 100))
-        
+        progress.finish(complete)
+        self.report()
         
         return tagged_sents
         
-    def tag_sent(self, words):
+    def tag_iter(self, untagged_sents):
+        """
+        Tag sentences one at a time as they are pulled from an iterable, yielding
+        each tagged sentence and keeping only running statistics
+        
+        :param untagged_sents: iterable of untagged sentences
+        """
+        
+        self._reset_stats()
+        
+        # tag each sentence and track statistics
+        for sent in untagged_sents:
+            self.total_word_count += len(sent)
+            (tagged_sent, prob_time, other_time, guess_count, unknown_count) = \
+                self.tag_sent(sent)
+            self.total_prob_time += prob_time
+            self.total_other_time += other_time
+            self.total_guess_count += guess_count
+            self.total_unknown_count += unknown_count
+            yield tagged_sent
+            
+    def report(self):
+        """
+        Print statistics about the last set of sentences we tagged
+        """
+        
+        msg("Time spent looking up probabilities: %0.2fs\n" % self.total_prob_time)
+        msg("Total unseen words: %d (%0.2f%% of total)\n" % \
+            (self.total_unknown_count, \
+            self.total_unknown_count / max(self.total_word_count, 1) * 100))
+        msg("Total words guessed: %d (%0.2f%% of unseen)\n" % \
+            (self.total_guess_count, \
+            self.total_guess_count / max(self.total_unknown_count, 1) * 100))
+        if self.time_budget is not None or self.total_degraded_count:
+            msg("Sentences finished greedily: %d (%d words)\n" % \
+                (self.total_degraded_count, self.total_degraded_word_count))
+        
+    def set_decoding(self, mode='viterbi', time_budget=None):
+        """
+        Choose how tag_sent() decodes
+        
+        :param mode: 'viterbi', or 'greedy' to pick the best tag for each word in
+            turn given the tag before it, which looks up only the tags each word
+            was seen with (default: 'viterbi')
+        :param time_budget: most seconds to spend on a sentence with Viterbi,
+            after which the rest of it is tagged greedily (default: None, for no
+            limit)
+        """
+        
+        if mode not in ['viterbi', 'greedy']:
+            raise Exception("Unknown decoding mode %s!" % mode)
+        
+        self.mode = mode
+        self.time_budget = time_budget
+        
+    def tag_sent(self, words, deadline=None):
+        """
+        Tag a sentence using the Viterbi algorithm, and return a tuple like
+        (tagged sentence, probability lookup time, other time, number of words
+        guessed, number of unseen words).
+        
+        This is a tuned version of tag_sent_reference() which gives exactly the
+        same tags: probabilities are looked up once per word into flat columns
+        rather than once per cell, transitions come from rows precomputed by
+        _build_tables(), and only the previous column of scores is kept.
+        
+        In greedy mode, this tags with tag_sent_greedy() instead. Otherwise, once
+        our time budget or the deadline runs out, the words left are tagged
+        greedily from the best POS so far, and the sentence is counted in
+        self.total_degraded_count.
+        
+        :param words: a list of untagged words
+        :param deadline: time.time() by which to stop using Viterbi, e.g. for a
+            whole request (default: None, for only our time budget)
+        """
+        
+        if self.mode == 'greedy':
+            return self.tag_sent_greedy(words)
+        
+        start_time = time.time()
+        prob_time = 0
+        guess_count = 0
+        unknown_count = 0
+        
+        if self.time_budget is not None:
+            budget_deadline = start_time + self.time_budget
+            if deadline is None or budget_deadline < deadline:
+                deadline = budget_deadline
+        
+        # (re)build our tables if we haven't yet, or tags have been added
+        if self.tables is None or self.tables[0] != len(self.all_pos_tags):
+            self._build_tables()
+        (num_tags, tag_indices, start_probs, transitions, lower_probs, \
+            upper_probs, proper_nouns) = self.tables[:7]
+        
+        # bind what we use for every word to local names
+        tag_range = range(num_tags)
+        shape = self.shapes.shape
+        upper = Shape.upper
+        timer = time.time
+        
+        column = None # scores of each POS for the previous word
+        last_max_indices = None # POS indices with the best score in column
+        backpointers = [] # for each word, the previous POS index of each POS
+        greedy_tail = None # POS indices of the words tagged greedily, if any
+        
+        for j in range(len(words)):
+            word = words[j]
+            
+            # out of time: follow the first best POS so far through the rest
+            # of the sentence greedily
+            if deadline is not None and column is not None and \
+                timer() > deadline:
+                k = last_max_indices[0]
+                (greedy_tail, greedy_prob_time, greedy_guess_count, \
+                    greedy_unknown_count) = self._greedy_path(words[j:], k, \
+                    column[k])
+                prob_time += greedy_prob_time
+                guess_count += greedy_guess_count
+                unknown_count += greedy_unknown_count
+                self.total_degraded_count += 1
+                self.total_degraded_word_count += len(greedy_tail)
+                break
+            
+            # the first word is looked up in lowercase, after the start tag
+            if column is None:
+                lower_word = word.lower()
+                word_probs = lower_probs(lower_word)
+                scores_without_word_prob = start_probs
+                backpointers.append([0] * num_tags)
+                
+            else:
+                start_prob_time = timer()
+                
+                # find P(Wj|Ci) for every POS at once. Lowercase words can't be
+                # proper nouns
+                if shape(word) & upper:
+                    word_probs = upper_probs(word)
+                else:
+                    word_probs = lower_probs(word)
+                    for i in proper_nouns:
+                        word_probs[i] = 0
+                
+                # every path goes through one of the best POS for the previous
+                # word, all of which have the same score, and picks the one with
+                # the highest P(Ci|Ck), the first on a tie
+                if len(last_max_indices) == 1:
+                    k = last_max_indices[0]
+                    score = column[k]
+                    scores_without_word_prob = [score * prob for prob in \
+                        transitions[k]]
+                    backpointers.append([k] * num_tags)
+                else:
+                    best_probs = [-1] * num_tags
+                    best_ks = [0] * num_tags
+                    for k in last_max_indices:
+                        row = transitions[k]
+                        for i in tag_range:
+                            if row[i] > best_probs[i]:
+                                best_probs[i] = row[i]
+                                best_ks[i] = k
+                    score = column[last_max_indices[0]]
+                    scores_without_word_prob = [score * prob for prob in \
+                        best_probs]
+                    backpointers.append(best_ks)
+                
+                prob_time += timer() - start_prob_time
+            
+            column = [scores_without_word_prob[i] * word_probs[i] for i in \
+                tag_range]
+            best = max(column)
+            
+            # if all the scores are zero, we've never seen this word in training
+            if best == 0:
+                unknown_count += 1
+                (column, guessed) = self._unseen_column(word, \
+                    scores_without_word_prob)
+                if guessed:
+                    guess_count += 1
+                best = max(column)
+            
+            # pass on the POS indices which scored best for this word
+            if column.count(best) == 1:
+                last_max_indices = [column.index(best)]
+            else:
+                last_max_indices = [i for i in tag_range if column[i] == best]
+        # end: for word in words
+        
+        # recover the POS tag indices that led to the best final score, following
+        # the backpointers from the last word, or from where we went greedy
+        pos_tag_indices = [0] * len(words)
+        last = len(words) - 1
+        if greedy_tail is not None:
+            last -= len(greedy_tail)
+            pos_tag_indices[last + 1:] = greedy_tail
+            index = last_max_indices[0]
+        elif words:
+            index = column.index(max(column))
+        for j in range(last, -1, -1):
+            pos_tag_indices[j] = index
+            index = backpointers[j][index]
+        
+        all_pos_tags = self.all_pos_tags
+        tagged_sent = [(words[j], all_pos_tags[pos_tag_indices[j]]) for j in \
+            range(len(words))]
+        
+        # turn coarse tags back into Penn Treebank tags, if we're refining
+        if self.refiner is not None:
+            tagged_sent = self.refiner.refine(tagged_sent)
+        
+        other_time = time.time() - start_time - prob_time
+        
+        return (tagged_sent, prob_time, other_time, guess_count, unknown_count)
+        
+    def tag_sent_greedy(self, words):
+        """
+        Tag a sentence left to right, picking the best POS for each word given
+        the one picked before it, and return a tuple like tag_sent() does. Only
+        the POS tags a word was seen with are scored, so this is faster than
+        Viterbi, and differs from it only where it would have kept more than one
+        equally good path
+        
+        :param words: a list of untagged words
+        """
+        
+        start_time = time.time()
+        
+        # (re)build our tables if we haven't yet, or tags have been added
+        if self.tables is None or self.tables[0] != len(self.all_pos_tags):
+            self._build_tables()
+        
+        (pos_tag_indices, prob_time, guess_count, unknown_count) = \
+            self._greedy_path(words)
+        
+        all_pos_tags = self.all_pos_tags
+        tagged_sent = [(words[j], all_pos_tags[pos_tag_indices[j]]) for j in \
+            range(len(words))]
+        
+        # turn coarse tags back into Penn Treebank tags, if we're refining
+        if self.refiner is not None:
+            tagged_sent = self.refiner.refine(tagged_sent)
+        
+        other_time = time.time() - start_time - prob_time
+        
+        return (tagged_sent, prob_time, other_time, guess_count, unknown_count)
+        
+    def tag_sent_reference(self, words):
         """
-        Tag a sentence using the Viterbi algorithm
+        Tag a sentence using the Viterbi algorithm, straightforwardly filling in a
+        whole matrix of scores. tag_sent() gives the same tags faster; this is
+        kept to check it against and benchmark it with
         
         :param words: a list of untagged words
         """
@@ -134,12 +396,15 @@ class HMM:
         # give P(Ci+1|Ci)   a shorthand name
         cpp2p1 = lambda pos2,pos1: self.pos2_given_pos1[pos1].freq(pos2)
         
+        # give our word shape lookup a shorthand name
+        shape = self.shapes.shape
+        
         # loop through words
         for j in words_range:
             word_j = words[j] # store current word in a local variable
             
             # determine whether word begins with a capital letter
-            is_upper = re.search(r'[A-Z]', word_j[0]) is not None
+            is_upper = (shape(word_j) & Shape.upper) != 0
             
             # initialize an array to hold the scores for this word not taking into
             # account the word probability, i.e., including only the path and
@@ -199,8 +464,7 @@ class HMM:
                     else:
                         # if Wj is lowercase, we know first of all that it can't be
                         # a proper noun, so remove these from the running
-                        if tag_i in [self.guesser.tags.proper_noun, \
-                            self.guesser.tags.pl_proper_noun]:
+                        if tag_i in self.guesser.tags.proper_nouns:
                             cpwp_ji = 0
                             
                         # otherwise, lookup the probability from the lowercase
@@ -234,27 +498,37 @@ class HMM:
                 # in training
                 unknown_count += 1
                 
-                # try to guess a tag for this word based on its form and the bare
-                # POS scores (i.e., guess based on form and then based on the
-                # previous POS)
-                guess_tag = self.guesser.guess(word_j, scores_without_word_prob)
-                
-                # if we didn't come up with a guess, make sure our smoother doesn't
-                # weight any POS over any other
-                if guess_tag == None:
-                    guess_index=False
-                    
-                # otherwise, tell our smoother that we have a guess so that it
-                # weights the guessed POS highest
-                else:
-                    # determine the index of the guessed POS tag
-                    guess_index = self.all_pos_tags.index(guess_tag)
+                # if we have a suffix trie, score every POS by the path so far and
+                # by how likely words ending like this one are to have that POS
+                if self.guesser.suffixes is not None:
+                    scores = self._suffix_values(scores, j, word_j, \
+                        scores_without_word_prob)
                     did_guess = True
                     guess_count += 1
                     
-                # get a smoothed column of scores for scores[j]
-                scores = self._smooth_values(scores, j_value=j, \
-                    guess_index=guess_index)
+                # otherwise, try to guess a tag for this word based on its form and
+                # the bare POS scores (i.e., guess based on form and then based on
+                # the previous POS)
+                else:
+                    guess_tag = self.guesser.guess(word_j, \
+                        scores_without_word_prob)
+                    
+                    # if we didn't come up with a guess, make sure our smoother
+                    # doesn't weight any POS over any other
+                    if guess_tag == None:
+                        guess_index=False
+                        
+                    # otherwise, tell our smoother that we have a guess so that it
+                    # weights the guessed POS highest
+                    else:
+                        # determine the index of the guessed POS tag
+                        guess_index = self.all_pos_tags.index(guess_tag)
+                        did_guess = True
+                        guess_count += 1
+                        
+                    # get a smoothed column of scores for scores[j]
+                    scores = self._smooth_values(scores, j_value=j, \
+                        guess_index=guess_index)
 
             # record whether or not we guessed the POS for this word
             guessed_pos[j] = did_guess
@@ -301,6 +575,241 @@ class HMM:
     
     
     ######### `PRIVATE' FUNCTIONS #########
+    
+    def _reset_stats(self):
+        """
+        Reset the running statistics kept while tagging
+        """
+        
+        self.total_prob_time = 0 # time spent looking up probabilities
+        self.total_other_time = 0 # time spent doing other things
+        self.total_guess_count = 0 # words we used the guesser to guess POS for
+        self.total_word_count = 0 # num words tagged
+        self.total_unknown_count = 0 # num words with no P(Wi|Ci)
+        self.total_degraded_count = 0 # sentences we ran out of time on
+        self.total_degraded_word_count = 0 # words we tagged greedily for them
+        
+    def _build_tables(self):
+        """
+        Work out the flat tables tag_sent() decodes with, as self.tables: a tuple
+        like (number of POS tags, dict of POS tag -> index, list of P(Ci|start),
+        list of rows of P(Ci|Ck) for each k, function returning P(Wi|Ck) for every
+        k for lowercase words, and one for words in original capitalization, list
+        of indices of proper noun tags, function returning a list of (k,
+        P(Wi|Ck)) tuples for just the POS tags a lowercase word was seen with,
+        and one for words in original capitalization)
+        """
+        
+        tags = list(self.all_pos_tags)
+        tag_range = range(len(tags))
+        
+        # the first of any repeated tag wins, as with list.index()
+        tag_indices = {}
+        for i in tag_range:
+            tag_indices.setdefault(tags[i], i)
+        
+        start_row = self.pos2_given_pos1[self.start_tag]
+        start_probs = [start_row.freq(tag) for tag in tags]
+        transitions = []
+        for k in tag_range:
+            row = self.pos2_given_pos1[tags[k]]
+            transitions.append([row.freq(tag) for tag in tags])
+        
+        lower_probs = self._emission_column(self.words_given_pos, tags)
+        upper_probs = self._emission_column(self.words_given_pos_upper, tags)
+        proper_nouns = [i for i in tag_range if tags[i] in \
+            self.guesser.tags.proper_nouns]
+        
+        lower_entries = self._emission_entries(self.words_given_pos, tags)
+        upper_entries = self._emission_entries(self.words_given_pos_upper, tags)
+        
+        self.tables = (len(tags), tag_indices, start_probs, transitions, \
+            lower_probs, upper_probs, proper_nouns, lower_entries, upper_entries)
+        
+    def _emission_column(self, table, tags):
+        """
+        Return a function which looks up P(word|Ck) for every POS tag k at once,
+        as a list
+        
+        :param table: nltk.ConditionalFreqDist, or a model's packed table, for
+            P(Wi|Ck)
+        :param tags: list of POS tags
+        """
+        
+        # ask a ConditionalFreqDist about each tag in turn
+        if not hasattr(table, 'lookup'):
+            freqs = [table[tag].freq for tag in tags]
+            return lambda word: [freq(word) for freq in freqs]
+        
+        # but a packed table gives us every tag a word was seen with in one
+        # lookup, keyed by the model's tag ids
+        lookup = table.lookup
+        num_tags = len(tags)
+        indices = {} # model tag id -> list of our indices for it
+        for i in range(num_tags):
+            tag_id = table[tags[i]].tag_id
+            if tag_id is not None:
+                indices.setdefault(tag_id, []).append(i)
+        
+        def column(word):
+            probs = [0] * num_tags
+            for (tag_id, prob) in lookup(word).iteritems():
+                for i in indices.get(tag_id, ()):
+                    probs[i] = prob
+            return probs
+        
+        return column
+        
+    def _emission_entries(self, table, tags):
+        """
+        Return a function which looks up P(word|Ck) for just the POS tags k a word
+        was seen with, as a list of (k, probability) tuples in order of k
+        
+        :param table: nltk.ConditionalFreqDist, or a model's packed table, for
+            P(Wi|Ck)
+        :param tags: list of POS tags
+        """
+        
+        # a ConditionalFreqDist still has to be asked about each tag in turn
+        if not hasattr(table, 'lookup'):
+            column = self._emission_column(table, tags)
+            return lambda word: [(i, prob) for (i, prob) in \
+                enumerate(column(word)) if prob]
+        
+        lookup = table.lookup
+        indices = {} # model tag id -> list of our indices for it
+        for i in range(len(tags)):
+            tag_id = table[tags[i]].tag_id
+            if tag_id is not None:
+                indices.setdefault(tag_id, []).append(i)
+        
+        def entries(word):
+            found = []
+            for (tag_id, prob) in lookup(word).iteritems():
+                for i in indices.get(tag_id, ()):
+                    found.append((i, prob))
+            found.sort()
+            return found
+        
+        return entries
+        
+    def _greedy_path(self, words, k=None, score=1):
+        """
+        Tag words greedily, and return a tuple like (list of POS indices,
+        probability lookup time, number of words guessed, number of unseen
+        words). The tables must already be built
+        
+        :param words: a list of untagged words
+        :param k: POS index of the word before them (default: None, if they start
+            the sentence)
+        :param score: score of the path up to and including k (default: 1)
+        """
+        
+        (num_tags, tag_indices, start_probs, transitions, lower_probs, \
+            upper_probs, proper_nouns, lower_entries, upper_entries) = self.tables
+        
+        shape = self.shapes.shape
+        upper = Shape.upper
+        timer = time.time
+        prob_time = 0
+        guess_count = 0
+        unknown_count = 0
+        pos_tag_indices = []
+        
+        for word in words:
+            start_prob_time = timer()
+            
+            # the first word is looked up in lowercase, after the start tag, and
+            # later lowercase words can't be proper nouns
+            if k is None:
+                entries = lower_entries(word.lower())
+                row = start_probs
+            elif shape(word) & upper:
+                entries = upper_entries(word)
+                row = transitions[k]
+            else:
+                entries = [entry for entry in lower_entries(word) if entry[0] \
+                    not in proper_nouns]
+                row = transitions[k]
+            
+            prob_time += timer() - start_prob_time
+            
+            # take the best POS, the first on a tie
+            best = 0
+            for (i, prob) in entries:
+                value = score * row[i] * prob
+                if value > best:
+                    best = value
+                    k = i
+            
+            # if all the scores are zero, we've never seen this word in training
+            if best == 0:
+                unknown_count += 1
+                (column, guessed) = self._unseen_column(word, [score * prob for \
+                    prob in row])
+                if guessed:
+                    guess_count += 1
+                best = max(column)
+                k = column.index(best)
+            
+            pos_tag_indices.append(k)
+            score = best
+        
+        return (pos_tag_indices, prob_time, guess_count, unknown_count)
+        
+    def _unseen_column(self, word, scores_without_word_prob):
+        """
+        Return a tuple like (column of scores, whether we guessed) for a word we
+        never saw in training. The tables must already be built
+        
+        :param word: string word
+        :param scores_without_word_prob: list of scores for each POS from the path
+            so far, not taking the word into account
+        """
+        
+        # score every POS by how likely words ending like this one are to have
+        # it, if we have a suffix trie
+        if self.guesser.suffixes is not None:
+            return (self._suffix_column(word, scores_without_word_prob), True)
+        
+        # otherwise, guess a tag by the word's form and the bare POS scores, as
+        # _smooth_values() would weight it
+        num_tags = len(scores_without_word_prob)
+        column = [0] * num_tags
+        guess_tag = self.guesser.guess(word, scores_without_word_prob)
+        if guess_tag is None:
+            guess_index = 0
+        else:
+            guess_index = self.tables[1][guess_tag]
+        column[guess_index] = 0.75 if guess_index == num_tags - 1 else \
+            (1 - 0.75) / num_tags
+        
+        return (column, guess_tag is not None)
+        
+    def _suffix_column(self, word, scores_without_word_prob):
+        """
+        Return a column of scores for an unseen word from the bare POS scores
+        weighted by the suffix trie's distribution for the word, as
+        _suffix_values() would fill it in
+        
+        :param word: string word
+        :param scores_without_word_prob: list of scores for each POS from the path
+            so far, not taking the word into account
+        """
+        
+        dist = self.guesser.distribution(word)
+        column = [scores_without_word_prob[i] * dist[i] for i in \
+            range(len(dist))]
+        
+        # if the path so far has underflowed to zero, start again from the word
+        if max(column) == 0:
+            column = dist
+        
+        # and if even that is no help, split the probability evenly
+        if max(column) == 0:
+            column = [1 / len(dist) for i in range(len(dist))]
+        
+        return column
         
     def _smoothing_needed(self, matrix, j_value):
         """
@@ -312,6 +821,35 @@ class HMM:
         """
         return max([matrix[i][j_value] for i in range(len(matrix))]) == 0
         
+    def _suffix_values(self, matrix, j_value, word, scores_without_word_prob):
+        """
+        Fill a column of a matrix for an unseen word with the bare POS scores
+        weighted by the suffix trie's distribution for the word
+        
+        :param matrix: list of lists of numbers
+        :param j_value: matrix column
+        :param word: string word
+        :param scores_without_word_prob: list of scores for each POS from the path
+            so far, not taking the word into account
+        """
+        
+        row_range = range(len(matrix)) # range for looping through rows
+        dist = self.guesser.distribution(word)
+        column = [scores_without_word_prob[i] * dist[i] for i in row_range]
+        
+        # if the path so far has underflowed to zero, start again from the word
+        if max(column) == 0:
+            column = dist
+        
+        # and if even that is no help, split the probability evenly
+        if max(column) == 0:
+            return self._smooth_values(matrix, j_value=j_value)
+        
+        for i in row_range:
+            matrix[i][j_value] = column[i]
+        
+        return matrix
+        
     def _smooth_values(self, matrix, j_value=0, guess_index=-1):
         """
         Ensure that a column of a matrix is not full of zeroes.
@@ -2,45 +2,50 @@
 
 from __future__ import division # use floating-point division
 import sys # for logging to stderr
+import time # for timing progress
 
-def progress_bar(complete, total, elapsed_time=0):
+def progress_bar(complete, total, elapsed_time=0, extra=''):
     """
     Output a progress bar to the screen.
 
     :param complete: int number of items completed
     :param total: int total number of items
     :param elapsed_time: elapsed time to show, default 0
+    :param extra: string of additional stats to show after the bar, default ''
     """
 
-    bar_width = 50 # how wide should our progress bar be?
-    pct_complete = complete / total
-
-    # get how many ticks we need to print for pct_complete
-    ticks = int(bar_width * pct_complete)
+    msg("\r" + bar(complete, total, elapsed_time, extra))
 
-    # get how many spaces to fill out rest of bar with
-    spaces = bar_width - ticks
+def bar(complete, total, elapsed_time=0, extra=''):
+    """
+    Return a progress bar as a string, without moving to a new line
 
-    output = "\r["
+    :param complete: int number of items completed
+    :param total: int total number of items
+    :param elapsed_time: elapsed time to show, default 0
+    :param extra: string of additional stats to show after the bar, default ''
+    """
 
-    # print each tick, but turn last tick into arrowhead
-    for i in range(ticks):
-        if i == ticks-1 and pct_complete < 1:
-            output += ">"
-        else:
-            output += "="
+    bar_width = 50 # how wide should our progress bar be?
+    pct_complete = complete / total if total else 1
 
-    # print spaces
-    for i in range(spaces):
-        output += " "
+    # get how many ticks we need to print for pct_complete, turning the last
+    # tick into an arrowhead until we're done
+    ticks = int(bar_width * pct_complete)
+    if ticks and pct_complete < 1:
+        output = "[" + "=" * (ticks - 1) + ">"
+    else:
+        output = "[" + "=" * ticks
 
-    # print stats
+    # fill out the rest of the bar with spaces, and add stats
+    output += " " * (bar_width - ticks)
     output += "] %0.2f%% (%d / %d)" % (pct_complete*100, complete, total)
     if elapsed_time > 0:
         output += " %0.2fs" % elapsed_time
+    if extra:
+        output += " " + extra
 
-    # write to screen
-    msg(output)
+    return output
 
 def indices_of_max(array):
     """
@@ -49,14 +54,10 @@ def indices_of_max(array):
     :param array: list to search
     """
 
-    indices = [] # intialize index list
-
-    # for each item in array, append index if it has max value
-    for i in range(len(array)):
-        if array[i]==max(array):
-            indices.append(i)
+    max_value = max(array) # find the highest value once
 
-    return indices
+    # return the index of each item which has it
+    return [i for i in range(len(array)) if array[i] == max_value]
 
 def msg(text):
     """
@@ -66,3 +67,90 @@ def msg(text):
     """
 
     sys.stderr.write(text)
+
+
+class Progress:
+    """
+    A class for reporting progress through a number of items at most a few times
+    a second, with the throughput and the time left. On a terminal it redraws a
+    progress bar; otherwise, e.g. when stderr goes to a log file, it writes a
+    plain line every so often
+    """
+
+    def __init__(self, total, max_rate=4, log_interval=10, interactive=None):
+        """
+        Construct a Progress object, and start timing
+
+        :param total: int total number of items
+        :param max_rate: most times a second to redraw the bar (default: 4)
+        :param log_interval: seconds between lines when not on a terminal
+            (default: 10)
+        :param interactive: whether to draw a bar (default: whether stderr is a
+            terminal)
+        """
+
+        if interactive is None:
+            interactive = sys.stderr.isatty()
+
+        self.total = total
+        self.interactive = interactive
+        self.interval = 1 / max_rate if interactive else log_interval
+        self.start_time = time.time()
+        self.last_time = None # when we last reported
+        self.reported = None # how many items were complete then
+
+    ######### `PUBLIC' FUNCTIONS #########
+
+    def update(self, complete, extra=''):
+        """
+        Report how many items are complete, if it is time to
+
+        :param complete: int number of items completed
+        :param extra: string of additional stats to show, default ''
+        """
+
+        now = time.time()
+        if self.last_time is None or now - self.last_time >= self.interval:
+            self._report(complete, now, extra)
+
+    def finish(self, complete, extra=''):
+        """
+        Report the final number of items complete, and end the line
+
+        :param complete: int number of items completed
+        :param extra: string of additional stats to show, default ''
+        """
+
+        if complete != self.reported or self.interactive:
+            self._report(complete, time.time(), extra)
+        if self.interactive:
+            msg("\n")
+
+    ######### `PRIVATE' FUNCTIONS #########
+
+    def _report(self, complete, now, extra):
+        """
+        Write out the progress
+
+        :param complete: int number of items completed
+        :param now: current time
+        :param extra: string of additional stats to show
+        """
+
+        self.last_time = now
+        self.reported = complete
+
+        # work out the throughput, and the time left at that rate
+        elapsed_time = now - self.start_time
+        rate = complete / elapsed_time if elapsed_time > 0 else 0
+        stats = "%0.1f/s" % rate
+        if complete < self.total and rate > 0:
+            stats += " eta %0.1fs" % ((self.total - complete) / rate)
+        if extra:
+            stats += " " + extra
+
+        if self.interactive:
+            progress_bar(complete, self.total, elapsed_time, stats)
+        else:
+            msg("%0.2f%% (%d / %d) %0.2fs %s\n" % (complete / self.total * 100 \
+                if self.total else 100, complete, self.total, elapsed_time, stats))
@@ -0,0 +1,105 @@
+######### Metrics.py #########
+
+import json # for the JSON lines format
+import time # for timestamping records
+import os # for replacing the Prometheus textfile atomically
+
+# prefix of every Prometheus metric name
+metric_prefix = 'hmm_tagger_'
+
+class Metrics:
+    """
+    A class for recording machine-readable metrics of runs of test cycles, one
+    record per fold and one for the whole run. Records are either appended to a
+    file as JSON lines, or kept as gauges in a Prometheus textfile which is
+    rewritten after each record, for a node exporter to scrape
+    """
+
+    def __init__(self, path, format='json', run_id=None):
+        """
+        Construct a Metrics object
+
+        :param path: string path of the file to write
+        :param format: 'json' or 'prometheus' (default: 'json')
+        :param run_id: string to label this run's records with (default: the
+            time and process id)
+        """
+
+        if format not in ['json', 'prometheus']:
+            raise Exception("Unknown metrics format %s!" % format)
+
+        self.path = path
+        self.format = format
+        self.run_id = run_id if run_id is not None else \
+            "%d-%d" % (time.time(), os.getpid())
+
+        # latest value of each Prometheus gauge, as (name, labels) -> value
+        self.gauges = {}
+
+    ######### `PUBLIC' FUNCTIONS #########
+
+    def fold(self, fold, fields):
+        """
+        Record the metrics of one test cycle
+
+        :param fold: int number of the test cycle
+        :param fields: dict of metric name -> number
+        """
+
+        self._record('fold', fields, fold)
+
+    def run(self, fields):
+        """
+        Record the metrics of a whole run of test cycles
+
+        :param fields: dict of metric name -> number
+        """
+
+        self._record('run', fields)
+
+    ######### `PRIVATE' FUNCTIONS #########
+
+    def _record(self, kind, fields, fold=None):
+        """
+        Write out a record
+
+        :param kind: 'fold' or 'run'
+        :param fields: dict of metric name -> number
+        :param fold: int number of the test cycle, for fold records
+        """
+
+        if self.format == 'json':
+            record = {'kind': kind, 'run': self.run_id, 'time': time.time()}
+            if fold is not None:
+                record['fold'] = fold
+            record.update(fields)
+            f = open(self.path, 'a')
+            f.write(json.dumps(record, sort_keys=True) + "\n")
+            f.close()
+            return
+
+        labels = 'run="%s"' % self.run_id
+        if fold is not None:
+            labels += ',fold="%d"' % fold
+        for (name, value) in fields.iteritems():
+            self.gauges[("%s%s_%s" % (metric_prefix, kind, name), labels)] = value
+        self._write_textfile()
+
+    def _write_textfile(self):
+        "Rewrite the Prometheus textfile with the latest value of every gauge"
+
+        lines = []
+        last_name = None
+        for ((name, labels), value) in sorted(self.gauges.items()):
+            if name != last_name:
+                lines.append("# TYPE %s gauge" % name)
+                last_name = name
+            lines.append("%s{%s} %r" % (name, labels, float(value)))
+
+        # write a new file and move it into place, so a scrape never sees half
+        # of one
+        temp_path = "%s.%d.tmp" % (self.path, os.getpid())
+        f = open(temp_path, 'w')
+        f.write("\n".join(lines) + "\n")
+        f.close()
+        os.rename(temp_path, self.path)
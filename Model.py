@@ -0,0 +1,680 @@
+######### Model.py #########
+
+from __future__ import division # use floating point division
+from array import array # for packing tables
+import struct # for reading tables in place
+import mmap # for sharing a model file between processes
+import json # for the model header
+import math # for quantizing probabilities as logs
+import os # for publishing model files atomically
+import heapq # for merging the words of both emission tables
+import threading # for loading new models in the background
+from itertools import groupby # for merging the words of both emission tables
+from Vocabulary import Vocabulary, pack_vocabulary, encode # for the vocabulary
+from Suffixes import PackedSuffixTrie, pack_suffixes # for unseen words
+
+# marks the start of a model file
+magic = 'HMMMODEL'
+
+# version of the model file layout
+version = 3
+
+# size of the step between quantized log-probabilities, in nats. A quantized
+# model stores each log P as a whole number of steps in an int16, which covers P
+# down to about 6e-15 to within 0.05%
+log_prob_step = 0.001
+
+# quantized log-probability which stands for P = 0
+zero_log_prob = -32768
+
+# name of the link to the latest snapshot in a directory of model snapshots
+current_link = 'current'
+
+# sentences tagged with a freshly loaded model before it is swapped in, to fill
+# its caches of word shapes and suffix statistics
+warm_sents = [['The', 'company', 'said', 'it', 'expects', 'higher', 'sales', '.'],
+    ['Mr.', 'Smith', ',', '52', 'years', 'old', ',', 'was', 'named', 'chairman',
+    'of', 'Acme', 'Corp.', 'yesterday', '.'],
+    ['``', 'We', "'re", 'not', 'going', 'to', 'sell', ',', "''", 'she', 'said',
+    'quietly', '.']]
+
+def write_model(path, pos_tags, start_tag, words_given_pos, words_given_pos_upper,
+    pos2_given_pos1, suffixes=None, quantize=False, tagset='penn'):
+    """
+    Compile trained frequency distributions into flat tables and write them to a
+    model file. The file is written under a temporary name and renamed into
+    place, so processes never see a half-written model.
+
+    :param path: string path to write the model to, e.g. in /dev/shm to keep it
+        in shared memory
+    :param pos_tags: list of possible POS tags
+    :param start_tag: start tag used to mark sentence beginning
+    :param words_given_pos: nltk.ConditionalFreqDist for P(Wi|Ck) with all words
+        converted to lowercase
+    :param words_given_pos_upper: nltk.ConditionalFreqDist for P(Wi|Ck) with
+        words left in original capitalization
+    :param pos2_given_pos1: nltk.ConditionalFreqDist for P(Ci+1|Ci)
+    :param suffixes: SuffixTrie for unseen words, built over pos_tags (default:
+        None)
+    :param quantize: whether to store probabilities as int16 quantized
+        log-probabilities rather than float64s. They take a quarter of the
+        space, but the vocabulary and suffix trie don't shrink, so the model is
+        about a fifth to a third smaller (default: False)
+    :param tagset: name of the tag set pos_tags belong to, in
+        UniversalTags.tag_sets (default: 'penn')
+    """
+
+    tag_ids = dict((pos_tags[i], i) for i in range(len(pos_tags)))
+
+    # pack one vocabulary for both emission tables, with the (tag, prob) entries
+    # for each word stored one after the other (a list of (name, packed string)
+    # tuples)
+    sections = _pack_emissions(_cfd_entries(words_given_pos, tag_ids), \
+        _cfd_entries(words_given_pos_upper, tag_ids), quantize)
+
+    sections.append(_pack_transitions(pos_tags, tag_ids, pos2_given_pos1, \
+        quantize))
+    if suffixes is not None:
+        sections += pack_suffixes(suffixes)
+    _write_sections(path, pos_tags, start_tag, sections, quantize, tagset)
+
+def write_model_from_counts(path, pos_tags, start_tag, lower_counts, upper_counts,
+    tag_totals, pos2_given_pos1, suffixes=None, quantize=False, tagset='penn'):
+    """
+    Compile streams of word counts into a model file, without ever holding the
+    counts in memory all at once. Gives the same model as write_model() would for
+    the same counts
+
+    :param path: string path to write the model to
+    :param pos_tags: list of possible POS tags
+    :param start_tag: start tag used to mark sentence beginning
+    :param lower_counts: iterable of (word, list of (tag, count) tuples) for words
+        converted to lowercase, sorted by utf-8 word
+    :param upper_counts: the same, for words left in original capitalization
+    :param tag_totals: dict of tag -> number of words seen with it
+    :param pos2_given_pos1: nltk.ConditionalFreqDist for P(Ci+1|Ci)
+    :param suffixes: SuffixTrie for unseen words, which is packed after the
+        counts have streamed past, so it may be filled from them (default: None)
+    :param quantize: whether to store quantized log-probabilities (default: False)
+    :param tagset: name of the tag set pos_tags belong to (default: 'penn')
+    """
+
+    tag_ids = dict((pos_tags[i], i) for i in range(len(pos_tags)))
+
+    # turn the counts for each word into (tag id, prob) entries as they stream by
+    (lower_entries, upper_entries) = [((encode(word), sorted([(tag_ids[pos], \
+        count / tag_totals[pos]) for (pos, count) in tag_counts if pos in \
+        tag_ids])) for (word, tag_counts) in counts) for counts in \
+        (lower_counts, upper_counts)]
+    sections = _pack_emissions(lower_entries, upper_entries, quantize)
+
+    sections.append(_pack_transitions(pos_tags, tag_ids, pos2_given_pos1, \
+        quantize))
+    if suffixes is not None:
+        sections += pack_suffixes(suffixes)
+    _write_sections(path, pos_tags, start_tag, sections, quantize, tagset)
+
+def _pack_transitions(pos_tags, tag_ids, pos2_given_pos1, quantize=False):
+    """
+    Return a (section name, packed string) tuple for the transition table
+
+    :param pos_tags: list of the model's POS tags
+    :param tag_ids: dict of tag -> index in pos_tags
+    :param pos2_given_pos1: nltk.ConditionalFreqDist for P(Ci+1|Ci)
+    :param quantize: whether to store quantized log-probabilities (default: False)
+    """
+
+    # pack the transition table as a dense matrix of P(Ci+1|Ci)
+    num_tags = len(pos_tags)
+    if quantize:
+        transitions = array('h', [zero_log_prob]) * (num_tags * num_tags)
+    else:
+        transitions = array('d', [0]) * (num_tags * num_tags)
+    for pos1 in pos2_given_pos1.conditions():
+        if pos1 not in tag_ids:
+            continue
+        for pos2 in pos2_given_pos1[pos1].keys():
+            if pos2 in tag_ids:
+                prob = pos2_given_pos1[pos1].freq(pos2)
+                transitions[tag_ids[pos1] * num_tags + tag_ids[pos2]] = \
+                    _quantize(prob) if quantize else prob
+
+    return ('transitions', transitions.tostring())
+
+def _write_sections(path, pos_tags, start_tag, sections, quantize=False,
+    tagset='penn'):
+    """
+    Write packed sections to a model file under a temporary name, and rename it
+    into place
+
+    :param path: string path to write the model to
+    :param pos_tags: list of the model's POS tags
+    :param start_tag: start tag used to mark sentence beginning
+    :param sections: list of (section name, packed string) tuples
+    :param quantize: whether the sections hold quantized log-probabilities
+        (default: False)
+    :param tagset: name of the tag set pos_tags belong to (default: 'penn')
+    """
+
+    # lay the sections out one after the other, aligned to 8 bytes, and describe
+    # them in a header
+    offset = 0
+    layout = {}
+    for (name, data) in sections:
+        layout[name] = (offset, len(data))
+        offset += len(data) + (-len(data) % 8)
+    header = json.dumps({'version': version, 'start_tag': start_tag,
+        'pos_tags': pos_tags, 'sections': layout,
+        'log_prob_step': log_prob_step if quantize else None, 'tagset': tagset})
+    header += ' ' * (-(len(magic) + 4 + len(header)) % 8)
+
+    tmp_path = "%s.tmp%d" % (path, os.getpid())
+    f = open(tmp_path, 'wb')
+    f.write(magic + struct.pack('<I', len(header)) + header)
+    for (name, data) in sections:
+        f.write(data + '\0' * (-len(data) % 8))
+    f.close()
+    os.rename(tmp_path, path)
+
+def publish_model(directory, keep, *tables):
+    """
+    Write a new, numbered snapshot of a model into a directory, then atomically
+    point the directory's `current' link at it. Processes which already loaded an
+    older snapshot keep tagging with it undisturbed. Return the new version number
+
+    :param directory: string path of the snapshot directory
+    :param keep: number of snapshots to keep around, including the new one
+    :param tables: the same arguments write_model() takes after path
+    """
+
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    # the new snapshot gets the next version number
+    versions = snapshot_versions(directory)
+    new_version = (versions[-1] + 1) if versions else 1
+    snapshot = 'model-v%06d' % new_version
+    write_model(os.path.join(directory, snapshot), *tables)
+
+    # swap the link over by renaming a new link on top of the old one
+    tmp_link = os.path.join(directory, '%s.tmp%d' % (current_link, os.getpid()))
+    os.symlink(snapshot, tmp_link)
+    os.rename(tmp_link, os.path.join(directory, current_link))
+
+    # remove snapshots we don't need to keep. Anyone with one of them loaded
+    # keeps their mapping of it
+    for old_version in versions[:max(len(versions) + 1 - keep, 0)]:
+        os.remove(os.path.join(directory, 'model-v%06d' % old_version))
+
+    return new_version
+
+def snapshot_versions(directory):
+    """
+    Return a sorted list of the snapshot version numbers in a directory
+
+    :param directory: string path of the snapshot directory
+    """
+
+    return sorted([int(name[len('model-v'):]) for name in os.listdir(directory) \
+        if name.startswith('model-v') and name[len('model-v'):].isdigit()])
+
+def load_model(path):
+    """
+    Attach to a model file read-only, and return a Model object for it. The file
+    is memory-mapped rather than read, so every process which loads the same file
+    shares one copy of it
+
+    :param path: string path of a model file written by write_model(), or of a
+        directory of snapshots written by publish_model() to load the current
+        snapshot of
+    """
+
+    f = open(resolve_model(path), 'rb')
+    buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    f.close()
+
+    return Model(buf)
+
+def resolve_model(path):
+    """
+    Return the real path of the model file load_model() would load for a path
+
+    :param path: string path of a model file, or of a directory of snapshots
+    """
+
+    if os.path.isdir(path):
+        path = os.path.join(path, current_link)
+
+    return os.path.realpath(path)
+
+def _cfd_entries(cfd, tag_ids):
+    """
+    Return a list of (utf-8 word, list of (tag id, prob) tuples) for every word in
+    an emission table, sorted by word
+
+    :param cfd: nltk.ConditionalFreqDist for P(Wi|Ck)
+    :param tag_ids: dict of tag -> index in the model's tag list
+    """
+
+    # gather the (tag id, prob) entries for each word
+    entries = {}
+    for pos in cfd.conditions():
+        if pos not in tag_ids:
+            continue
+        for (word, count) in cfd[pos].iteritems():
+            entries.setdefault(encode(word), []).append((tag_ids[pos], \
+                cfd[pos].freq(word)))
+
+    return [(word, sorted(entries[word])) for word in sorted(entries.keys())]
+
+def _pack_emissions(lower_entries, upper_entries, quantize=False):
+    """
+    Return a list of (section name, packed string) tuples for a vocabulary of every
+    word in either emission table, and for the entries of each table by word id.
+    Only the tags a word was seen with get entries, so the tables stay sparse
+
+    :param lower_entries: iterable of (utf-8 word, list of (tag id, prob) tuples
+        sorted by tag id) for words converted to lowercase, sorted by word
+    :param upper_entries: the same, for words left in original capitalization
+    :param quantize: whether to store quantized log-probabilities (default: False)
+    """
+
+    words = [] # every word in either table, in sorted order
+    # (entry starts, entry tags, entry probs) arrays for each table
+    tables = [(array('I', [0]), array('B'), array('h' if quantize else 'd')) \
+        for i in range(2)]
+
+    # walk both tables' words together, so each word gets a single id
+    merged = heapq.merge(((word, 0, entries) for (word, entries) in \
+        lower_entries), ((word, 1, entries) for (word, entries) in upper_entries))
+    for (word, word_entries) in groupby(merged, lambda item: item[0]):
+        words.append(word)
+        for (word, table, entries) in word_entries:
+            (entry_starts, entry_tags, entry_probs) = tables[table]
+            for (tag_id, prob) in entries:
+                entry_tags.append(tag_id)
+                entry_probs.append(_quantize(prob) if quantize else prob)
+
+        # words missing from a table just get no entries in it
+        for (entry_starts, entry_tags, entry_probs) in tables:
+            entry_starts.append(len(entry_tags))
+
+    sections = pack_vocabulary(words)
+    for (name, (entry_starts, entry_tags, entry_probs)) in \
+        zip(['lower', 'upper'], tables):
+        sections += [(name + '_entry_starts', entry_starts.tostring()),
+            (name + '_entry_tags', entry_tags.tostring()),
+            (name + '_entry_probs', entry_probs.tostring())]
+
+    return sections
+
+def _quantize(prob):
+    """
+    Return a probability as a quantized log-probability
+
+    :param prob: probability from 0 to 1
+    """
+
+    if prob <= 0:
+        return zero_log_prob
+    return max(int(round(math.log(prob) / log_prob_step)), zero_log_prob + 1)
+
+
+class Model:
+    """
+    A class for tagging with a compiled model, read in place from a buffer (e.g. a
+    memory-mapped model file).
+
+    Its tables answer [pos].freq(word) like the nltk.ConditionalFreqDist objects
+    they were compiled from, so they can be handed straight to HMM and Guesser.
+    """
+
+    def __init__(self, buf):
+        """
+        Construct a Model object
+
+        :param buf: string or mmap holding a model written by write_model()
+        """
+
+        if buf[:len(magic)] != magic:
+            raise Exception("Not a model file!")
+
+        header_length = struct.unpack_from('<I', buf, len(magic))[0]
+        start = len(magic) + 4
+        header = json.loads(buf[start:start + header_length])
+        if header['version'] != version:
+            raise Exception("Unsupported model version %d!" % header['version'])
+
+        self.buf = buf
+        self.start_tag = header['start_tag']
+        self.pos_tags = header['pos_tags']
+        self.tagset = header.get('tagset', 'penn') # older models are all Penn
+
+        # step between quantized log-probabilities, or None if the tables hold
+        # plain probabilities
+        self.log_prob_step = header['log_prob_step']
+
+        # work out where each section starts in our buffer
+        base = start + header_length
+        sections = dict((name, (base + offset, length)) for \
+            (name, (offset, length)) in header['sections'].iteritems())
+
+        # one vocabulary of every word, shared by both emission tables
+        self.vocabulary = Vocabulary(buf, sections)
+        self.words_given_pos = _Emissions(buf, sections, 'lower', self.pos_tags, \
+            self.vocabulary, self.log_prob_step)
+        self.words_given_pos_upper = _Emissions(buf, sections, 'upper', \
+            self.pos_tags, self.vocabulary, self.log_prob_step)
+        self.pos2_given_pos1 = _Transitions(buf, sections['transitions'][0], \
+            self.pos_tags, self.log_prob_step)
+
+        # the suffix trie for unseen words, if the model was saved with one
+        self.suffixes = None
+        if 'suffix_params' in sections:
+            self.suffixes = PackedSuffixTrie(buf, sections)
+
+    ######### `PUBLIC' FUNCTIONS #########
+
+    def new_hmm(self, untagged_sents=None):
+        """
+        Return a new HMM object which tags using this model
+
+        :param untagged_sents: list of untagged sentences for HMM.tag() (default:
+            None, for tagging with HMM.tag_iter() or HMM.tag_sent())
+        """
+
+        from HMM import HMM # only needed when we tag
+        from UniversalTags import tag_sets # for the model's tag set
+
+        return HMM(untagged_sents, list(self.pos_tags), self.words_given_pos, \
+            self.words_given_pos_upper, self.pos2_given_pos1, self.start_tag, \
+            self.suffixes, tag_sets[self.tagset])
+
+    def warm_hmm(self, sents=None):
+        """
+        Return a new HMM object which tags using this model, after reading in
+        every page of the model and tagging a few sentences with it, so that the
+        first real sentences it tags aren't slowed by page faults or empty caches
+
+        :param sents: list of untagged sentences to tag (default: warm_sents)
+        """
+
+        # touch a byte of every page, to fault the whole mapping in
+        for offset in xrange(0, len(self.buf), mmap.PAGESIZE):
+            self.buf[offset]
+
+        hmm = self.new_hmm()
+        for sent in (sents if sents is not None else warm_sents):
+            hmm.tag_sent(sent)
+
+        return hmm
+
+
+class ModelHandle:
+    """
+    A class holding the HMM a long-running process tags with, which can load a
+    new model file in the background and swap it in without pausing tagging.
+
+    Callers take hmm() once per sentence or batch and tag with that, so work
+    already in flight finishes on the model it started on, while work started
+    after a swap gets the new one. The new model is loaded and warmed up on a
+    background thread, and the swap itself is a single assignment.
+    """
+
+    def __init__(self, path):
+        """
+        Construct a ModelHandle object, and load and warm up its first model
+
+        :param path: string path of a model file, or of a directory of snapshots
+            written by publish_model()
+        """
+
+        self.path = path
+        self.lock = threading.Lock() # held while a reload is in progress
+        self.reloads = 0
+
+        # a tuple like (HMM object, real path of its model file), replaced
+        # whole by each reload
+        self.loaded = self._load(path)
+
+    ######### `PUBLIC' FUNCTIONS #########
+
+    def hmm(self):
+        """
+        Return the HMM object to tag the next sentence or batch with
+        """
+
+        return self.loaded[0]
+
+    def model_file(self):
+        """
+        Return the real path of the model file we are tagging with
+        """
+
+        return self.loaded[1]
+
+    def reload(self, path=None, wait=False):
+        """
+        Load a model file on a background thread and swap it in once it is
+        warmed up, returning the thread. A reload which comes while another is
+        still loading waits for it to finish first
+
+        :param path: string path of a model file or snapshot directory, which
+            becomes our path (default: our path, e.g. to pick up the current
+            snapshot of a directory)
+        :param wait: whether to wait for the swap before returning (default:
+            False)
+        """
+
+        thread = threading.Thread(target=self.swap, args=(path,))
+        thread.daemon = True
+        thread.start()
+        if wait:
+            thread.join()
+
+        return thread
+
+    def swap(self, path=None):
+        """
+        Load, warm up and swap in a model file, on this thread. If the model
+        can't be loaded, the exception is raised and we keep the old one
+
+        :param path: string path of a model file or snapshot directory, which
+            becomes our path (default: our path)
+        """
+
+        with self.lock:
+            loaded = self._load(path if path is not None else self.path)
+
+            # swap in a single assignment. The old model stays mapped until the
+            # last sentence tagged with it is done
+            self.loaded = loaded
+            if path is not None:
+                self.path = path
+            self.reloads += 1
+
+    ######### `PRIVATE' FUNCTIONS #########
+
+    def _load(self, path):
+        """
+        Return a tuple like (warmed up HMM object, real path of the model file)
+        for a model file or snapshot directory
+
+        :param path: string path of a model file or snapshot directory
+        """
+
+        model_file = resolve_model(path)
+        return (load_model(model_file).warm_hmm(), model_file)
+
+
+class _Emissions:
+    "A class for looking up P(Wi|Ck) in a packed emission table"
+
+    def __init__(self, buf, sections, name, pos_tags, vocabulary,
+        log_prob_step=None):
+        """
+        Construct an _Emissions object
+
+        :param buf: buffer holding the model
+        :param sections: dict of section name -> (offset, length) in buf
+        :param name: string name of the table
+        :param pos_tags: list of the model's POS tags
+        :param vocabulary: Vocabulary object giving the ids the table is keyed by
+        :param log_prob_step: step between quantized log-probabilities, or None if
+            the table holds plain probabilities (default: None)
+        """
+
+        self.buf = buf
+        self.vocabulary = vocabulary
+        self.log_prob_step = log_prob_step
+        self.entry_starts_offset = sections[name + '_entry_starts'][0]
+        self.entry_tags_offset = sections[name + '_entry_tags'][0]
+        self.entry_probs_offset = sections[name + '_entry_probs'][0]
+
+        # HMM asks for the same word under every tag in turn, so remember the
+        # entries for the last word we looked up, as one (word, entries) tuple
+        # so threads sharing the table never see half of an update
+        self.last = (None, {})
+
+        # one row object per tag, to answer [pos].freq(word)
+        self.rows = dict((pos_tags[i], _EmissionRow(self, i)) for i in \
+            range(len(pos_tags)))
+        self.empty_row = _EmissionRow(self, None)
+
+    def __getitem__(self, pos):
+        """
+        Return the row of P(Wi|pos)
+
+        :param pos: POS tag
+        """
+
+        return self.rows.get(pos, self.empty_row)
+
+    def lookup(self, word):
+        """
+        Return a dict of tag id -> P(word|tag) for every tag word was seen with
+
+        :param word: string word
+        """
+
+        (last_word, last_entries) = self.last
+        if word == last_word:
+            return last_entries
+
+        entries = {}
+        word_id = self.vocabulary.word_id(word)
+        if word_id is not None:
+            (start, end) = struct.unpack_from('<2I', self.buf, \
+                self.entry_starts_offset + 4 * word_id)
+            count = end - start
+            tags = struct.unpack_from('<%dB' % count, self.buf, \
+                self.entry_tags_offset + start)
+            if self.log_prob_step is None:
+                probs = struct.unpack_from('<%dd' % count, self.buf, \
+                    self.entry_probs_offset + 8 * start)
+            else:
+                # only dequantize the entries of the word we were asked for
+                step = self.log_prob_step
+                probs = [math.exp(q * step) for q in struct.unpack_from(\
+                    '<%dh' % count, self.buf, self.entry_probs_offset + 2 * start)]
+            entries = dict(zip(tags, probs))
+
+        self.last = (word, entries)
+
+        return entries
+
+
+class _EmissionRow:
+    "A class for looking up P(Wi|Ck) for one tag Ck"
+
+    def __init__(self, table, tag_id):
+        """
+        Construct an _EmissionRow object
+
+        :param table: _Emissions object the row belongs to
+        :param tag_id: index of the row's tag, or None for an unknown tag
+        """
+
+        self.table = table
+        self.tag_id = tag_id
+
+    def freq(self, word):
+        """
+        Return P(word|tag)
+
+        :param word: string word
+        """
+
+        if self.tag_id is None:
+            return 0
+        return self.table.lookup(word).get(self.tag_id, 0)
+
+
+class _Transitions:
+    "A class for looking up P(Ci+1|Ci) in a packed transition matrix"
+
+    def __init__(self, buf, offset, pos_tags, log_prob_step=None):
+        """
+        Construct a _Transitions object
+
+        :param buf: buffer holding the model
+        :param offset: where the matrix starts in buf
+        :param pos_tags: list of the model's POS tags
+        :param log_prob_step: step between quantized log-probabilities, or None if
+            the matrix holds plain probabilities (default: None)
+        """
+
+        self.tag_ids = dict((pos_tags[i], i) for i in range(len(pos_tags)))
+        width = 8 if log_prob_step is None else 2
+        self.rows = dict((pos_tags[i], _TransitionRow(buf, offset + \
+            width * i * len(pos_tags), self.tag_ids, log_prob_step)) for i in \
+            range(len(pos_tags)))
+        self.empty_row = _TransitionRow(buf, None, self.tag_ids)
+
+    def __getitem__(self, pos1):
+        """
+        Return the row of P(Ci+1|pos1)
+
+        :param pos1: POS tag
+        """
+
+        return self.rows.get(pos1, self.empty_row)
+
+
+class _TransitionRow:
+    "A class for looking up P(Ci+1|Ci) for one tag Ci"
+
+    def __init__(self, buf, offset, tag_ids, log_prob_step=None):
+        """
+        Construct a _TransitionRow object
+
+        :param buf: buffer holding the model
+        :param offset: where the row starts in buf, or None for an unknown tag
+        :param tag_ids: dict of tag -> index in the model's tag list
+        :param log_prob_step: step between quantized log-probabilities, or None if
+            the row holds plain probabilities (default: None)
+        """
+
+        self.buf = buf
+        self.offset = offset
+        self.tag_ids = tag_ids
+        self.log_prob_step = log_prob_step
+
+    def freq(self, pos2):
+        """
+        Return P(pos2|tag)
+
+        :param pos2: POS tag
+        """
+
+        if self.offset is None or pos2 not in self.tag_ids:
+            return 0
+        if self.log_prob_step is None:
+            return struct.unpack_from('<d', self.buf, \
+                self.offset + 8 * self.tag_ids[pos2])[0]
+
+        q = struct.unpack_from('<h', self.buf, \
+            self.offset + 2 * self.tag_ids[pos2])[0]
+        if q == zero_log_prob:
+            return 0
+        return math.exp(q * self.log_prob_step)
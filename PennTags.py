@@ -5,6 +5,9 @@ class PennTags:
     
     ######### CLASS VARIABLES #########
 
+    name = 'penn' # what models and the command line call this tag set
+    from_penn = None # the corpus is already tagged with these tags
+    
     proper_noun = 'NNP'
     common_noun = 'NN'
     pl_proper_noun = 'NNPS'
@@ -23,4 +26,5 @@ class PennTags:
     unknown = 'UNK'
     default = 'NN'
     default_upper = 'NNP'
-    rare_tags = ['--','UNK'] # tags to add to POS list before testing
\ No newline at end of file
+    rare_tags = ['--','UNK'] # tags to add to POS list before testing
+    proper_nouns = [proper_noun, pl_proper_noun] # tags lowercase words can't have
\ No newline at end of file
@@ -0,0 +1,349 @@
+######### Pipeline.py #########
+
+from __future__ import division # use floating point division
+from Helper import msg # for logging
+from Model import load_model # for tagging with a model file
+from itertools import islice # for cutting items into batches
+import threading # for running the stages at once
+import Queue # for the bounded queues between stages
+import time # for timing the stages
+
+# the HMM object used by a worker process to decode batches. Each worker process
+# gets its own, set up once by _init_worker() on top of the shared model file
+worker_hmm = None
+
+def _init_worker(model_path, mode='viterbi', time_budget=None):
+    """
+    Set up a worker process to decode batches with a model
+
+    :param model_path: string path of a model file written by Tagger.save_model()
+    :param mode: 'viterbi' or 'greedy' (default: 'viterbi')
+    :param time_budget: most seconds to spend on a sentence with Viterbi
+        (default: None, for no limit)
+    """
+
+    global worker_hmm
+    worker_hmm = load_model(model_path).warm_hmm()
+    worker_hmm.set_decoding(mode, time_budget)
+
+def _ready(i):
+    """
+    Return True once a worker process is set up, to wait on a new pool with
+
+    :param i: int number of the task
+    """
+
+    return True
+
+def _decode(sents, hmm=None):
+    """
+    Tag a batch of sentences, and return a tuple like (list of tagged sentences,
+    decode time)
+
+    :param sents: list of untagged sentences
+    :param hmm: HMM object to tag with (default: the worker's)
+    """
+
+    hmm = hmm if hmm is not None else worker_hmm
+
+    start_time = time.time()
+    tagged_sents = [hmm.tag_sent(sent)[0] for sent in sents]
+
+    return (tagged_sents, time.time() - start_time)
+
+
+class _Stage:
+    "A class to hold the timings of one stage of a Pipeline run"
+
+    def __init__(self, name, workers=1):
+        """
+        Construct a _Stage object
+
+        :param name: string name of the stage
+        :param workers: number of threads or processes doing its work (default: 1)
+        """
+
+        self.name = name
+        self.workers = workers
+        self.busy = 0 # seconds spent working
+        self.starved = 0 # seconds spent waiting for the stage before
+        self.blocked = 0 # seconds spent waiting for room in the stage after
+        self.lock = threading.Lock()
+
+    def add(self, busy=0, starved=0, blocked=0):
+        """
+        Add to the stage's timings, from any of its threads
+
+        :param busy: seconds spent working (default: 0)
+        :param starved: seconds spent waiting for the stage before (default: 0)
+        :param blocked: seconds spent waiting for room in the stage after
+            (default: 0)
+        """
+
+        with self.lock:
+            self.busy += busy
+            self.starved += starved
+            self.blocked += blocked
+
+    def stats(self, seconds):
+        """
+        Return a dict of the stage's timings, with the share of its workers' time
+        it spent working
+
+        :param seconds: wall clock seconds the run took
+        """
+
+        return {'workers': self.workers, 'busy': self.busy,
+            'starved': self.starved, 'blocked': self.blocked,
+            'utilization': self.busy / max(seconds * self.workers, 1e-9)}
+
+
+class Pipeline:
+    """
+    A class for tagging a stream of sentences with reading, decoding and writing
+    running at once rather than one after the other. A reading thread pulls
+    sentences from an iterable, which is where files get read and tokenized or a
+    corpus parsed, and cuts them into batches. Decoding threads each send one
+    batch at a time to a pool of worker processes attached to a model file, and
+    the writing stage hands each sentence and its tags to a sink in order. The
+    queues between the stages hold a few batches at most, so a slow stage holds
+    back the ones before it instead of letting batches pile up in memory, and the
+    time each stage spends working or waiting shows which one limits throughput
+    """
+
+    def __init__(self, model_path=None, workers=2, batch_size=64, queue_size=4,
+        mode='viterbi', time_budget=None, hmm=None):
+        """
+        Construct a Pipeline object, and start its worker processes
+
+        :param model_path: string path of a model file written by
+            Tagger.save_model(). Workers attach to it rather than copying it
+            (default: None, to decode with hmm)
+        :param workers: number of worker processes to decode with. With 0,
+            batches are decoded in a thread of this process (default: 2)
+        :param batch_size: number of sentences to send to a worker at a time
+            (default: 64)
+        :param queue_size: most batches to hold between two stages (default: 4)
+        :param mode: 'viterbi' or 'greedy' (default: 'viterbi')
+        :param time_budget: most seconds to spend on a sentence with Viterbi
+            before finishing it greedily (default: None, for no limit)
+        :param hmm: HMM object to decode with when there are no workers
+            (default: None, for one on the model file)
+        """
+
+        if workers > 0 and model_path is None:
+            raise Exception("Worker processes need a model file to attach to!")
+
+        self.workers = workers
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+
+        # set up a pool of workers which each attach to the model, or an HMM to
+        # decode with in this process if we have no workers
+        self.pool = None
+        self.hmm = None
+        if workers > 0:
+            from multiprocessing import Pool # only needed with workers
+            self.pool = Pool(workers, _init_worker, (model_path, mode, \
+                time_budget))
+            self.pool.map(_ready, range(workers), 1)
+        else:
+            self.hmm = hmm if hmm is not None else \
+                load_model(model_path).warm_hmm()
+            self.hmm.set_decoding(mode, time_budget)
+
+    ######### `PUBLIC' FUNCTIONS #########
+
+    def run(self, items, sink, words=None):
+        """
+        Tag the sentences of a stream of items, handing each item and its tagged
+        sentence to sink in the order the items came in. Return a dict of stats
+        for the run, with the timings of each of its 'read', 'decode' and 'write'
+        stages and the 'bottleneck' which was busiest
+
+        :param items: iterable of items to tag, e.g. from Tokenizer.iter_files()
+        :param sink: function taking an item and its tagged sentence, as a list
+            of (word, tag) tuples
+        :param words: function returning the untagged sentence of an item
+            (default: None, for items which are untagged sentences)
+        """
+
+        in_queue = Queue.Queue(self.queue_size) # batches to decode
+        out_queue = Queue.Queue(self.queue_size) # decoded batches to write
+        num_threads = max(self.workers, 1)
+        stages = [_Stage('read'), _Stage('decode', num_threads), _Stage('write')]
+        errors = [] # exceptions raised in the threads
+
+        start_time = time.time()
+        threads = [threading.Thread(target=self._read, args=(items, in_queue, \
+            num_threads, stages[0], errors))]
+        for i in range(num_threads):
+            threads.append(threading.Thread(target=self._decode, args=(in_queue, \
+                out_queue, words, stages[1], errors)))
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        num_sents = self._write(out_queue, sink, num_threads, stages[2])
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+        seconds = time.time() - start_time
+
+        stats = {'sentences': num_sents, 'seconds': seconds,
+            'sents_per_sec': num_sents / max(seconds, 1e-9)}
+        for stage in stages:
+            stats[stage.name] = stage.stats(seconds)
+        stats['bottleneck'] = max(stages, key=lambda stage: \
+            stats[stage.name]['utilization']).name
+
+        return stats
+
+    def report(self, stats):
+        """
+        Write a table of how busy each stage of a run was
+
+        :param stats: dict returned by run()
+        """
+
+        msg("%7s %7s %7s %9s %9s %11s\n" % ('stage', 'workers', 'busy s', \
+            'starved s', 'blocked s', 'utilization'))
+        for name in ['read', 'decode', 'write']:
+            stage = stats[name]
+            msg("%7s %7d %7.2f %9.2f %9.2f %10.1f%%\n" % (name, \
+                stage['workers'], stage['busy'], stage['starved'], \
+                stage['blocked'], stage['utilization'] * 100))
+        msg("%d sentences in %0.2fs (%0.1f sentences/s), limited by %s\n" % \
+            (stats['sentences'], stats['seconds'], stats['sents_per_sec'], \
+            stats['bottleneck']))
+
+    def close(self):
+        """
+        Stop the worker processes
+        """
+
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+
+    ######### `PRIVATE' FUNCTIONS #########
+
+    def _read(self, items, in_queue, num_threads, stage, errors):
+        """
+        Cut items into batches and queue them for decoding, then queue one None
+        for each decoding thread to stop it. Runs in the reading thread
+
+        :param items: iterable of items to tag
+        :param in_queue: Queue.Queue of (batch number, list of items)
+        :param num_threads: number of decoding threads
+        :param stage: _Stage to time the work in
+        :param errors: list to add any exception raised to
+        """
+
+        timer = time.time
+        try:
+            items = iter(items)
+            number = 0
+            while True:
+                start_time = timer()
+                batch = list(islice(items, self.batch_size))
+                stage.add(busy=timer() - start_time)
+                if not batch:
+                    break
+
+                start_time = timer()
+                in_queue.put((number, batch))
+                stage.add(blocked=timer() - start_time)
+                number += 1
+        except Exception, e:
+            errors.append(e)
+        finally:
+            for i in range(num_threads):
+                in_queue.put(None)
+
+    def _decode(self, in_queue, out_queue, words, stage, errors):
+        """
+        Decode batches until a None comes off the queue, and pass it on. Runs in
+        each decoding thread
+
+        :param in_queue: Queue.Queue of (batch number, list of items)
+        :param out_queue: Queue.Queue of (batch number, list of items, list of
+            tagged sentences)
+        :param words: function returning the untagged sentence of an item, or
+            None
+        :param stage: _Stage to time the work in
+        :param errors: list to add any exception raised to
+        """
+
+        timer = time.time
+        while True:
+            start_time = timer()
+            job = in_queue.get()
+            stage.add(starved=timer() - start_time)
+            if job is None:
+                break
+
+            # after an error anywhere, we only drain the queue, so the reading
+            # thread never waits for room in it forever
+            if errors:
+                continue
+
+            try:
+                (number, batch) = job
+                sents = [words(item) for item in batch] if words is not None \
+                    else batch
+                if self.pool is not None:
+                    (tagged_sents, decode_time) = self.pool.apply(_decode, \
+                        (sents,))
+                else:
+                    (tagged_sents, decode_time) = _decode(sents, self.hmm)
+                stage.add(busy=decode_time)
+            except Exception, e:
+                errors.append(e)
+                continue
+
+            start_time = timer()
+            out_queue.put((number, batch, tagged_sents))
+            stage.add(blocked=timer() - start_time)
+
+        out_queue.put(None)
+
+    def _write(self, out_queue, sink, num_threads, stage):
+        """
+        Hand decoded batches to the sink in order until every decoding thread has
+        stopped, and return the number of sentences written. Runs in the calling
+        thread
+
+        :param out_queue: Queue.Queue of (batch number, list of items, list of
+            tagged sentences)
+        :param sink: function taking an item and its tagged sentence
+        :param num_threads: number of decoding threads
+        :param stage: _Stage to time the work in
+        """
+
+        timer = time.time
+        waiting = {} # batch number -> decoded batch which came in early
+        next_number = 0
+        num_sents = 0
+        stopped = 0
+        while stopped < num_threads:
+            start_time = timer()
+            result = out_queue.get()
+            stage.add(starved=timer() - start_time)
+            if result is None:
+                stopped += 1
+                continue
+
+            # batches decode in any order, but are written in the order read
+            waiting[result[0]] = result
+            start_time = timer()
+            while next_number in waiting:
+                (number, batch, tagged_sents) = waiting.pop(next_number)
+                for i in range(len(batch)):
+                    sink(batch[i], tagged_sents[i])
+                num_sents += len(batch)
+                next_number += 1
+            stage.add(busy=timer() - start_time)
+
+        return num_sents
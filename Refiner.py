@@ -0,0 +1,105 @@
+######### Refiner.py #########
+
+from UniversalTags import coarse_tag # for grouping fine tags by coarse tag
+
+class Refiner:
+    """
+    A class for turning the tags of a coarse tag set back into Penn Treebank tags
+    after decoding. Each word only chooses among the Penn tags of the coarse tag
+    it was given: the one it was seen with most often in training, or for an
+    unseen word the one the suffix trie scores highest. This costs a dict lookup
+    or two per word, rather than decoding over every Penn tag
+    """
+
+    def __init__(self, tags, pos_tags, words_given_pos, words_given_pos_upper,
+        suffixes):
+        """
+        Construct a Refiner object
+
+        :param tags: coarse tag set class, e.g. UniversalTags
+        :param pos_tags: list of Penn Treebank POS tags
+        :param words_given_pos: nltk.ConditionalFreqDist for P(Wi|Ck) over Penn
+            tags, with all words converted to lowercase
+        :param words_given_pos_upper: nltk.ConditionalFreqDist for P(Wi|Ck) over
+            Penn tags, with words left in original capitalization
+        :param suffixes: SuffixTrie built over pos_tags, for unseen words
+        """
+
+        self.tags = tags
+        self.pos_tags = pos_tags
+        self.suffixes = suffixes
+
+        # indices of the Penn tags making up each coarse tag
+        self.members = {}
+        for i in range(len(pos_tags)):
+            self.members.setdefault(coarse_tag(tags, pos_tags[i]), []).append(i)
+
+        # best Penn tag for each (word, coarse tag) seen in training
+        self.upper = self._lexicon(words_given_pos_upper)
+        self.lower = self._lexicon(words_given_pos)
+
+    ######### `PUBLIC' FUNCTIONS #########
+
+    def refine(self, tagged_sent):
+        """
+        Return a sentence tagged with coarse tags as a list of (word, Penn tag)
+        tuples
+
+        :param tagged_sent: list of (word, coarse tag) tuples
+        """
+
+        refined = []
+        for (word, tag) in tagged_sent:
+            fine_tag = self.upper.get((word, tag))
+            if fine_tag is None:
+                fine_tag = self.lower.get((word.lower(), tag))
+            if fine_tag is None:
+                fine_tag = self._guess(word, tag)
+            refined.append((word, fine_tag))
+
+        return refined
+
+    ######### `PRIVATE' FUNCTIONS #########
+
+    def _lexicon(self, cfd):
+        """
+        Return a dict of (word, coarse tag) -> the Penn tag the word was seen with
+        most often among those making up the coarse tag
+
+        :param cfd: nltk.ConditionalFreqDist for P(Wi|Ck) over Penn tags
+        """
+
+        best = {} # (word, coarse tag) -> (count, Penn tag)
+        conditions = set(cfd.conditions())
+        for fine_tag in self.pos_tags:
+            if fine_tag not in conditions:
+                continue
+            tag = coarse_tag(self.tags, fine_tag)
+            for (word, count) in cfd[fine_tag].iteritems():
+                key = (word, tag)
+                if count > best.get(key, (0, None))[0]:
+                    best[key] = (count, fine_tag)
+
+        return dict((key, fine_tag) for (key, (count, fine_tag)) in \
+            best.iteritems())
+
+    def _guess(self, word, tag):
+        """
+        Return the Penn tag of a coarse tag which the suffix trie scores highest
+        for an unseen word, the first on a tie
+
+        :param word: string word
+        :param tag: coarse tag it was given
+        """
+
+        members = self.members.get(tag)
+        if not members:
+            return tag
+
+        dist = self.suffixes.distribution(word)
+        best = members[0]
+        for i in members:
+            if dist[i] > dist[best]:
+                best = i
+
+        return self.pos_tags[best]
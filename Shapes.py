@@ -0,0 +1,91 @@
+######### Shapes.py #########
+
+class Shape:
+    """
+    A class to hold the bits of a word's shape signature, which sums up its form
+    (capitalization, digits, hyphens and common suffixes) in one small integer
+    """
+
+    ######### CLASS VARIABLES #########
+
+    upper = 1 # begins with a capital letter A-Z
+    number = 1 << 1 # contains a digit
+    hyphen = 1 << 2 # contains a hyphen
+    ends_s = 1 << 3
+    ends_es = 1 << 4
+    ends_ies = 1 << 5
+    ends_ed = 1 << 6
+    ends_ly = 1 << 7
+    ends_ing = 1 << 8
+    ends_er = 1 << 9
+    ends_ize = 1 << 10
+
+    # suffixes to check for, longest first, along with the bits they set
+    suffixes = [('ies', ends_ies | ends_es | ends_s), ('ing', ends_ing),
+        ('ize', ends_ize), ('es', ends_es | ends_s), ('ed', ends_ed),
+        ('ly', ends_ly), ('er', ends_er), ('s', ends_s)]
+
+digits = frozenset('0123456789') # characters which make a word a number
+
+def word_shape(word):
+    """
+    Return the shape signature of a word, worked out in a single pass without any
+    regular expressions
+
+    :param word: string word
+    """
+
+    shape = 0
+    if 'A' <= word[:1] <= 'Z':
+        shape |= Shape.upper
+    if not digits.isdisjoint(word):
+        shape |= Shape.number
+    if '-' in word:
+        shape |= Shape.hyphen
+
+    # only one suffix can match besides the ones implied by it, e.g. -ies
+    # implies -es and -s
+    for (suffix, bits) in Shape.suffixes:
+        if word.endswith(suffix):
+            shape |= bits
+            break
+
+    return shape
+
+
+class ShapeCache:
+    """
+    A class for looking up word shapes, remembering the shape of every word it has
+    seen so that each distinct word is only classified once. HMM and Guesser share
+    one cache
+    """
+
+    def __init__(self, max_size=1000000):
+        """
+        Construct a ShapeCache object
+
+        :param max_size: most words to remember; the cache starts over when it is
+            full, so serving arbitrary text can't grow it forever (default:
+            1000000)
+        """
+
+        self.max_size = max_size
+        self.shapes = {}
+
+    ######### `PUBLIC' FUNCTIONS #########
+
+    def shape(self, word):
+        """
+        Return the shape signature of a word
+
+        :param word: string word
+        """
+
+        shape = self.shapes.get(word)
+        if shape is None:
+            if len(self.shapes) >= self.max_size:
+                self.shapes = {}
+            shape = word_shape(word)
+            self.shapes[word] = shape
+
+        return shape
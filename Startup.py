@@ -0,0 +1,85 @@
+######### Startup.py #########
+
+import subprocess # for timing imports in a fresh interpreter
+import json # for reading back the timings
+import sys # for the interpreter to run
+import os # for finding our modules
+
+# modules a process needs to tag text with a model file. None of them may import
+# nltk or the corpus modules, which take most of a second to import
+tagging_modules = ['Model', 'HMM', 'Guesser', 'PennTags', 'UniversalTags',
+    'Tokenizer', 'Writers', 'TagServer', 'Pipeline']
+
+# modules which must stay out of a process that only tags
+training_modules = ['nltk', 'Treebank', 'Training', 'Tagger']
+
+# most seconds importing the tagging modules may take, and then loading a model
+# file and tagging a first sentence
+import_budget = 0.1
+load_budget = 0.05
+
+# program run in a fresh interpreter to time the tagging path
+timing_script = """
+import time, sys, json
+start = time.time()
+for name in %r:
+    __import__(name)
+imported = time.time()
+if %r is not None:
+    hmm = sys.modules['Model'].load_model(%r).new_hmm()
+    hmm.tag_sent(['The', 'tagger', 'is', 'ready', '.'])
+loaded = time.time()
+print json.dumps({'import_time': imported - start, 'load_time': loaded - imported,
+    'training_modules': [name for name in %r if name in sys.modules]})
+"""
+
+def measure_startup(model_path=None, runs=3):
+    """
+    Time importing the tagging modules in a fresh interpreter, and then loading a
+    model and tagging a sentence with it. Return a dict of the best 'import_time'
+    and 'load_time' over a number of runs, and the 'training_modules' which got
+    imported along the way
+
+    :param model_path: string path of a model file to load (default: None, to only
+        time the imports)
+    :param runs: number of interpreters to start (default: 3)
+    """
+
+    if model_path is not None:
+        model_path = os.path.abspath(model_path)
+    script = timing_script % (tagging_modules, model_path, model_path, \
+        training_modules)
+    module_dir = os.path.dirname(os.path.abspath(__file__))
+
+    timings = []
+    for i in range(runs):
+        output = subprocess.check_output([sys.executable, '-c', script], \
+            cwd=module_dir)
+        timings.append(json.loads(output))
+
+    return {'import_time': min([t['import_time'] for t in timings]),
+        'load_time': min([t['load_time'] for t in timings]),
+        'training_modules': timings[-1]['training_modules']}
+
+def check_startup(model_path=None):
+    """
+    Measure startup, and raise an exception if the tagging path imported any
+    training modules or went over its time budget. Return the timings
+
+    :param model_path: string path of a model file to load (default: None, to only
+        check the imports)
+    """
+
+    timings = measure_startup(model_path)
+
+    if timings['training_modules']:
+        raise Exception("Tagging imported %s!" % \
+            ', '.join(timings['training_modules']))
+    if timings['import_time'] > import_budget:
+        raise Exception("Importing took %0.3fs, over the %0.3fs budget!" % \
+            (timings['import_time'], import_budget))
+    if timings['load_time'] > load_budget:
+        raise Exception("Loading the model took %0.3fs, over the %0.3fs budget!" % \
+            (timings['load_time'], load_budget))
+
+    return timings
@@ -0,0 +1,301 @@
+######### Suffixes.py #########
+
+from __future__ import division # use floating point division
+from array import array # for packing the trie
+import bisect # for finding children in a packed trie
+import struct # for reading the trie in place
+import math # for the smoothing weight
+from Shapes import Shape, word_shape # for telling capitalized words apart
+
+def pack_suffixes(trie):
+    """
+    Pack a SuffixTrie into a list of (section name, packed string) tuples for a
+    model file. Nodes are numbered breadth first from the two roots, so the
+    children of every node are stored next to each other, sorted by letter
+
+    :param trie: SuffixTrie object
+    """
+
+    nodes = list(trie.roots)
+    chars = array('I', [0, 0]) # letter leading to each node
+    child_starts = array('I') # where each node's children start in nodes
+    count_starts = array('I', [0])
+    count_tags = array('B')
+    counts = array('I')
+
+    i = 0
+    while i < len(nodes):
+        (children, node_counts) = nodes[i]
+        child_starts.append(len(nodes))
+        for char in sorted(children.keys()):
+            chars.append(ord(char))
+            nodes.append(children[char])
+        for tag_id in sorted(node_counts.keys()):
+            count_tags.append(tag_id)
+            counts.append(node_counts[tag_id])
+        count_starts.append(len(count_tags))
+        i += 1
+    child_starts.append(len(nodes))
+
+    return [('suffix_params', array('I', [trie.max_length, \
+            trie.max_count]).tostring()),
+        ('suffix_tag_totals', array('I', trie.tag_totals).tostring()),
+        ('suffix_chars', chars.tostring()),
+        ('suffix_child_starts', child_starts.tostring()),
+        ('suffix_count_starts', count_starts.tostring()),
+        ('suffix_count_tags', count_tags.tostring()),
+        ('suffix_counts', counts.tostring())]
+
+def _is_upper(word):
+    """
+    Return whether a word begins with a capital letter
+
+    :param word: string word
+    """
+
+    return (word_shape(word) & Shape.upper) != 0
+
+
+class _Suffixes:
+    """
+    A base class for estimating P(word|tag) for unseen words from the tags of
+    rare training words ending in the same letters, for both the in-memory and
+    the packed trie. Subclasses provide tag_totals, max_length and _path_counts()
+    """
+
+    def distribution(self, word):
+        """
+        Return a list with a score for each POS tag, proportional to P(word|tag)
+        for an unseen word. P(tag|suffix) is estimated along the word's path in
+        the trie, from the shortest suffix to the longest, smoothing each step
+        with the step before as in Brants' TnT, then divided by P(tag)
+
+        :param word: string word
+        """
+
+        (tag_probs, theta) = self._tag_stats()
+        path = self._path_counts(word)
+
+        # start from the tags of all rare words with the same capitalization,
+        # or from the tags of every word if there weren't any
+        probs = self._node_probs(path[0]) or list(tag_probs)
+        for node_counts in path[1:]:
+            node_probs = self._node_probs(node_counts)
+            probs = [(node_probs[i] + theta * probs[i]) / (1 + theta) for i in \
+                range(len(probs))]
+
+        # turn P(tag|suffix) into something proportional to P(suffix|tag)
+        return [probs[i] / tag_probs[i] if tag_probs[i] > 0 else 0 for i in \
+            range(len(probs))]
+
+    ######### `PRIVATE' FUNCTIONS #########
+
+    def _tag_stats(self):
+        """
+        Return a tuple like (list of P(tag) for each tag, smoothing weight). The
+        weight is the standard deviation of the tag probabilities
+        """
+
+        if self.tag_stats is None:
+            total = sum(self.tag_totals)
+            tag_probs = [count / max(total, 1) for count in self.tag_totals]
+            seen = [prob for prob in tag_probs if prob > 0]
+            mean = sum(seen) / max(len(seen), 1)
+            theta = math.sqrt(sum([(prob - mean) ** 2 for prob in seen]) / \
+                max(len(seen) - 1, 1))
+            self.tag_stats = (tag_probs, theta)
+
+        return self.tag_stats
+
+    def _node_probs(self, node_counts):
+        """
+        Return a list of P(tag) at a node, or None if nothing was counted there
+
+        :param node_counts: dict of tag id -> count at the node
+        """
+
+        total = sum(node_counts.values())
+        if total == 0:
+            return None
+
+        probs = [0] * len(self.tag_totals)
+        for (tag_id, count) in node_counts.iteritems():
+            probs[tag_id] = count / total
+
+        return probs
+
+
+class SuffixTrie(_Suffixes):
+    """
+    A class for building a trie over the last letters of rare training words,
+    with the tags they were seen with counted at every node. Capitalized and
+    lowercase words get separate tries
+    """
+
+    def __init__(self, pos_tags, start_tag, max_length=5, max_count=10):
+        """
+        Construct a SuffixTrie object
+
+        :param pos_tags: list of possible POS tags
+        :param start_tag: start tag used to mark sentence beginning, which isn't
+            counted
+        :param max_length: longest suffix to count (default: 5)
+        :param max_count: most times a word may have been seen to count as rare
+            (default: 10)
+        """
+
+        self.pos_tags = list(pos_tags)
+        self.tag_ids = dict((pos_tags[i], i) for i in range(len(pos_tags)))
+        self.start_tag = start_tag
+        self.max_length = max_length
+        self.max_count = max_count
+
+        # number of words seen with each tag id, rare or not
+        self.tag_totals = [0] * len(pos_tags)
+        self.tag_stats = None
+
+        # a node is a list like [dict of letter -> child node, dict of tag id ->
+        # count], with one root for lowercase words and one for capitalized ones
+        self.roots = [[{}, {}], [{}, {}]]
+
+    ######### `PUBLIC' FUNCTIONS #########
+
+    def add_word(self, word, tag_counts):
+        """
+        Count the tags a word was seen with in training
+
+        :param word: string word, in original capitalization
+        :param tag_counts: list of (tag, count) tuples
+        """
+
+        tag_counts = [(self.tag_ids[pos], count) for (pos, count) in tag_counts \
+            if pos in self.tag_ids and pos != self.start_tag]
+        for (tag_id, count) in tag_counts:
+            self.tag_totals[tag_id] += count
+        self.tag_stats = None
+
+        # only rare words look like the words we'll never have seen
+        if sum([count for (tag_id, count) in tag_counts]) > self.max_count:
+            return
+
+        node = self.roots[_is_upper(word)]
+        self._count(node, tag_counts)
+        for char in reversed(word[-self.max_length:]):
+            node = node[0].setdefault(char, [{}, {}])
+            self._count(node, tag_counts)
+
+    def add_cfd(self, cfd):
+        """
+        Count the tags of every word in an emission table
+
+        :param cfd: nltk.ConditionalFreqDist for P(Wi|Ck) with words left in
+            original capitalization
+        """
+
+        words = {} # word -> list of (tag, count) tuples
+        for pos in cfd.conditions():
+            for (word, count) in cfd[pos].iteritems():
+                words.setdefault(word, []).append((pos, count))
+
+        for (word, tag_counts) in words.iteritems():
+            self.add_word(word, tag_counts)
+
+    ######### `PRIVATE' FUNCTIONS #########
+
+    def _count(self, node, tag_counts):
+        """
+        Add tag counts to a node
+
+        :param node: trie node
+        :param tag_counts: list of (tag id, count) tuples
+        """
+
+        node_counts = node[1]
+        for (tag_id, count) in tag_counts:
+            node_counts[tag_id] = node_counts.get(tag_id, 0) + count
+
+    def _path_counts(self, word):
+        """
+        Return the list of tag counts at each node from the root to the longest
+        suffix of a word in the trie
+
+        :param word: string word
+        """
+
+        node = self.roots[_is_upper(word)]
+        path = [node[1]]
+        for char in reversed(word[-self.max_length:]):
+            node = node[0].get(char)
+            if node is None:
+                break
+            path.append(node[1])
+
+        return path
+
+
+class PackedSuffixTrie(_Suffixes):
+    "A class for reading a trie packed by pack_suffixes() in place from a buffer"
+
+    def __init__(self, buf, sections):
+        """
+        Construct a PackedSuffixTrie object
+
+        :param buf: string or mmap holding the packed trie
+        :param sections: dict of section name -> (offset, length) in buf
+        """
+
+        self.buf = buf
+        (self.max_length, self.max_count) = struct.unpack_from('<2I', buf, \
+            sections['suffix_params'][0])
+        (offset, length) = sections['suffix_tag_totals']
+        self.tag_totals = list(struct.unpack_from('<%dI' % (length // 4), buf, \
+            offset))
+        self.tag_stats = None
+
+        self.chars_offset = sections['suffix_chars'][0]
+        self.child_starts_offset = sections['suffix_child_starts'][0]
+        self.count_starts_offset = sections['suffix_count_starts'][0]
+        self.count_tags_offset = sections['suffix_count_tags'][0]
+        self.counts_offset = sections['suffix_counts'][0]
+
+    ######### `PRIVATE' FUNCTIONS #########
+
+    def _node_counts(self, node):
+        """
+        Return a dict of tag id -> count at a node
+
+        :param node: index of the node
+        """
+
+        (start, end) = struct.unpack_from('<2I', self.buf, \
+            self.count_starts_offset + 4 * node)
+        tags = struct.unpack_from('<%dB' % (end - start), self.buf, \
+            self.count_tags_offset + start)
+        counts = struct.unpack_from('<%dI' % (end - start), self.buf, \
+            self.counts_offset + 4 * start)
+
+        return dict(zip(tags, counts))
+
+    def _path_counts(self, word):
+        """
+        Return the list of tag counts at each node from the root to the longest
+        suffix of a word in the trie
+
+        :param word: string word
+        """
+
+        node = int(_is_upper(word))
+        path = [self._node_counts(node)]
+        for char in reversed(word[-self.max_length:]):
+            # binary search the node's children for the next letter
+            (start, end) = struct.unpack_from('<2I', self.buf, \
+                self.child_starts_offset + 4 * node)
+            chars = struct.unpack_from('<%dI' % (end - start), self.buf, \
+                self.chars_offset + 4 * start)
+            i = bisect.bisect_left(chars, ord(char))
+            if i == len(chars) or chars[i] != ord(char):
+                break
+            node = start + i
+            path.append(self._node_counts(node))
+
+        return path
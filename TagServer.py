@@ -0,0 +1,540 @@
+######### TagServer.py #########
+
+from __future__ import division # use floating point division
+from Helper import msg # for logging
+from Model import load_model, resolve_model, ModelHandle # for model files
+import SocketServer # for serving requests over TCP and unix sockets
+import threading # for the batching thread and waiting on results
+import Queue # for collecting requests into batches
+import json # for reading requests and writing responses
+import time # for latency metrics
+import signal # for reloading the model on SIGHUP
+import socket # for checking for a live server on a unix socket
+import stat # for recognizing a stale unix socket
+import os # for removing unix sockets
+
+# the HMM object used by a worker process to decode batches. Each worker process
+# gets its own, set up once by _init_worker() on top of the shared model file
+worker_hmm = None
+
+def _init_worker(model_path):
+    """
+    Set up a worker process to decode batches with a model
+
+    :param model_path: string path of a model file written by Tagger.save_model()
+    """
+
+    global worker_hmm
+    worker_hmm = load_model(model_path).warm_hmm()
+
+def _ready(i):
+    """
+    Return True once a worker process is set up, to wait on a new pool with
+
+    :param i: int number of the task
+    """
+
+    return True
+
+def _tag_batch(sents, hmm=None, decoding=('viterbi', None), deadlines=None):
+    """
+    Tag a batch of sentences in a worker, and return a tuple like
+    (list of tagged sentences, decode time, list of error messages, list of
+    whether each sentence ran out of time and was finished greedily). A sentence
+    which fails to tag gets None and an error message, and None otherwise, so it
+    doesn't fail the rest of its batch
+
+    :param sents: list of untagged sentences
+    :param hmm: HMM object to tag with (default: the worker's)
+    :param decoding: tuple like (mode, time budget) for HMM.set_decoding()
+        (default: ('viterbi', None))
+    :param deadlines: list of the time.time() by which to stop using Viterbi on
+        each sentence, or None for no deadline (default: None)
+    """
+
+    # the whole batch is tagged with the same model
+    hmm = hmm if hmm is not None else worker_hmm
+    deadlines = deadlines if deadlines is not None else [None] * len(sents)
+
+    start_time = time.time()
+    try:
+        hmm.set_decoding(*decoding)
+    except Exception, e:
+        return ([None] * len(sents), time.time() - start_time, \
+            [str(e)] * len(sents), [False] * len(sents))
+
+    tagged_sents = []
+    errors = []
+    degraded = []
+    for i in range(len(sents)):
+        degraded_count = hmm.total_degraded_count
+        try:
+            tagged_sents.append(hmm.tag_sent(sents[i], deadlines[i])[0])
+            errors.append(None)
+        except Exception, e:
+            tagged_sents.append(None)
+            errors.append(str(e))
+        degraded.append(hmm.total_degraded_count > degraded_count)
+
+    return (tagged_sents, time.time() - start_time, errors, degraded)
+
+
+class _Request:
+    "A class to hold one sentence waiting to be tagged"
+
+    def __init__(self, words, budget=None):
+        """
+        Construct a _Request object
+
+        :param words: list of untagged words
+        :param budget: most seconds from now until it is tagged, after which
+            Viterbi gives way to greedy decoding (default: None, for no limit)
+        """
+
+        self.words = words
+        self.enqueue_time = time.time()
+        self.deadline = self.enqueue_time + budget if budget is not None else None
+        self.degraded = False
+        self.dispatch_time = None
+        self.batch_size = 0
+        self.decode_time = 0
+        self.tagged_sent = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class Batcher:
+    """
+    A class for collecting concurrent tagging requests into micro-batches and
+    decoding them on a pool of worker processes. The model can be swapped for a
+    new one with reload() while requests are being served
+    """
+
+    def __init__(self, model_path, max_batch_size=32, max_wait=0.005, workers=2,
+        mode='viterbi', time_budget=None):
+        """
+        Construct a Batcher object and start its batching thread
+
+        :param model_path: string path of a model file written by
+            Tagger.save_model(). Workers attach to it rather than copying it
+        :param max_batch_size: most sentences to decode in one batch (default: 32)
+        :param max_wait: most seconds to wait for a batch to fill up (default:
+            0.005)
+        :param workers: number of worker processes to decode with. With 0,
+            batches are decoded in the batching thread (default: 2)
+        :param mode: 'viterbi', or 'greedy' to decode faster and a little less
+            accurately (default: 'viterbi')
+        :param time_budget: most seconds to spend on a sentence with Viterbi
+            before finishing it greedily (default: None, for no limit)
+        """
+
+        if mode not in ['viterbi', 'greedy']:
+            raise Exception("Unknown decoding mode %s!" % mode)
+
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.queue = Queue.Queue()
+        self.model_path = model_path
+        self.model_file = resolve_model(model_path)
+        self.workers = workers
+        self.decoding = (mode, time_budget)
+
+        # set up a pool of workers which each attach to the model, or decode in
+        # this process if we have no workers
+        self.pool_lock = threading.Lock() # held while swapping or using the pool
+        self.reload_lock = threading.Lock() # held while a reload is in progress
+        if workers > 0:
+            self.pool = self._new_pool(self.model_file)
+        else:
+            self.pool = None
+            self.handle = ModelHandle(self.model_file)
+
+        # counters for reporting
+        self.lock = threading.Lock()
+        self.num_requests = 0
+        self.num_batches = 0
+        self.total_latency = 0
+        self.reloads = 0
+        self.degraded = 0
+
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    ######### `PUBLIC' FUNCTIONS #########
+
+    def tag(self, words, budget=None):
+        """
+        Queue a sentence for tagging, wait for its batch to be decoded, and return
+        the finished _Request
+
+        :param words: list of untagged words
+        :param budget: most seconds from now until it is tagged, after which
+            Viterbi gives way to greedy decoding (default: None, for no limit)
+        """
+
+        request = _Request(words, budget)
+        self.queue.put(request)
+        request.done.wait()
+
+        return request
+
+    def stats(self):
+        """
+        Return a dict of counters about the requests served so far
+        """
+
+        with self.lock:
+            num_requests = self.num_requests
+            num_batches = self.num_batches
+            total_latency = self.total_latency
+            model_file = self.model_file
+            reloads = self.reloads
+            degraded = self.degraded
+
+        return {'requests': num_requests, 'batches': num_batches,
+            'mean_batch_size': num_requests / max(num_batches, 1),
+            'mean_latency': total_latency / max(num_requests, 1),
+            'model': model_file, 'reloads': reloads, 'degraded': degraded,
+            'mode': self.decoding[0], 'time_budget': self.decoding[1]}
+
+    def reload(self, model_path=None):
+        """
+        Load a model file in the background, and swap it in for new batches once
+        it is warmed up, returning the loading thread. Batches already being
+        decoded finish with the old model
+
+        :param model_path: string path of a model file or snapshot directory,
+            which we serve from then on (default: the path we serve, e.g. to pick
+            up the current snapshot of a directory)
+        """
+
+        thread = threading.Thread(target=self._reload, args=(model_path,))
+        thread.daemon = True
+        thread.start()
+
+        return thread
+
+    def close(self):
+        """
+        Stop the batching thread and the worker processes
+        """
+
+        self.queue.put(None)
+        self.thread.join()
+        with self.reload_lock:
+            if self.pool is not None:
+                self.pool.close()
+                self.pool.join()
+
+    ######### `PRIVATE' FUNCTIONS #########
+
+    def _new_pool(self, model_file):
+        """
+        Return a new pool of worker processes attached to a model file, once its
+        workers are set up
+
+        :param model_file: string path of a model file
+        """
+
+        from multiprocessing import Pool # only needed with workers
+
+        pool = Pool(self.workers, _init_worker, (model_file,))
+        pool.map(_ready, range(self.workers), 1)
+
+        return pool
+
+    def _reload(self, model_path):
+        """
+        Load, warm up and swap in a model file
+
+        :param model_path: string path of a model file or snapshot directory, or
+            None for the path we serve
+        """
+
+        with self.reload_lock:
+            try:
+                model_file = resolve_model(model_path if model_path is not None \
+                    else self.model_path)
+                msg("Reloading model from %s\n" % model_file)
+
+                if self.pool is None:
+                    self.handle.swap(model_file)
+                else:
+                    # make sure the model loads before workers try to, then start
+                    # a new pool on it, switch new batches over to it, and let
+                    # the old pool finish its batches and exit
+                    load_model(model_file).new_hmm()
+                    pool = self._new_pool(model_file)
+                    with self.pool_lock:
+                        (old_pool, self.pool) = (self.pool, pool)
+                    old_pool.close()
+                    old_pool.join()
+            except Exception, e:
+                msg("Reload failed, still serving %s: %s\n" % (self.model_file, e))
+                return
+
+            if model_path is not None:
+                self.model_path = model_path
+            with self.lock:
+                self.model_file = model_file
+                self.reloads += 1
+            msg("Reloaded model from %s\n" % model_file)
+
+    def _run(self):
+        """
+        Collect requests into batches until we are closed
+        """
+
+        while True:
+            # wait for the first request of a batch
+            request = self.queue.get()
+            if request is None:
+                return
+            batch = [request]
+
+            # then wait at most max_wait for the batch to fill up
+            deadline = time.time() + self.max_wait
+            stopping = False
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    request = self.queue.get(timeout=remaining)
+                except Queue.Empty:
+                    break
+                if request is None:
+                    stopping = True
+                    break
+                batch.append(request)
+
+            self._dispatch(batch)
+            if stopping:
+                return
+
+    def _dispatch(self, batch):
+        """
+        Send a batch of requests to be decoded
+
+        :param batch: list of _Request objects
+        """
+
+        dispatch_time = time.time()
+        for request in batch:
+            request.dispatch_time = dispatch_time
+            request.batch_size = len(batch)
+
+        sents = [request.words for request in batch]
+        deadlines = [request.deadline for request in batch]
+        finish = lambda result: self._finish(batch, result)
+        if self.pool is not None:
+            with self.pool_lock:
+                self.pool.apply_async(_tag_batch, (sents, None, self.decoding, \
+                    deadlines), callback=finish)
+        else:
+            finish(_tag_batch(sents, self.handle.hmm(), self.decoding, deadlines))
+
+    def _finish(self, batch, result):
+        """
+        Hand decoded sentences back to the requests waiting for them
+
+        :param batch: list of _Request objects
+        :param result: tuple returned by _tag_batch()
+        """
+
+        (tagged_sents, decode_time, errors, degraded) = result
+        finish_time = time.time()
+
+        for i in range(len(batch)):
+            request = batch[i]
+            request.decode_time = decode_time
+            request.tagged_sent = tagged_sents[i]
+            request.error = errors[i]
+            request.degraded = degraded[i]
+            request.done.set()
+
+        with self.lock:
+            self.num_requests += len(batch)
+            self.num_batches += 1
+            self.total_latency += sum([finish_time - request.enqueue_time for \
+                request in batch])
+            self.degraded += degraded.count(True)
+
+
+class _Handler(SocketServer.StreamRequestHandler):
+    """
+    A class for handling one connection of line-delimited JSON requests.
+
+    Each line is an object like {"id": 1, "words": ["The", "dog", "barked", "."]}
+    and is answered with a line like {"id": 1, "tagged": [["The", "DT"], ...],
+    "latency": {...}, "batch_size": 4, "degraded": false}. A request may also
+    give a "budget" of seconds, after which its sentence is finished greedily
+    and "degraded" is true. A line like {"stats": true} is answered
+    with the server's counters, and one like {"reload": true} starts swapping in
+    the model file (or current snapshot of the directory) we were started with.
+    """
+
+    def handle(self):
+        """
+        Answer each request line on the connection in turn
+        """
+
+        for line in self.rfile:
+            line = line.strip()
+            if not line:
+                continue
+            self.wfile.write(json.dumps(self._answer(line)) + "\n")
+            self.wfile.flush()
+
+    def _answer(self, line):
+        """
+        Return a response dict for one request line
+
+        :param line: string JSON request
+        """
+
+        try:
+            request = json.loads(line)
+            if request.get('stats'):
+                return self.server.batcher.stats()
+            if request.get('reload'):
+                # clients may only have us pick up the model or snapshot we
+                # were started on, never open a file of their choosing
+                if request['reload'] is not True:
+                    return {'error': 'expected {"reload": true}, which ' \
+                        'reloads the model path the server was started with'}
+                self.server.batcher.reload()
+                return {'reloading': True}
+            words = request['words']
+            if not isinstance(words, list) or not all([isinstance(word, \
+                basestring) for word in words]):
+                raise TypeError("words must be a list of strings")
+            budget = request.get('budget')
+            if budget is not None:
+                budget = float(budget)
+        except (ValueError, TypeError, KeyError, AttributeError):
+            return {'error': 'expected an object like {"words": [...]}'}
+
+        done = self.server.batcher.tag(words, budget)
+        response = {'id': request.get('id'), 'batch_size': done.batch_size,
+            'latency': {'queue': done.dispatch_time - done.enqueue_time,
+                'decode': done.decode_time,
+                'total': time.time() - done.enqueue_time},
+            'degraded': done.degraded}
+        if done.error is None:
+            response['tagged'] = done.tagged_sent
+        else:
+            response['error'] = done.error
+
+        return response
+
+
+class TagServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    "A class for serving a trained tagger over TCP"
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, batcher):
+        """
+        Construct a TagServer object
+
+        :param address: tuple like (host, port) to listen on
+        :param batcher: Batcher object to tag requests with
+        """
+
+        self.batcher = batcher
+        SocketServer.TCPServer.__init__(self, address, _Handler)
+
+
+class UnixTagServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    "A class for serving a trained tagger over a unix socket"
+
+    daemon_threads = True
+
+    def __init__(self, path, batcher):
+        """
+        Construct a UnixTagServer object. A socket left behind at path by a
+        server which is no longer running is removed first
+
+        :param path: string path of the socket to listen on
+        :param batcher: Batcher object to tag requests with
+        """
+
+        self.batcher = batcher
+        self._remove_stale(path)
+        SocketServer.UnixStreamServer.__init__(self, path, _Handler)
+
+    def server_close(self):
+        """
+        Stop listening, and remove the socket
+        """
+
+        SocketServer.UnixStreamServer.server_close(self)
+        try:
+            os.unlink(self.server_address)
+        except OSError:
+            pass
+
+    def _remove_stale(self, path):
+        """
+        Remove a socket at path which nothing is listening on any more, leaving
+        anything else there for binding to fail on
+
+        :param path: string path of the socket
+        """
+
+        try:
+            if not stat.S_ISSOCK(os.stat(path).st_mode):
+                return
+        except OSError:
+            return
+
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+        except socket.error:
+            os.unlink(path)
+        else:
+            raise Exception("Another server is listening on %s!" % path)
+        finally:
+            probe.close()
+
+
+def serve(model_path, address, max_batch_size=32, max_wait=0.005, workers=2,
+    mode='viterbi', time_budget=None):
+    """
+    Serve tagging requests until interrupted
+
+    :param model_path: string path of a model file to tag with
+    :param address: tuple like (host, port), or string path of a unix socket
+    :param max_batch_size: most sentences to decode in one batch (default: 32)
+    :param max_wait: most seconds to wait for a batch to fill up (default: 0.005)
+    :param workers: number of worker processes to decode with (default: 2)
+    :param mode: 'viterbi' or 'greedy' (default: 'viterbi')
+    :param time_budget: most seconds to spend on a sentence with Viterbi
+        before finishing it greedily (default: None, for no limit)
+    """
+
+    batcher = Batcher(model_path, max_batch_size, max_wait, workers, mode, \
+        time_budget)
+
+    if isinstance(address, tuple):
+        server = TagServer(address, batcher)
+    else:
+        server = UnixTagServer(address, batcher)
+
+    # reload the model whenever we get a SIGHUP, e.g. after publishing a new
+    # snapshot to the directory we serve
+    if hasattr(signal, 'SIGHUP'):
+        signal.signal(signal.SIGHUP, lambda signum, frame: batcher.reload())
+
+    msg("Serving on %s\n" % (address,))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        batcher.close()
@@ -1,11 +1,24 @@
 ######### Tagger.py #########
 
 from __future__ import division # use floating point division
-from nltk import ConditionalFreqDist # for frequency distributions
-from Helper import msg # for logging
+from Helper import msg, Progress # for logging
 from HMM import HMM # our Hidden Markov Model class
 from Treebank import Treebank # our corpus class
+from Corpus import SentView # for sharing compact corpora with workers
 from PennTags import PennTags # our tag list
+from UniversalTags import coarse_tag, coarse_sent # for coarser tag sets
+from Refiner import Refiner # for refining coarse tags into Penn tags
+from Evaluation import Evaluation # for accumulating accuracy data
+from Suffixes import SuffixTrie # for guessing the tags of unseen words
+from Writers import penn_line # for showing tagged sentences
+from Training import split, split_files, count_parallel, count_shard, \
+    count_files, merge_counts, count_to_runs, merge_runs # for counting data
+from Training import share_corpus, count_ranges # for counting compact corpora
+from Training import coarsen_counts # for training on coarser tag sets
+from Training import prune_counts, prune_stream # for compacting models
+from Training import copy_counts # for updating without disturbing readers
+from Training import read_tagged_sents # for streaming the corpus from disk
+from itertools import izip, tee # for building the testing pipeline
 import time # for timing various processes
 
 class Tagger:
@@ -24,16 +37,44 @@ class Tagger:
     # x-fold cross-validation
     test_cycles = 10
     
-    def __init__(self, corpus_path, corpus_files):
+    # amounts of training data for the scaling benchmark, as percentages of the
+    # corpus before its testing sentences. Past 100, the training sentences are
+    # used more than once
+    benchmark_sizes = [12.5, 25, 50, 100, 200]
+    
+    # version of the way we train and tag and of what a checkpoint holds, part
+    # of the key of every checkpointed test cycle. Bump it to stop reusing old
+    # checkpoints after changing any of them
+    checkpoint_version = 2
+    
+    # decoding modes run_test_cycles() can compare with plain Viterbi, as tuples
+    # like (name, mode for HMM.set_decoding(), most seconds per sentence)
+    decoding_modes = [('greedy', 'greedy', None), ('budget', 'viterbi', 0.0005)]
+    
+    # fewest times a word must have been seen to keep its P(Wi|Ck), for each
+    # model the pruning benchmark compares. 1 keeps every word
+    prune_thresholds = [1, 2, 3, 5, 10]
+    
+    # copies of the corpus check_out_of_core() trains on, and how many times the
+    # peak memory of training on the fewest copies training on the most may take
+    out_of_core_copies = [1, 2, 4]
+    out_of_core_memory_slack = 1.25
+    
+    def __init__(self, corpus_path, corpus_files, compact=False, tags=PennTags):
         """
         Construct a Tagger object
         
         :param corpus_path: path to corpus files
         :param corpus_files: list of corpus files
+        :param compact: whether to hold the corpus in memory as a CompactCorpus
+            (default: False)
+        :param tags: tag set class to train and tag with, e.g. UniversalTags to
+            map the corpus's Penn Treebank tags to coarser ones (default:
+            PennTags)
         """
         
         # object for working with corpus data
-        self.tb = Treebank(corpus_path, corpus_files) 
+        self.tb = Treebank(corpus_path, corpus_files, compact) 
         
         # will contain a list of tags in training corpus
         self.pos_tags = False 
@@ -41,34 +82,81 @@ class Tagger:
         # will be object for running the Hidden Markov Model for tagging
         self.hmm = False
         
-        # use PennTags
-        self.tags = PennTags
+        # use PennTags, or a coarser tag set
+        self.tags = tags
+        
+        # will hold a Refiner back into Penn tags, if we train on a coarser set
+        self.refiner = None
         
         # will hold conditional frequency distribution for P(Wi|Ck)
         self.words_given_pos = False
         
         # will hold conditional frequency distribution for P(Ci+1|Ci) 
         self.pos2_given_pos1 = False
+        
+        # will hold a trie of the tags of rare words by suffix, for unseen words
+        self.suffixes = None
+        
+        # will hold accuracy data for the current set of test cycles
+        self.evaluation = False
     
     
     ######### `PUBLIC' FUNCTIONS #########
     
-    def run_test_cycles(self):
+    def run_test_cycles(self, quantize=False, metrics=None, checkpoint_dir=None,
+        modes=None, refine=False):
         """
         Run the test cycles for training and testing the tagger.
         Specifically, employ ten-fold cross-validation to train/test on different
         segments of the corpus.
+        
+        :param quantize: whether to also test a quantized model compiled from each
+            cycle's training, to report the accuracy it costs (default: False)
+        :param metrics: Metrics object to record the throughput, unseen and guess
+            rates, phase timings and accuracy of each cycle and of the whole run
+            in (default: None)
+        :param checkpoint_dir: string path of a directory to save each finished
+            cycle's results in. Cycles already saved there for the same corpus,
+            range and configuration are replayed from disk rather than trained
+            and tested again (default: None)
+        :param modes: list of tuples like Tagger.decoding_modes, to also test
+            each cycle's training with, to report the accuracy each mode costs
+            and how often a time budget ran out (default: None)
+        :param refine: whether to also test refining the coarse tags we decode
+            back into Penn Treebank tags, scored against the Penn gold standard,
+            if we train on a coarser tag set (default: False)
         """
         
         total_time_start = time.time() # keep track of time
         pct_step = int(100 / Tagger.test_cycles) # cycle steps in pct
         test_pct = pct_step # percentage of the corpus to test the tagger on
         train_pct = 100 - test_pct # percentage of the corpus to train the tagger on
-        rights = [] # array to hold number of correctly-tagged words for each test
-        wrongs = [] # array to hold number of incorrectly-tagged words for each test
-        totals = [] # array to hold number of total words for each test
-        all_missed = [] # array to hold incorrect tag information for each test
         sep = ''.join(["-" for i in range(50)]) + "\n" # logging separator
+        modes = modes if modes is not None else []
+        
+        if refine and self.tags.from_penn is None:
+            raise Exception("Only a tagger trained on a coarser tag set can " \
+                "refine its tags!")
+        
+        # object to hold accuracy data and mistakes for every test cycle
+        self.evaluation = Evaluation()
+        
+        # and one for each other way of tagging the same sentences we compare
+        # with it: quantized models, other decoding modes and refined tags
+        compared = [name for (name, enabled) in [('quantized', quantize)] + \
+            [(mode[0], True) for mode in modes] + [('refined', refine)] if \
+            enabled]
+        evaluations = dict((name, Evaluation()) for name in compared)
+        
+        # totals over every cycle, for the run's metrics, and the metrics of the
+        # comparisons in each cycle
+        run_totals = {'sentences': 0, 'words': 0, 'unknown': 0, 'guessed': 0, \
+            'train_seconds': 0, 'test_seconds': 0}
+        cycle_metrics = []
+        
+        # what every checkpointed cycle depends on besides its range
+        if checkpoint_dir is not None:
+            checkpoint_config = self._checkpoint_config(quantize, modes, refine)
         
         # loop from 0-90 (step size 10)
         for start_train_pct in [x*pct_step for x in range(Tagger.test_cycles)]:
@@ -79,102 +167,804 @@ class Tagger:
             # may be > 100, so circle round
             start_test_pct = (start_train_pct+train_pct) % 100
             
-            # train the tagger on sentences from the corpus matching our range
-            training_sents = self.tb.training_sents(train_pct,start_train_pct)
-            self.train(training_sents)
+            num_sents = self.tb.num_testing_sents(test_pct, start_test_pct)
+            fold = self.evaluation.start_fold(test_pct, start_test_pct)
+            folds = dict((name, evaluation.start_fold(test_pct, start_test_pct)) \
+                for (name, evaluation) in evaluations.iteritems())
+            
+            # replay this cycle if an earlier run checkpointed it
+            checkpoint = None
+            saved = None
+            if checkpoint_dir is not None:
+                checkpoint = self._checkpoint_path(checkpoint_dir, \
+                    checkpoint_config, train_pct, start_train_pct, test_pct, \
+                    start_test_pct)
+                saved = self._load_checkpoint(checkpoint)
             
-            # test the tagger on the rest of the sentences
-            testing_sents = self.tb.testing_sents(test_pct,start_test_pct)
-            (right, wrong, missed) = self.test(testing_sents)
+            if saved is not None:
+                msg("Replaying test cycle from %s\n" % checkpoint)
+                (right, wrong) = self._replay_fold(saved['mistakes'], test_pct, \
+                    start_test_pct, fold, self.evaluation)
+                for name in compared:
+                    self._replay_fold(saved['compared_mistakes'][name], test_pct, \
+                        start_test_pct, folds[name], evaluations[name], \
+                        name != 'refined')
+                fold_metrics = saved['metrics']
+                compared_metrics = saved['compared_metrics']
+            
+            else:
+                # train the tagger on sentences from the corpus matching our range
+                phase_start = time.time()
+                training_sents = self.tb.training_sents(train_pct,start_train_pct)
+                self.train(training_sents)
+                train_seconds = time.time() - phase_start
+                
+                # test the tagger on the rest of the sentences, pulling them from
+                # the corpus one at a time
+                msg("Streaming testing sentences: %d%% starting at %d%%\n" % \
+                    (test_pct, start_test_pct))
+                phase_start = time.time()
+                (right, wrong) = self.test_stream(\
+                    self._testing_pairs(test_pct, start_test_pct), num_sents, fold)
+                test_seconds = time.time() - phase_start
+                
+                fold_metrics = {'sentences': num_sents, 'words': right + wrong, \
+                    'unknown': self.hmm.total_unknown_count, \
+                    'guessed': self.hmm.total_guess_count, \
+                    'train_seconds': train_seconds, 'test_seconds': test_seconds}
+                
+                # test the same training on the same sentences each other way
+                compared_metrics = {}
+                if quantize:
+                    compared_metrics.update(self._test_quantized(test_pct, \
+                        start_test_pct, num_sents, folds['quantized'], \
+                        evaluations['quantized']))
+                for mode in modes:
+                    compared_metrics.update(self._test_mode(mode, test_pct, \
+                        start_test_pct, num_sents, folds[mode[0]], \
+                        evaluations[mode[0]]))
+                if refine:
+                    compared_metrics.update(self._test_refined(test_pct, \
+                        start_test_pct, num_sents, folds['refined'], \
+                        evaluations['refined']))
+                
+                if checkpoint is not None:
+                    self._save_checkpoint(checkpoint, {'config': checkpoint_config,
+                        'metrics': fold_metrics,
+                        'mistakes': self._fold_mistakes(self.evaluation, fold),
+                        'compared_metrics': compared_metrics,
+                        'compared_mistakes': dict((name, self._fold_mistakes(\
+                            evaluations[name], folds[name])) for name in compared)})
             
             # gather accuracy statistics for this test
-            total = right + wrong
-            rights.append(right) # store the correct count for this test cycle
-            wrongs.append(wrong) # store the incorrect count for this test cycle
-            totals.append(total) # store the total words tested for this test cycle
-            all_missed += missed # add incorrect tag information from this cycle
-            
-            msg("Total words: %d\n" % total)
-            msg("Correct tags: %d (%0.2f%%)\n" % (right, right / total * 100))
-            msg("Incorrect tags: %d (%0.2f%%)\n" % (wrong, wrong / total * 100))
+            for (name, value) in fold_metrics.iteritems():
+                run_totals[name] += value
+            cycle_metrics.append(compared_metrics)
+            self._report_cycle(right, wrong, compared, evaluations, folds, \
+                compared_metrics)
+            
+            if metrics is not None:
+                fold_metrics = dict(fold_metrics, **compared_metrics)
+                fold_metrics['accuracy'] = right / (right + wrong)
+                metrics.fold(len(self.evaluation.folds), \
+                    self._rates(fold_metrics))
         # end: test cycle
             
         msg("%s%s" % (sep,sep))
         
         # calculate and output statistics for the entire test
-        print "Total tests run: %d" % len(totals)
-        print "Total time taken: %0.2f seconds" % (time.time() - total_time_start)
-        print "Average correct tags: %0.2f%%" % (sum(rights) / sum(totals) * 100)
-        print "Average incorrect tags: %0.2f%%" % (sum(wrongs) / sum(totals) * 100)
-        print
+        self._report_run(run_totals, compared, evaluations, cycle_metrics, \
+            time.time() - total_time_start, metrics)
         
         # give the option of inspecting incorrect tags
         if raw_input("Examine bad tags? ") in ['y','Y']:
-            self.inspect(all_missed)
+            self.inspect(self.evaluation)
+            
+    def run_scaling_benchmark(self, sizes=None, json_path=None, test_pct=10):
+        """
+        Train on growing amounts of the corpus, testing each time on the same
+        sentences at the end of it, and record how loading the corpus, training,
+        the model size, peak memory, tagging throughput and accuracy scale. Print
+        a table of the results, and return them as a list of dicts.
+        Each size runs in its own process, so its peak memory is its own.
+        
+        :param sizes: list of amounts of training data, as percentages of the
+            corpus before the testing sentences (default: Tagger.benchmark_sizes)
+        :param json_path: string path to also write the results to as JSON
+            (default: None)
+        :param test_pct: percentage of the corpus to test on (default: 10)
+        """
+        
+        from multiprocessing import Process, Queue # only needed for benchmarks
+        import json # for writing the results
+        import math # for working out growth exponents
+        
+        results = []
+        for size in (sizes if sizes is not None else Tagger.benchmark_sizes):
+            msg("Benchmarking training on %g%% of the training sentences\n" % size)
             
-    def train(self, sents):
+            # run each size in a child process with a copy of our corpus
+            queue = Queue()
+            process = Process(target=self._benchmark_size, args=(size, test_pct, \
+                queue))
+            process.start()
+            result = queue.get()
+            process.join()
+            if 'error' in result:
+                raise Exception("Benchmark at %g%% failed: %s" % (size, \
+                    result['error']))
+            
+            # how fast training time and model size grow with the training words
+            # since the last size, e.g. 1 for linear and 2 for quadratic growth
+            if results and result['words'] > results[-1]['words']:
+                words_ratio = math.log(result['words'] / results[-1]['words'])
+                for name in ['train_seconds', 'model_bytes']:
+                    result[name + '_exponent'] = math.log(max(result[name], 1e-9) \
+                        / max(results[-1][name], 1e-9)) / words_ratio
+            results.append(result)
+        # end: sizes
+        
+        # print a table of the results
+        print "%7s %7s %8s %7s %7s %5s %9s %8s %8s %7s" % ('size', 'sents', \
+            'words', 'load s', 'train s', 'exp', 'model KB', 'peak MB', 'sents/s', \
+            'acc')
+        for result in results:
+            print "%6g%% %7d %8d %7.2f %7.2f %5s %9d %8.1f %8.1f %6.2f%%" % \
+                (result['size'], result['sentences'], result['words'], \
+                result['load_seconds'], result['train_seconds'], \
+                "%0.2f" % result['train_seconds_exponent'] if \
+                'train_seconds_exponent' in result else '-', \
+                result['model_bytes'] / 1024, result['peak_memory_kb'] / 1024, \
+                result['sents_per_sec'], result['accuracy'] * 100)
+        print
+        
+        if json_path is not None:
+            f = open(json_path, 'w')
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.close()
+        
+        return results
+        
+    def run_decoder_benchmark(self, test_pct=10):
+        """
+        Train on the corpus before its last test_pct percent, then tag the rest
+        with HMM.tag_sent(), HMM.tag_sent_reference() and HMM.tag_sent_greedy(),
+        tagging with what we learned in training and with a model file compiled
+        from it. Print how long each took and how often the others disagreed
+        with tag_sent(), and return a list of dicts of the results
+        
+        :param test_pct: percentage of the corpus to tag (default: 10)
+        """
+        
+        from Model import load_model # only needed for model benchmarks
+        import tempfile # for a scratch model file
+        import os # for removing it
+        
+        train_pct = 100 - test_pct
+        self.train(self.tb.training_sents(train_pct, 0))
+        sents = [list(pair[0]) for pair in self.tb.iter_testing_sents(test_pct, \
+            train_pct)]
+        
+        (handle, path) = tempfile.mkstemp(prefix='hmm-tagger-', suffix='.model')
+        os.close(handle)
+        self.save_model(path)
+        hmms = [('training', self.new_hmm()), ('model', load_model(path).new_hmm())]
+        os.remove(path)
+        
+        results = []
+        for (name, hmm) in hmms:
+            timings = []
+            outputs = []
+            for tag_sent in [hmm.tag_sent_reference, hmm.tag_sent, \
+                hmm.tag_sent_greedy]:
+                start_time = time.time()
+                outputs.append([tag_sent(sent)[0] for sent in sents])
+                timings.append(time.time() - start_time)
+            
+            mismatches = [len([i for i in range(len(sents)) if outputs[j][i] != \
+                outputs[1][i]]) for j in [0, 2]]
+            results.append({'tables': name, 'sentences': len(sents),
+                'reference_seconds': timings[0], 'kernel_seconds': timings[1],
+                'speedup': timings[0] / max(timings[1], 1e-9),
+                'mismatches': mismatches[0], 'greedy_seconds': timings[2],
+                'greedy_differences': mismatches[1]})
+        
+        print "%9s %9s %11s %9s %8s %10s %9s %12s" % ('tables', 'sentences', \
+            'reference s', 'kernel s', 'speedup', 'mismatches', 'greedy s', \
+            'greedy diffs')
+        for result in results:
+            print "%9s %9d %11.2f %9.2f %7.1fx %10d %9.2f %12d" % \
+                (result['tables'], result['sentences'], \
+                result['reference_seconds'], result['kernel_seconds'], \
+                result['speedup'], result['mismatches'], \
+                result['greedy_seconds'], result['greedy_differences'])
+        print
+        
+        return results
+        
+    def run_pruning_benchmark(self, thresholds=None, json_path=None, test_pct=10):
+        """
+        Train on the corpus before its last test_pct percent, then prune the words
+        seen fewer than each threshold of times with prune(), and tag the rest of
+        the corpus with a model file compiled from what is left. Print a table of
+        how the model size, tagging speed and accuracy trade off, and return the
+        results as a list of dicts
+        
+        :param thresholds: list of fewest times a word must have been seen to be
+            kept (default: Tagger.prune_thresholds)
+        :param json_path: string path to also write the results to as JSON
+            (default: None)
+        :param test_pct: percentage of the corpus to tag (default: 10)
+        """
+        
+        from Model import load_model # only needed for model benchmarks
+        import tempfile # for scratch model files
+        import json # for writing the results
+        import os # for model sizes
+        
+        train_pct = 100 - test_pct
+        self.train(self.tb.training_sents(train_pct, 0))
+        num_sents = self.tb.num_testing_sents(test_pct, train_pct)
+        counts = (self.words_given_pos, self.words_given_pos_upper)
+        
+        results = []
+        for min_count in (thresholds if thresholds is not None else \
+            Tagger.prune_thresholds):
+            msg("Benchmarking words seen at least %d time(s)\n" % min_count)
+            (self.words_given_pos, self.words_given_pos_upper) = counts
+            entries = self.prune(min_count)
+            
+            (handle, path) = tempfile.mkstemp(prefix='hmm-tagger-', \
+                suffix='.model')
+            os.close(handle)
+            self.save_model(path)
+            model_bytes = os.path.getsize(path)
+            model = load_model(path)
+            os.remove(path)
+            
+            # tag with the model file, as a worker we ship it to would
+            hmm = model.new_hmm()
+            start_time = time.time()
+            (right, wrong) = self.test_stream(self._testing_pairs(test_pct, \
+                train_pct), num_sents, hmm=hmm, evaluation=Evaluation())
+            test_seconds = time.time() - start_time
+            
+            results.append({'min_count': min_count, 'entries': entries,
+                'model_bytes': model_bytes, 'test_seconds': test_seconds,
+                'sents_per_sec': num_sents / test_seconds,
+                'unknown_rate': hmm.total_unknown_count / max(right + wrong, 1),
+                'accuracy': right / max(right + wrong, 1)})
+        # end: thresholds
+        (self.words_given_pos, self.words_given_pos_upper) = counts
+        
+        # print a table of the results, with sizes relative to the first model
+        print "%9s %9s %9s %6s %8s %8s %7s" % ('min count', 'entries', \
+            'model KB', 'size', 'sents/s', 'unseen', 'acc')
+        for result in results:
+            print "%9d %9d %9d %5.0f%% %8.1f %7.2f%% %6.2f%%" % \
+                (result['min_count'], result['entries'], \
+                result['model_bytes'] / 1024, result['model_bytes'] / \
+                results[0]['model_bytes'] * 100, result['sents_per_sec'], \
+                result['unknown_rate'] * 100, result['accuracy'] * 100)
+        print
+        
+        if json_path is not None:
+            f = open(json_path, 'w')
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.close()
+        
+        return results
+        
+    def run_pipeline(self, workers=2, batch_size=64, queue_size=4, test_pct=10):
+        """
+        Train on the corpus before its last test_pct percent, then tag and score
+        the rest with a Pipeline, reading the testing sentences from the corpus,
+        decoding them on worker processes attached to a model file and scoring
+        them all at once, and again one after the other with test_stream(). Print
+        how busy each stage of the pipeline was and how the two compare, and
+        return the pipeline's stats with its 'accuracy' and the 'serial_seconds'
+        test_stream() took
+        
+        :param workers: number of worker processes to decode with (default: 2)
+        :param batch_size: number of sentences to send to a worker at a time
+            (default: 64)
+        :param queue_size: most batches to hold between two stages (default: 4)
+        :param test_pct: percentage of the corpus to tag (default: 10)
+        """
+        
+        from Pipeline import Pipeline # only needed for pipelines
+        from Model import load_model # for the model the workers attach to
+        import tempfile # for a scratch model file
+        import os # for removing it
+        
+        train_pct = 100 - test_pct
+        self.train(self.tb.training_sents(train_pct, 0))
+        num_sents = self.tb.num_testing_sents(test_pct, train_pct)
+        
+        (handle, path) = tempfile.mkstemp(prefix='hmm-tagger-', suffix='.model')
+        os.close(handle)
+        self.save_model(path)
+        try:
+            pipeline = Pipeline(path, workers, batch_size, queue_size)
+            model = load_model(path)
+        finally:
+            os.remove(path)
+        
+        # score each sentence as it comes out of the pipeline, in order
+        evaluation = Evaluation()
+        fold = evaluation.start_fold(test_pct, train_pct)
+        counts = [0, 0, 0] # sentences, right and wrong tags so far
+        def score(pair, hmm_tagged_sent):
+            (sent_right, sent_wrong) = evaluation.score_sent(fold, counts[0], \
+                hmm_tagged_sent, pair[1])
+            counts[0] += 1
+            counts[1] += sent_right
+            counts[2] += sent_wrong
+        
+        msg("Tagging sentences through a pipeline with %d worker(s)\n" % \
+            workers)
+        try:
+            stats = pipeline.run(self._testing_pairs(test_pct, train_pct), score, \
+                lambda pair: list(pair[0]))
+        finally:
+            pipeline.close()
+        stats['accuracy'] = counts[1] / max(counts[1] + counts[2], 1)
+        
+        # and the same sentences one after the other, with the same model
+        start_time = time.time()
+        self.test_stream(self._testing_pairs(test_pct, train_pct), num_sents, \
+            hmm=model.new_hmm(), evaluation=Evaluation())
+        stats['serial_seconds'] = time.time() - start_time
+        
+        pipeline.report(stats)
+        msg("Accuracy: %0.2f%%, %0.2fs in series (%0.2fx)\n" % \
+            (stats['accuracy'] * 100, stats['serial_seconds'], \
+            stats['serial_seconds'] / max(stats['seconds'], 1e-9)))
+        
+        return stats
+        
+    def train(self, sents, workers=1):
         """
         Train the tagger on a set of tagged sentences
         
         :param sents: list of tagged sentences
+        :param workers: number of processes to split the counting across
+            (default: 1)
         """
         
         # collect POS tags from our corpus
         self.pos_tags = self.tb.pos_tags()
         
-        # add start markers to help with bigram tagging
+        # add our start marker tag and others to help with bigram tagging
         msg("Adjusting POS tags...")
-        sents = self._adjust_pos(sents)
+        self._adjust_pos()
         msg("done\n")
         
-        # create 2 conditional frequency distributions (from the NLTK) that store
+        # count, in a single pass over each shard of sentences, the observations
+        # for 2 conditional frequency distributions (from the NLTK) that store
         # observed probabilities that a given word has a certain POS, one for
-        # lowercase-normalized words and one for words as they appear in the text
-        msg("Training (Wi|Ck)...")
+        # lowercase-normalized words and one for words as they appear in the
+        # text, and another that stores observed probabilities that one POS
+        # follows another POS
+        shards = split(sents, workers)
+        msg("Training (Wi|Ck) and (Ci+1|Ci) on %d shard(s)..." % len(shards))
+        if isinstance(sents, SentView):
+            # workers get the corpus once, as they start, and then only the
+            # sentence ranges of each shard
+            partials = count_parallel(count_ranges, [(shard.ranges, \
+                Tagger.start_tag) for shard in shards], workers, share_corpus, \
+                (sents.corpus,))
+        else:
+            partials = count_parallel(count_shard, [(shard, Tagger.start_tag) \
+                for shard in shards], workers)
         
-        # create a CFD for words normalized to lowercase
-        self.words_given_pos = ConditionalFreqDist((wp[1], wp[0].lower()) for \
-            sent in sents for wp in sent)
-            
-        # create a CFD for words left in their original capitalization
-        self.words_given_pos_upper = ConditionalFreqDist((wp[1], wp[0]) for \
-            sent in sents for wp in sent)
+        # merge the partial counts from each shard
+        (self.words_given_pos, self.words_given_pos_upper, \
+            self.pos2_given_pos1) = merge_counts(partials)[:3]
         msg("done\n")
         
-        # create another CFD that stores probabilities that stores observed
-        # probabilities that one POS follows another POS
-        msg("Training (Ci+1|Ci)...")
-        self.pos2_given_pos1 = ConditionalFreqDist((sent[i-1][1], sent[i][1]) for \
-            sent in sents for i in range(1,len(sent)))
-
+        if self.tags.from_penn is not None:
+            self._coarsen()
+        self._build_suffixes()
+        
+    def train_files(self, workers=1):
+        """
+        Train the tagger on all of the corpus files, with each worker process
+        reading and counting its own share of the files. Files are shared out by
+        size, and cut into byte ranges where needed, so there are as many shards
+        as workers even with fewer files than that
+        
+        :param workers: number of processes to split the files across (default: 1)
+        """
+        
+        shards = [(self.tb.corpus_path, pieces, Tagger.start_tag) for pieces in \
+            split_files(self.tb.corpus_path, self.tb.corpus_files, workers)]
+        
+        msg("Training (Wi|Ck) and (Ci+1|Ci) on %d file shard(s)..." % len(shards))
+        partials = count_parallel(count_files, shards, workers)
+        (self.words_given_pos, self.words_given_pos_upper, self.pos2_given_pos1, \
+            self.pos_tags) = merge_counts(partials)
+        msg("done\n")
+        
+        # add our start marker tag and others to the tags we found
+        self._adjust_pos()
+        if self.tags.from_penn is not None:
+            self._coarsen()
+        self._build_suffixes()
+        
+    def train_out_of_core(self, path, max_entries=1000000, spill_dir=None,
+        quantize=False, min_count=1):
+        """
+        Train on all of the corpus files, streaming sentences from disk and holding
+        at most about max_entries word counts in memory at once, and write the
+        resulting model straight to a model file. Partial counts are spilled to
+        disk and merged at the end, giving the same model as training in memory
+        and calling save_model() would. Return the number of runs the counts
+        were spilled in
+        
+        :param path: string path to write the model to
+        :param max_entries: most word counts to hold in memory (default: 1000000)
+        :param spill_dir: string path of a directory to spill counts to (default:
+            a new temporary directory)
+        :param quantize: whether to write quantized log-probabilities (default:
+            False)
+        :param min_count: fewest times a word must have been seen to be written
+            to the model, as prune() keeps them (default: 1, for every word)
+        """
+        
+        from Model import write_model_from_counts # only needed here
+        import tempfile # for a scratch directory to spill to
+        import shutil # for removing it again
+        
+        # read the corpus files a line at a time, so no more than a sentence of
+        # them is held in memory, and count a coarser tag set as it streams past
+        sents = (sent for name in self.tb.corpus_files for sent in \
+            read_tagged_sents(self.tb.corpus_path + name))
+        if self.tags.from_penn is not None:
+            sents = (coarse_sent(self.tags, sent) for sent in sents)
+        
+        work_dir = tempfile.mkdtemp(prefix='hmm-tagger-', dir=spill_dir)
+        try:
+            msg("Training (Wi|Ck) and (Ci+1|Ci) out of core...")
+            (lower_runs, upper_runs, tag_totals, pos2_given_pos1, self.pos_tags) = \
+                count_to_runs(sents, Tagger.start_tag, work_dir, max_entries)
+            msg("done: %d run(s)\n" % len(lower_runs))
+            
+            # add our start marker tag and others to the tags we found
+            self._adjust_pos()
+            
+            # build the suffix trie from the original-case counts as they are
+            # merged into the model
+            self.suffixes = SuffixTrie(self.pos_tags, Tagger.start_tag)
+            
+            # the suffix trie sees every word before the rare ones are pruned
+            msg("Merging counts into model %s..." % path)
+            write_model_from_counts(path, self.pos_tags, Tagger.start_tag, \
+                prune_stream(merge_runs(lower_runs), min_count), \
+                prune_stream(self._add_suffixes(merge_runs(upper_runs)), \
+                min_count), tag_totals, pos2_given_pos1, self.suffixes, quantize, \
+                self.tags.name)
+            msg("done\n")
+        finally:
+            shutil.rmtree(work_dir)
+        
+        return len(lower_runs)
+        
+    def check_out_of_core(self, max_entries=20000, copies=None):
+        """
+        Train out of core on growing copies of the corpus, and raise an
+        exception if the peak memory it takes grows with them rather than
+        staying flat.
+        Print a table of the results, and return them as a list of dicts.
+        Each copy runs in its own process, so its peak memory is its own.
+        
+        :param max_entries: most word counts to hold in memory, which should be
+            fewer than the corpus has, so that counts get spilled (default:
+            20000)
+        :param copies: list of how many copies of the corpus to train on each
+            time (default: Tagger.out_of_core_copies)
+        """
+        
+        from multiprocessing import Process, Queue # only needed for checks
+        import tempfile # for scratch corpus files
+        import shutil # for copying the corpus and removing the copies
+        
+        results = []
+        scratch = tempfile.mkdtemp(prefix='hmm-tagger-')
+        try:
+            for num_copies in (copies if copies is not None else \
+                Tagger.out_of_core_copies):
+                msg("Checking out-of-core training on %d copies of the " \
+                    "corpus\n" % num_copies)
+                
+                # write the copies out a block at a time
+                path = scratch + '/corpus.txt'
+                out = open(path, 'wb')
+                for i in range(num_copies):
+                    for name in self.tb.corpus_files:
+                        f = open(self.tb.corpus_path + name, 'rb')
+                        shutil.copyfileobj(f, out)
+                        f.close()
+                out.close()
+                
+                # and train on them in a child process
+                queue = Queue()
+                process = Process(target=self._check_copies, args=(scratch, \
+                    max_entries, queue))
+                process.start()
+                result = queue.get()
+                process.join()
+                if 'error' in result:
+                    raise Exception("Out-of-core check on %d copies failed: " \
+                        "%s" % (num_copies, result['error']))
+                result['copies'] = num_copies
+                results.append(result)
+            # end: copies
+        finally:
+            shutil.rmtree(scratch)
+        
+        print "%6s %9s %7s %8s %9s %9s" % ('copies', 'bytes', 'runs', \
+            'train s', 'peak MB', 'growth MB')
+        for result in results:
+            print "%6d %9d %7d %8.2f %9.1f %9.1f" % (result['copies'], \
+                result['corpus_bytes'], result['runs'], \
+                result['train_seconds'], result['peak_memory_kb'] / 1024, \
+                result['memory_growth_kb'] / 1024)
+        print
+        
+        # memory may vary a little from run to run, but not grow with the corpus
+        budget = results[0]['peak_memory_kb'] * Tagger.out_of_core_memory_slack
+        if results[-1]['peak_memory_kb'] > budget:
+            raise Exception("Training on %d copies of the corpus took %0.1f " \
+                "MB, over the %0.1f MB budget!" % (results[-1]['copies'], \
+                results[-1]['peak_memory_kb'] / 1024, budget / 1024))
+        
+        return results
+        
+    def update(self, sents):
+        """
+        Fold newly tagged sentences into what we learned in training, without
+        retraining on the whole corpus. The counts behind P(Wi|Ck) and P(Ci+1|Ci)
+        are updated, and any tags we haven't seen before are added to our tag
+        list. Nothing an HMM from new_hmm() tags with is changed in place: the
+        rows of counts we update are copies, swapped in with a new tag list once
+        we're done, so HMMs made before the update go on tagging with what they
+        were made with, and only those made after it see the new counts. With a
+        coarser tag set, the refiner isn't updated
+        
+        :param sents: list of tagged sentences
+        """
+        
+        if not self.words_given_pos:
+            raise Exception("Tagger must be trained before it can be updated!")
+        
+        msg("Updating with %d sentences..." % len(sents))
+        start = Tagger.start_tag # for convenience
+        cfds = [copy_counts(cfd) for cfd in [self.words_given_pos, \
+            self.words_given_pos_upper, self.pos2_given_pos1]]
+        (words_given_pos, words_given_pos_upper, pos2_given_pos1) = cfds
+        pos_tags = list(self.pos_tags)
+        
+        # copy each row the first time we count into it
+        copied = set()
+        def row(table, cond):
+            if (table, cond) not in copied:
+                cfds[table][cond] = cfds[table][cond].copy()
+                copied.add((table, cond))
+            return cfds[table][cond]
+        
+        for sent in sents:
+            sent = coarse_sent(self.tags, sent)
+            
+            # count the start marker just as training does
+            row(0, start)[start] += 1
+            row(1, start)[start] += 1
+            pos1 = start
+            
+            for (word, pos) in sent:
+                row(0, pos)[word.lower()] += 1
+                row(1, pos)[word] += 1
+                row(2, pos1)[pos] += 1
+                pos1 = pos
+                
+                # add new tags to our tag list
+                if pos not in pos_tags:
+                    pos_tags.append(pos)
+        
+        (self.words_given_pos, self.words_given_pos_upper, \
+            self.pos2_given_pos1, self.pos_tags) = (words_given_pos, \
+            words_given_pos_upper, pos2_given_pos1, pos_tags)
         msg("done\n")
         
-    def test(self, sent_set):
+        # rare words may have stopped being rare, so count the suffixes again
+        self._build_suffixes()
+        
+    def prune(self, min_count):
+        """
+        Compact what we learned in training by dropping the words seen fewer than
+        min_count times from P(Wi|Ck), so they are tagged as unseen words instead,
+        by their suffixes. These are most of the words, but few of the words we
+        tag, so this gives a much smaller model which tags almost as well. The
+        suffix trie still holds what it learned from them, until update() counts
+        it again from the words left. Return the number of (tag, word) entries
+        left
+        
+        :param min_count: fewest times a word must have been seen to be kept
+        """
+        
+        if not self.words_given_pos:
+            raise Exception("Tagger must be trained before it can be pruned!")
+        
+        cfds = [self.words_given_pos, self.words_given_pos_upper]
+        before = sum([cfd[pos].B() for cfd in cfds for pos in cfd.conditions()])
+        
+        msg("Pruning words seen fewer than %d time(s)..." % min_count)
+        (self.words_given_pos, self.words_given_pos_upper) = [prune_counts(cfd, \
+            min_count) for cfd in cfds]
+        
+        cfds = [self.words_given_pos, self.words_given_pos_upper]
+        after = sum([cfd[pos].B() for cfd in cfds for pos in cfd.conditions()])
+        msg("done: %d of %d entries left\n" % (after, before))
+        
+        return after
+        
+    def publish(self, directory, keep=3, quantize=False):
+        """
+        Publish what we have learned so far as a new model snapshot in a
+        directory, and return its version number. Processes loading the directory
+        with Model.load_model() get the newest snapshot, while those already
+        tagging with an older one carry on undisturbed
+        
+        :param directory: string path of the snapshot directory
+        :param keep: number of snapshots to keep around (default: 3)
+        :param quantize: whether to store quantized log-probabilities, as in
+            save_model() (default: False)
+        """
+        
+        from Model import publish_model # only needed when publishing models
+        
+        msg("Publishing model to %s..." % directory)
+        version = publish_model(directory, keep, self.pos_tags, Tagger.start_tag, \
+            self.words_given_pos, self.words_given_pos_upper, self.pos2_given_pos1, \
+            self.suffixes, quantize, self.tags.name)
+        msg("done: version %d\n" % version)
+        
+        return version
+        
+    def test(self, sent_set, fold=None):
         """
         Use a Hidden Markov Model to tag a set of sentences, and evaluate accuracy.
         
         :param sent_set: tuple like (untagged sentences, gold standard sentences)
+        :param fold: index of the test cycle in self.evaluation to record results
+            under (default: record in a new test cycle)
         """
         
         untagged_sents = sent_set[0] # recover untagged sentences
         gold_tagged_sents = sent_set[1] # recover gold standard tagged sentences
         
+        # ensure our sentence sets have the same length
+        if len(untagged_sents) != len(gold_tagged_sents):
+            raise Exception("Untagged sentence set did not match gold \
+                standard sentence set!")
+        
+        # tag and evaluate the sentences as they flow through, against the gold
+        # standard in our tag set
+        return self.test_stream(izip(untagged_sents, (coarse_sent(self.tags, \
+            sent) for sent in gold_tagged_sents)), len(gold_tagged_sents), fold)
+        
+    def test_stream(self, sent_pairs, num_sents, fold=None, hmm=None,
+        evaluation=None):
+        """
+        Use a Hidden Markov Model to tag sentences and score them against the gold
+        standard one at a time as they are pulled from an iterable, so that only
+        counters (and compact mistake records) accumulate. Return a tuple of
+        correct vs incorrect tags.
+        
+        :param sent_pairs: iterable of (untagged sentence, gold standard sentence)
+        :param num_sents: how many sentences sent_pairs will generate, for
+            showing progress
+        :param fold: index of the test cycle in self.evaluation to record results
+            under (default: record in a new test cycle)
+        :param hmm: HMM object to tag with (default: a new one which tags using
+            what we learned in training)
+        :param evaluation: Evaluation object to record results in (default:
+            self.evaluation)
+        """
+        
+        # if we're not part of a run of test cycles, start recording on our own
+        if evaluation is None:
+            if not self.evaluation:
+                self.evaluation = Evaluation()
+            evaluation = self.evaluation
+        if fold is None:
+            fold = evaluation.start_fold(None, None)
+        
         # initialize an HMM object with necessary parameters
-        self.hmm = HMM(untagged_sents, self.pos_tags, self.words_given_pos, \
-            self.words_given_pos_upper, self.pos2_given_pos1, Tagger.start_tag)
+        self.hmm = hmm if hmm is not None else self.new_hmm()
+        
+        # split our sentence pairs so the HMM can pull untagged sentences while we
+        # pull the matching gold standard sentences in step with it
+        (hmm_pairs, gold_pairs) = tee(sent_pairs)
+        hmm_tagged_sents = self.hmm.tag_iter(pair[0] for pair in hmm_pairs)
+        
+        msg("Tagging sentences:\n")
+        progress = Progress(num_sents) # for showing progress now and then
+        right = 0 # initialize counter of correct tags
+        wrong = 0 # initialize counter of incorrect tags
+        
+        # score each sentence as soon as it has been tagged
+        for (i, (hmm_tagged_sent, pair)) in \
+            enumerate(izip(hmm_tagged_sents, gold_pairs)):
+            (sent_right, sent_wrong) = evaluation.score_sent(fold, i, \
+                hmm_tagged_sent, pair[1])
+            right += sent_right
+            wrong += sent_wrong
+            
+            # show nice progress bar, with our accuracy so far
+            progress.update(i + 1, "acc %0.2f%%" % \
+                (right / max(right + wrong, 1) * 100))
+        # end sentences loop
+        
+        # print nice things to the user
+        progress.finish(num_sents, "acc %0.2f%%" % \
+            (right / max(right + wrong, 1) * 100))
+        self.hmm.report()
+        
+        return (right, wrong)
+        
+    def new_hmm(self, untagged_sents=None, refine=False):
+        """
+        Return a new HMM object which tags using what we learned in training. It
+        keeps its own copy of our tag list, and update() never changes the counts
+        it reads, so it tags the same however we are updated afterwards; to tag
+        with an update, make a new one, or load a snapshot from publish()
+        
+        :param untagged_sents: list of untagged sentences for HMM.tag() (default:
+            None, for tagging with HMM.tag_iter() or HMM.tag_sent())
+        :param refine: whether to turn the coarse tags we decode back into Penn
+            Treebank tags, if we trained on a coarser tag set (default: False)
+        """
+        
+        hmm = HMM(untagged_sents, list(self.pos_tags), self.words_given_pos, \
+            self.words_given_pos_upper, self.pos2_given_pos1, Tagger.start_tag, \
+            self.suffixes, self.tags)
+        
+        if refine:
+            if self.refiner is None:
+                raise Exception("Only a tagger trained on a coarser tag set " \
+                    "can refine its tags!")
+            hmm.refiner = self.refiner
+        
+        return hmm
+        
+    def save_model(self, path, quantize=False):
+        """
+        Compile what we learned in training into a model file, which any number of
+        processes can then attach to with Model.load_model()
         
-        # get HMM-tagged sentences
-        hmm_tagged_sents = self.hmm.tag()
+        :param path: string path to write the model to
+        :param quantize: whether to store quantized log-probabilities, for a
+            smaller model which tags slightly differently (default: False)
+        """
         
-        # evaluate against gold standard and return accuracy data
-        return self.evaluate(hmm_tagged_sents, gold_tagged_sents)
+        from Model import write_model # only needed when saving models
         
-    def evaluate(self, hmm_tagged_sents, gold_tagged_sents):
+        msg("Writing model to %s..." % path)
+        write_model(path, self.pos_tags, Tagger.start_tag, self.words_given_pos, \
+            self.words_given_pos_upper, self.pos2_given_pos1, self.suffixes, \
+            quantize, self.tags.name)
+        msg("done\n")
+        
+    def evaluate(self, hmm_tagged_sents, gold_tagged_sents, fold=None):
         """
-        Evaluate one set of tagged sentences against another set
+        Evaluate one set of tagged sentences against another set, recording
+        accuracy data and mistakes in self.evaluation
         
         :param hmm_tagged_sents: list of tagged sentences
         :param gold_tagged_sents: list of tagged sentences used as gold standard
+        :param fold: index of the test cycle in self.evaluation to record results
+            under (default: record in a new test cycle)
         """
         
         # ensure our sentence sets have the same length
@@ -182,140 +972,622 @@ class Tagger:
             raise Exception("HMM-tagged sentence set did not match gold \
                 standard sentence set!")
         
+        # if we're not part of a run of test cycles, start recording on our own
+        if not self.evaluation:
+            self.evaluation = Evaluation()
+        if fold is None:
+            fold = self.evaluation.start_fold(None, None)
+        
         right = 0 # initialize counter of correct tags
         wrong = 0 # initialize counter of incorrect tags
-        missed = [] # initialize array of tagged words we didn't get right
         
-        # loop through sentence sets
+        # loop through sentence sets, letting our Evaluation object compare words
+        # and remember where we went wrong
         for i in range(len(gold_tagged_sents)):
-            
-            # ensure our sentences have the same length
-            if len(hmm_tagged_sents[i]) != len(gold_tagged_sents[i]):
-                raise Exception("HMM-tagged sentence did not match gold \
-                    standard sentence!")
-                
-            # loop through words in sentence
-            for j in range(len(gold_tagged_sents[i])):
-                gold_tagged_word = gold_tagged_sents[i][j]
-                hmm_tagged_word = hmm_tagged_sents[i][j]
-                
-                # ensure the words are the same between the sets
-                if gold_tagged_word[0] != hmm_tagged_word[0]:
-                    raise Exception("HMM-tagged word did not match gold \
-                        standard word!")
-
-                # increment counters based on tag correctness
-                if gold_tagged_word[1] == hmm_tagged_word[1]:
-                    right += 1
-                else:
-                    missed.append((hmm_tagged_word, gold_tagged_word, \
-                        hmm_tagged_sents[i], gold_tagged_sents[i]))
-                    wrong += 1
-            # end words loop
+            (sent_right, sent_wrong) = self.evaluation.score_sent(fold, i, \
+                hmm_tagged_sents[i], gold_tagged_sents[i])
+            right += sent_right
+            wrong += sent_wrong
         # end sentences loop
         
         # return a tuple of correct vs incorrect tags
-        return (right, wrong, missed)
+        return (right, wrong)
         
-    def inspect(self, missed):
+    def inspect(self, evaluation, threshold=None):
         """
-        Inspect a testing session, and print data about tag accuracy
+        Inspect a testing session, and print data about tag accuracy.
+        Mistake types are shown worst first, and the user can page through the
+        examples of each type, skip to the next type, or look up a word.
         
-        :param missed: list of tuples of missed tags like:
-            (hmm_tagged_word, gold_tagged_word, hmm_context, gold_context)
+        :param evaluation: Evaluation object holding the mistakes of the session
+        :param threshold: number of times a mistake must occur for us to show it
+            (default: Tagger.mistake_threshold)
         """
         
-        # create a CFD so we can examine a matrix of incorrect vs correct tags
-        # ms[1][1] = tag of a gold_tagged_word
-        # ms[0][1] = tag of an hmm_tagged_word
-        cfd = ConditionalFreqDist((ms[1][1], ms[0][1]) for ms in missed)
+        ev = evaluation # for convenience
         
-        # initialize a hash to store mistakes by frequency
-        mistakes = {}
+        if threshold is None:
+            threshold = Tagger.mistake_threshold
         
-        # print a table showing mistake frequency
-        cfd.tabulate()
+        # print a table showing mistake frequency, i.e. the gold-standard tag
+        # against the tag we chose
+        msg(ev.tabulate())
         msg("\n")
         
-        # loop through mistake frequencies by gold standard tag, i.e., if we are
-        # examining gold-standard 'IN', count what we incorrectly tagged it as
-        conds = cfd.conditions()
-        for g_tag in conds:
-            for hmm_tag in cfd[g_tag].keys():
-                # how many times did we incorrectly say g_tag was hmm_tag?
-                count = cfd[g_tag][hmm_tag]
-                
-                # add these mistakes to the count
-                if count not in mistakes.keys():
-                    mistakes[count] = []
-                mistakes[count].append((hmm_tag, g_tag))
-                
-        # get a list of all mistake types that occurred over a threshold, worst first
-        mistake_counts = set([count for (count, mistake_set) in \
-            mistakes.iteritems() if count > Tagger.mistake_threshold])
-        mistake_counts = reversed(sorted(mistake_counts))
-        
-        # now create a list of mistake types to show the user, i.e., loop 
-        # through all types and if they are of a high-frequency type, add to list
-        mistakes_to_halt = []
-        for count in mistake_counts:
-            mistake_set = mistakes[count]
-            for mistake_tuple in mistake_set:
-                mistakes_to_halt.append(mistake_tuple)
-                msg("%d\t%s\twas really\t%s\n" % (count, mistake_tuple[0], \
-                    mistake_tuple[1]))
+        # get the mistake types that occurred over the threshold, worst first,
+        # straight from the confusion matrix
+        mistake_types = ev.mistake_types(threshold)
+        for (count, hmm_tag, gold_tag) in mistake_types:
+            msg("%d\t%s\twas really\t%s\n" % (count, hmm_tag, gold_tag))
         msg("\n")
         
+        # loop through the mistake types and page through the examples of each,
+        # which our Evaluation object has already indexed for us
+        for (count, hmm_tag, gold_tag) in mistake_types:
+            response = self._page_mistakes(ev, ev.mistakes_of(hmm_tag, gold_tag))
+            if response in ['q','Q']:
+                break
+            
+            # let the user look up every mistake we made for a certain word
+            while response in ['w','W']:
+                word = raw_input("Word: ")
+                response = self._page_mistakes(ev, ev.mistakes_for_word(word))
+            if response in ['q','Q']:
+                break
+
+    ######### `PRIVATE' FUNCTIONS #########
+    
+    def _page_mistakes(self, evaluation, mistake_indices):
+        """
+        Show the user a list of mistakes one at a time, along with the sentence
+        context for both the gold-standard sentence and the hmm-tagged sentence.
+        Return the user's last response.
+        
+        :param evaluation: Evaluation object holding the mistakes
+        :param mistake_indices: list of indices of the mistakes to show
+        """
+        
         # create separators used when outputting missed word contexts
         sep_big = "---------------------------------------------------\n"
         sep_small = "\n-----------------------------------------\n"
         
-        # loop through individual mistakes and, if they match the kind of error
-        # we want to halt for, show the user the mistake as well as the sentence
-        # context for both the gold-standard sentence and the hmm-tagged sentence
         response = None
-        for missed_set in missed:
-            if response not in ['q','Q']:
-                (hmm_tagged_word, gold_tagged_word, hmm_tagged_sent, \
-                    gold_tagged_sent) = missed_set
-                should_halt = False
-                # determine whether the current mistake matches a mistake type
-                # we want to halt for
-                for pair in mistakes_to_halt:
-                    if hmm_tagged_word[1] == pair[0] and \
-                        gold_tagged_word[1] == pair[1]:
-                        should_halt = True
-                if should_halt:
-                    msg("%sTagged '%s' with %s when it should have been %s.%s" %\
-                    (sep_big, hmm_tagged_word[0], hmm_tagged_word[1],\
-                        gold_tagged_word[1], sep_small))
-                    
-                    msg("Gold: " + (' '.join([(w[0] + "/" + w[1]) for w in \
-                        gold_tagged_sent])))
-                    msg(sep_small)
-                    msg("Mine: " + (' '.join([(w[0] + "/" + w[1]) for w in \
-                        hmm_tagged_sent])))
-                    
-                    # get user input to decide whether to keep going
-                    response = raw_input("\n\nEnter to continue, Q to quit: ")
-
-    ######### `PRIVATE' FUNCTIONS #########
+        for n in mistake_indices:
+            # only now do we look the sentences up again
+            (hmm_tagged_word, gold_tagged_word, hmm_tagged_sent, \
+                gold_tagged_sent) = evaluation.context(n, self.tb)
+            gold_tagged_sent = coarse_sent(self.tags, gold_tagged_sent)
+            gold_tagged_word = gold_tagged_sent[evaluation.mistake_tokens[n]]
+            msg("%sTagged '%s' with %s when it should have been %s.%s" %\
+            (sep_big, hmm_tagged_word[0], hmm_tagged_word[1],\
+                gold_tagged_word[1], sep_small))
+            
+            msg("Gold: " + penn_line(gold_tagged_sent))
+            msg(sep_small)
+            msg("Mine: " + penn_line(hmm_tagged_sent))
+            
+            # get user input to decide whether to keep going
+            response = raw_input("\n\nEnter to continue, N for next mistake " +\
+                "type, W to look up a word, Q to quit: ")
+            if response in ['n','N','w','W','q','Q']:
+                break
+                
+        return response
     
-    def _adjust_pos(self, sents):
+    def _checkpoint_config(self, quantize, modes, refine):
         """
-        Insert start markers (word and tag tuple) in each sentence of a list.
-        Add any other tags that need adding
+        Return a dict of what the results of a test cycle depend on besides its
+        range of the corpus: the corpus itself, and how we train and tag
         
-        :param sents: list of tagged sentences
+        :param quantize: whether quantized models are tested too
+        :param modes: list of the other decoding modes tested
+        :param refine: whether refining coarse tags is tested too
         """
         
-        new_sents = [] # initialize array of start-marked sentences
+        from Model import version # only needed for checkpoints
         
-        # loop through tagged sentences
-        for sent in sents:
-            # add a new start-marked sentence to our array
-            new_sents.append([(Tagger.start_tag, Tagger.start_tag)] + sent)
+        trie = SuffixTrie([], Tagger.start_tag) # for its default settings
+        
+        return {'corpus': self.tb.corpus_hash(), 'start_tag': Tagger.start_tag,
+            'suffix_max_length': trie.max_length,
+            'suffix_max_count': trie.max_count, 'model_version': version,
+            'checkpoint_version': Tagger.checkpoint_version, 'quantize': quantize,
+            'modes': [list(mode) for mode in modes], 'tagset': self.tags.name,
+            'refine': refine}
+        
+    def _checkpoint_path(self, checkpoint_dir, config, train_pct, start_train_pct,
+        test_pct, start_test_pct):
+        """
+        Return the path of the directory a test cycle is checkpointed in, named by
+        a hash of the configuration and the cycle's range of the corpus
+        
+        :param checkpoint_dir: string path of the checkpoint directory
+        :param config: dict returned by _checkpoint_config()
+        :param train_pct: what pct of the corpus the cycle trains on
+        :param start_train_pct: where in the corpus the training sentences begin
+        :param test_pct: what pct of the corpus the cycle is tested on
+        :param start_test_pct: where in the corpus the testing sentences begin
+        """
+        
+        import hashlib # only needed for checkpoints
+        import json # for hashing the configuration
+        import os # for the path
+        
+        key = json.dumps({'config': config, 'train': [train_pct, \
+            start_train_pct], 'test': [test_pct, start_test_pct], \
+            'sents': len(self.tb.tagged_sents)}, sort_keys=True)
+        
+        return os.path.join(checkpoint_dir, 'cycle-%s' % \
+            hashlib.sha1(key).hexdigest())
+        
+    def _load_checkpoint(self, path):
+        """
+        Return the dict of results saved in a test cycle's checkpoint, or None if
+        the cycle was never finished
+        
+        :param path: string path of the cycle's checkpoint directory
+        """
+        
+        import json # only needed for checkpoints
+        import os # for the path
+        
+        results_path = os.path.join(path, 'results.json')
+        if not os.path.exists(results_path):
+            return None
+        
+        f = open(results_path)
+        saved = json.load(f)
+        f.close()
+        
+        return saved
+        
+    def _save_checkpoint(self, path, results):
+        """
+        Save a test cycle's results in the cycle's checkpoint directory. They
+        are written to a scratch directory which is then renamed into place, so
+        an interrupted run never leaves a checkpoint that looks finished. Replays
+        only need the tags we chose, so the trained model is not saved
+        
+        :param path: string path of the cycle's checkpoint directory
+        :param results: dict of the cycle's results
+        """
+        
+        import json # only needed for checkpoints
+        import os # for paths
+        import shutil # for clearing out old scratch directories
+        
+        scratch = '%s.tmp%d' % (path, os.getpid())
+        if os.path.exists(scratch):
+            shutil.rmtree(scratch)
+        os.makedirs(scratch)
+        
+        f = open(os.path.join(scratch, 'results.json'), 'w')
+        json.dump(results, f, sort_keys=True)
+        f.close()
+        
+        # a checkpoint saved by another run in the meantime is just as good
+        if os.path.exists(path):
+            shutil.rmtree(scratch)
+        else:
+            os.rename(scratch, path)
+        
+    def _fold_mistakes(self, evaluation, fold):
+        """
+        Return a dict of sentence index (as a string) -> list of the tags we chose,
+        for every sentence of a test cycle we made a mistake in. The other
+        sentences we tagged just like the gold standard
+        
+        :param evaluation: Evaluation object the cycle was recorded in
+        :param fold: index of the cycle in evaluation
+        """
+        
+        return dict((str(sent_index), [evaluation.tags[tag_id] for tag_id in \
+            tag_ids]) for ((mistake_fold, sent_index), tag_ids) in \
+            evaluation.hmm_tags.iteritems() if mistake_fold == fold)
+        
+    def _replay_fold(self, mistakes, test_pct, start_test_pct, fold, evaluation,
+        coarse=True):
+        """
+        Score a checkpointed test cycle again from the tags we chose, without
+        training or tagging, and return a tuple of correct vs incorrect tags
+        
+        :param mistakes: dict returned by _fold_mistakes()
+        :param test_pct: what pct of the corpus the cycle is tested on
+        :param start_test_pct: where in the corpus the testing sentences begin
+        :param fold: index of the cycle in evaluation
+        :param evaluation: Evaluation object to record the results in
+        :param coarse: whether the cycle was scored in our tag set, rather than
+            in Penn Treebank tags (default: True)
+        """
+        
+        right = 0
+        wrong = 0
+        for (i, (sent, gold_tagged_sent)) in \
+            enumerate(self._testing_pairs(test_pct, start_test_pct, coarse)):
+            tags = mistakes.get(str(i))
+            hmm_tagged_sent = zip(sent, tags) if tags is not None else \
+                gold_tagged_sent
+            (sent_right, sent_wrong) = evaluation.score_sent(fold, i, \
+                hmm_tagged_sent, gold_tagged_sent)
+            right += sent_right
+            wrong += sent_wrong
+        
+        return (right, wrong)
+        
+    def _testing_pairs(self, test_pct, start_test_pct, coarse=True):
+        """
+        Generate (untagged sentence, tagged sentence) tuples for testing one at a
+        time, with the gold standard in our tag set
+        
+        :param test_pct: what pct of the corpus to retrieve
+        :param start_test_pct: where in the corpus to begin retrieval
+        :param coarse: whether to give the gold standard in our tag set, rather
+            than in Penn Treebank tags (default: True)
+        """
+        
+        for (sent, gold_tagged_sent) in self.tb.iter_testing_sents(test_pct, \
+            start_test_pct):
+            if coarse:
+                gold_tagged_sent = coarse_sent(self.tags, gold_tagged_sent)
+            yield (sent, gold_tagged_sent)
+        
+    def _quantized_hmm(self):
+        """
+        Compile what we learned in training into a quantized model, and return a
+        tuple like (HMM object which tags with it, (plain model size, quantized
+        model size))
+        """
+        
+        from Model import load_model # only needed for quantized models
+        import tempfile # for scratch model files
+        import os # for their sizes
+        
+        sizes = []
+        for quantize in [False, True]:
+            (handle, path) = tempfile.mkstemp(prefix='hmm-tagger-', \
+                suffix='.model')
+            os.close(handle)
+            self.save_model(path, quantize)
+            sizes.append(os.path.getsize(path))
             
+            # our mapping of the model keeps it around after it's removed
+            if quantize:
+                model = load_model(path)
+            os.remove(path)
+        
+        return (model.new_hmm(), tuple(sizes))
+        
+    def _test_quantized(self, test_pct, start_test_pct, num_sents, fold,
+        evaluation):
+        """
+        Test a quantized model of what we learned in a test cycle's training on
+        the cycle's testing sentences, and return a dict of its metrics
+        
+        :param test_pct: what pct of the corpus the cycle is tested on
+        :param start_test_pct: where in the corpus the testing sentences begin
+        :param num_sents: number of testing sentences
+        :param fold: index of the cycle in evaluation
+        :param evaluation: Evaluation object to record the results in
+        """
+        
+        (hmm, sizes) = self._quantized_hmm()
+        msg("Streaming testing sentences for the quantized model\n")
+        (right, wrong) = self.test_stream(self._testing_pairs(test_pct, \
+            start_test_pct), num_sents, fold, hmm, evaluation)
+        
+        return {'quantized_accuracy': right / (right + wrong),
+            'model_bytes': sizes[0], 'quantized_model_bytes': sizes[1]}
+        
+    def _test_mode(self, mode, test_pct, start_test_pct, num_sents, fold,
+        evaluation):
+        """
+        Test what we learned in a test cycle's training with another decoding
+        mode on the cycle's testing sentences, and return a dict of its metrics
+        
+        :param mode: tuple like those in Tagger.decoding_modes
+        :param test_pct: what pct of the corpus the cycle is tested on
+        :param start_test_pct: where in the corpus the testing sentences begin
+        :param num_sents: number of testing sentences
+        :param fold: index of the cycle in evaluation
+        :param evaluation: Evaluation object to record the results in
+        """
+        
+        (name, decoding_mode, time_budget) = mode
+        hmm = self.new_hmm()
+        hmm.set_decoding(decoding_mode, time_budget)
+        msg("Streaming testing sentences for %s decoding\n" % name)
+        phase_start = time.time()
+        (right, wrong) = self.test_stream(self._testing_pairs(test_pct, \
+            start_test_pct), num_sents, fold, hmm, evaluation)
+        
+        return {'%s_accuracy' % name: right / (right + wrong),
+            '%s_test_seconds' % name: time.time() - phase_start,
+            '%s_degraded' % name: hmm.total_degraded_count}
+        
+    def _test_refined(self, test_pct, start_test_pct, num_sents, fold,
+        evaluation):
+        """
+        Test refining the coarse tags we decode in a test cycle back into Penn
+        Treebank tags, against the Penn gold standard, and return a dict of its
+        metrics
+        
+        :param test_pct: what pct of the corpus the cycle is tested on
+        :param start_test_pct: where in the corpus the testing sentences begin
+        :param num_sents: number of testing sentences
+        :param fold: index of the cycle in evaluation
+        :param evaluation: Evaluation object to record the results in
+        """
+        
+        msg("Streaming testing sentences for refined tags\n")
+        phase_start = time.time()
+        (right, wrong) = self.test_stream(self._testing_pairs(test_pct, \
+            start_test_pct, False), num_sents, fold, self.new_hmm(refine=True), \
+            evaluation)
+        
+        return {'refined_accuracy': right / (right + wrong),
+            'refined_test_seconds': time.time() - phase_start}
+        
+    def _report_cycle(self, right, wrong, compared, evaluations, folds,
+        compared_metrics):
+        """
+        Show the accuracy of a test cycle, and of each way of tagging we compared
+        with it
+        
+        :param right: number of correct tags
+        :param wrong: number of incorrect tags
+        :param compared: list of the names of the ways of tagging compared
+        :param evaluations: dict of name -> Evaluation object for each of them
+        :param folds: dict of name -> index of the cycle in its Evaluation
+        :param compared_metrics: dict of the cycle's metrics for them
+        """
+        
+        total = right + wrong
+        msg("Total words: %d\n" % total)
+        msg("Correct tags: %d (%0.2f%%)\n" % (right, right / total * 100))
+        msg("Incorrect tags: %d (%0.2f%%)\n" % (wrong, wrong / total * 100))
+        
+        for name in compared:
+            compared_right = evaluations[name].rights[folds[name]]
+            accuracy = compared_metrics['%s_accuracy' % name] * 100
+            if name == 'quantized':
+                msg("Quantized correct tags: %d (%0.2f%%)\n" % \
+                    (compared_right, accuracy))
+            elif name == 'refined':
+                msg("Refined correct tags: %d (%0.2f%%)\n" % \
+                    (compared_right, accuracy))
+            else:
+                msg("Correct tags (%s): %d (%0.2f%%), %d sentences out of " \
+                    "time\n" % (name, compared_right, accuracy, \
+                    compared_metrics['%s_degraded' % name]))
+        
+    def _report_run(self, run_totals, compared, evaluations, cycle_metrics,
+        seconds, metrics=None):
+        """
+        Show the accuracy of a whole run of test cycles, and of each way of
+        tagging we compared with it, and record the run's metrics
+        
+        :param run_totals: dict of metric name -> total over every cycle
+        :param compared: list of the names of the ways of tagging compared
+        :param evaluations: dict of name -> Evaluation object for each of them
+        :param cycle_metrics: list of the dict of each cycle's metrics for them
+        :param seconds: how long the run took
+        :param metrics: Metrics object to record the run in (default: None)
+        """
+        
+        rights = self.evaluation.rights
+        wrongs = self.evaluation.wrongs
+        total = sum(rights) + sum(wrongs)
+        print "Total tests run: %d" % len(self.evaluation.folds)
+        print "Total time taken: %0.2f seconds" % seconds
+        print "Average correct tags: %0.2f%%" % (sum(rights) / total * 100)
+        print "Average incorrect tags: %0.2f%%" % (sum(wrongs) / total * 100)
+        
+        # with the difference each other way of tagging makes
+        for name in compared:
+            compared_right = sum(evaluations[name].rights)
+            if name == 'quantized':
+                print "Average correct tags (quantized): %0.2f%% (%+0.2f%%)" % \
+                    (compared_right / total * 100, \
+                    (compared_right - sum(rights)) / total * 100)
+                print "Average model size: %d bytes, %d quantized" % tuple(\
+                    [sum([cycle[size] for cycle in cycle_metrics]) / \
+                    len(cycle_metrics) for size in ['model_bytes', \
+                    'quantized_model_bytes']])
+            elif name == 'refined':
+                print "Average correct tags (refined to Penn): %0.2f%%" % \
+                    (compared_right / total * 100)
+            else:
+                print "Average correct tags (%s): %0.2f%% (%+0.2f%%), tested " \
+                    "in %0.2fs vs %0.2fs" % (name, compared_right / total * 100, \
+                    (compared_right - sum(rights)) / total * 100, \
+                    sum([cycle['%s_test_seconds' % name] for cycle in \
+                    cycle_metrics]), run_totals['test_seconds'])
+        print
+        
+        if metrics is not None:
+            run_totals = dict(run_totals)
+            run_totals['folds'] = len(self.evaluation.folds)
+            run_totals['seconds'] = seconds
+            run_totals['accuracy'] = sum(rights) / total
+            for name in compared:
+                run_totals['%s_accuracy' % name] = \
+                    sum(evaluations[name].rights) / total
+            metrics.run(self._rates(run_totals))
+        
+    def _benchmark_size(self, size, test_pct, queue):
+        """
+        Load, train on, save and test one amount of training data for
+        run_scaling_benchmark(), and put a dict of the results on a queue (or one
+        like {'error': message} if it failed). Runs in a child process
+        
+        :param size: amount of training data, as a percentage of the corpus
+            before the testing sentences
+        :param test_pct: percentage of the corpus to test on
+        :param queue: multiprocessing.Queue to put the results on
+        """
+        
+        import resource # for peak memory
+        import tempfile # for scratch corpus and model files
+        import shutil # for removing them
+        import os # for model sizes
+        
+        try:
+            start_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            train_pct = 100 - test_pct
+            
+            # take whole copies of the training sentences, then the rest of the
+            # size from the start of the corpus
+            sents = []
+            for i in range(int(size // 100)):
+                sents += list(self.tb.training_sents(train_pct, 0))
+            if size % 100:
+                sents += list(self.tb.training_sents(train_pct * (size % 100) / \
+                    100, 0))
+            words = sum([len(sent) for sent in sents])
+            
+            # time reading the sentences back in from a corpus file
+            scratch = tempfile.mkdtemp(prefix='hmm-tagger-')
+            f = open(os.path.join(scratch, 'corpus.txt'), 'w')
+            for sent in sents:
+                f.write(penn_line(sent) + "\n")
+            f.close()
+            phase_start = time.time()
+            Treebank(scratch + '/', ['corpus.txt'], compact=True)
+            load_seconds = time.time() - phase_start
+            
+            phase_start = time.time()
+            self.train(sents)
+            train_seconds = time.time() - phase_start
+            
+            self.save_model(os.path.join(scratch, 'benchmark.model'))
+            model_bytes = os.path.getsize(os.path.join(scratch, 'benchmark.model'))
+            shutil.rmtree(scratch)
+            
+            # tag the same testing sentences at every size
+            start_test_pct = train_pct
+            num_sents = self.tb.num_testing_sents(test_pct, start_test_pct)
+            phase_start = time.time()
+            (right, wrong) = self.test_stream(self._testing_pairs(test_pct, \
+                start_test_pct), num_sents)
+            test_seconds = time.time() - phase_start
+            
+            peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            queue.put({'size': size, 'sentences': len(sents), 'words': words,
+                'load_seconds': load_seconds, 'train_seconds': train_seconds,
+                'model_bytes': model_bytes, 'peak_memory_kb': peak_memory,
+                'memory_growth_kb': peak_memory - start_memory,
+                'test_seconds': test_seconds,
+                'sents_per_sec': num_sents / test_seconds,
+                'words_per_sec': (right + wrong) / test_seconds,
+                'accuracy': right / (right + wrong)})
+        except Exception, e:
+            queue.put({'error': str(e)})
+        
+    def _check_copies(self, corpus_dir, max_entries, queue):
+        """
+        Train out of core on the corpus copies of one step of
+        check_out_of_core(), and put a dict of the results on a queue (or one
+        like {'error': message} if it failed). Runs in a child process
+        
+        :param corpus_dir: string path of the directory holding corpus.txt
+        :param max_entries: most word counts to hold in memory
+        :param queue: multiprocessing.Queue to put the results on
+        """
+        
+        import resource # for peak memory
+        import os # for the corpus size
+        
+        try:
+            start_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            self.tb = Treebank(corpus_dir + '/', ['corpus.txt'])
+            
+            phase_start = time.time()
+            runs = self.train_out_of_core(os.path.join(corpus_dir, \
+                'check.model'), max_entries, corpus_dir)
+            train_seconds = time.time() - phase_start
+            
+            peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            corpus_bytes = os.path.getsize(os.path.join(corpus_dir, \
+                'corpus.txt'))
+            queue.put({'corpus_bytes': corpus_bytes, 'runs': runs,
+                'train_seconds': train_seconds, 'peak_memory_kb': peak_memory,
+                'memory_growth_kb': peak_memory - start_memory})
+        except Exception, e:
+            queue.put({'error': str(e)})
+        
+    def _rates(self, counts):
+        """
+        Return a dict of metrics for a test cycle or run, with the throughput and
+        the unseen and guess rates worked out from its counts
+        
+        :param counts: dict of metric name -> number, including 'sentences',
+            'words', 'unknown', 'guessed' and 'test_seconds'
+        """
+        
+        fields = dict(counts)
+        fields['sents_per_sec'] = counts['sentences'] / \
+            max(counts['test_seconds'], 1e-9)
+        fields['unknown_rate'] = counts['unknown'] / max(counts['words'], 1)
+        fields['guess_rate'] = counts['guessed'] / max(counts['unknown'], 1)
+        
+        return fields
+        
+    def _build_suffixes(self):
+        """
+        Build a trie of the tags rare training words were seen with, by their last
+        few letters, for the guesser to score unseen words with
+        """
+        
+        msg("Building suffix trie...")
+        self.suffixes = SuffixTrie(self.pos_tags, Tagger.start_tag)
+        self.suffixes.add_cfd(self.words_given_pos_upper)
+        msg("done\n")
+        
+    def _add_suffixes(self, counts):
+        """
+        Add words to our suffix trie as they stream past on their way to a model
+        
+        :param counts: iterable of (word, list of (tag, count) tuples)
+        """
+        
+        for (word, tag_counts) in counts:
+            self.suffixes.add_word(word, tag_counts)
+            yield (word, tag_counts)
+        
+    def _coarsen(self):
+        """
+        Merge what we learned in training over Penn Treebank tags into counts over
+        our coarser tag set, keeping a Refiner built from the Penn counts to turn
+        coarse tags back into Penn tags with
+        """
+        
+        msg("Merging counts into %s tags..." % self.tags.name)
+        suffixes = SuffixTrie(self.pos_tags, Tagger.start_tag)
+        suffixes.add_cfd(self.words_given_pos_upper)
+        self.refiner = Refiner(self.tags, self.pos_tags, self.words_given_pos, \
+            self.words_given_pos_upper, suffixes)
+        
+        (self.words_given_pos, self.words_given_pos_upper, \
+            self.pos2_given_pos1) = coarsen_counts(self.tags, Tagger.start_tag, \
+            self.words_given_pos, self.words_given_pos_upper, self.pos2_given_pos1)
+        
+        # keep the coarse tags in order of first appearance, as we found the
+        # Penn ones
+        pos_tags = []
+        for tag in self.pos_tags:
+            if tag != Tagger.start_tag and coarse_tag(self.tags, tag) not in \
+                pos_tags:
+                pos_tags.append(coarse_tag(self.tags, tag))
+        self.pos_tags = pos_tags
+        self._adjust_pos()
+        msg("done\n")
+        
+    def _adjust_pos(self):
+        """
+        Add the start marker tag to our tag list, along with any other tags that
+        need adding
+        """
+        
         # make sure our start marker tag gets added to the POS list
         self.pos_tags.append(Tagger.start_tag)
         
@@ -324,5 +1596,3 @@ class Tagger:
         for tag in self.tags.rare_tags:
             if tag not in self.pos_tags:
                 self.pos_tags.append(tag)
-        
-        return new_sents
\ No newline at end of file
@@ -0,0 +1,277 @@
+######### Tokenizer.py #########
+
+from Model import load_model # for tagging with a model file
+import re # for regular expressions
+
+# abbreviations which don't end a sentence, even when followed by a capital
+abbreviations = frozenset(['Mr.', 'Mrs.', 'Ms.', 'Dr.', 'Prof.', 'Rep.', 'Sen.',
+    'Gov.', 'Gen.', 'Col.', 'Lt.', 'Sgt.', 'Rev.', 'St.', 'Jr.', 'Sr.', 'Inc.',
+    'Corp.', 'Co.', 'Ltd.', 'Bros.', 'No.', 'Nos.', 'vs.', 'etc.', 'Jan.', 'Feb.',
+    'Mar.', 'Apr.', 'Jun.', 'Jul.', 'Aug.', 'Sep.', 'Sept.', 'Oct.', 'Nov.',
+    'Dec.', 'Ala.', 'Ariz.', 'Calif.', 'Colo.', 'Conn.', 'Fla.', 'Ga.', 'Ill.',
+    'Ind.', 'Kan.', 'Ky.', 'La.', 'Md.', 'Mass.', 'Mich.', 'Minn.', 'Miss.', 'Mo.',
+    'Neb.', 'Nev.', 'Okla.', 'Ore.', 'Pa.', 'Tenn.', 'Va.', 'Wash.', 'Wis.'])
+
+# where a sentence may end: sentence-final punctuation and any closing quotes or
+# brackets, followed by space and something which can start a sentence, or else
+# a blank line. The word before the punctuation is captured, to check it isn't an
+# abbreviation
+sent_end_re = re.compile(r"""(\S*?)([.!?]+)["')\]}]*(?=\s+["'`(\[{]*[A-Z0-9])"""
+    r"""|\n[ \t]*\n""")
+
+# initials and abbreviations like U.S, which the check above sees without their
+# final period
+initials_re = re.compile(r'^(?:[A-Za-z]\.)*[A-Za-z]$')
+
+# most characters of a sentence to hold while waiting for it to end. Text going
+# on for longer without a sentence end is cut at a space
+max_sent_size = 65536
+
+# the Penn Treebank tokenization rules, as (compiled regex, replacement) tuples
+# applied in turn to a sentence padded with spaces
+token_rules = [(re.compile(pattern), replacement) for (pattern, replacement) in [
+    # opening quotes
+    (r'^ "', ' `` '),
+    (r'(``)', r' \1 '),
+    (r'([ (\[{<])"', r'\1 `` '),
+    # punctuation
+    (r'([:,])([^\d])', r' \1 \2'),
+    (r'([:,])$', r' \1 '),
+    (r'\.\.\.', ' ... '),
+    (r'[;@#$%&]', r' \g<0> '),
+    (r'([^\.])(\.)([\]\)}>"\']*)\s*$', r'\1 \2\3 '),
+    (r'[?!]', r' \g<0> '),
+    (r"([^'])' ", r"\1 ' "),
+    # brackets and dashes
+    (r'[\]\[\(\)\{\}\<\>]', r' \g<0> '),
+    (r'--', ' -- '),
+    # closing quotes
+    (r'"', " '' "),
+    (r"(\S)('')", r'\1 \2 '),
+    (r"([^' ])('[sS]|'[mM]|'[dD]|') ", r'\1 \2 '),
+    (r"([^' ])('ll|'LL|'re|'RE|'ve|'VE|n't|N'T) ", r'\1 \2 '),
+    # words the treebank splits in two
+    (r"(?i)\b(can)(not)\b", r' \1 \2 '),
+    (r"(?i)\b(d)('ye)\b", r' \1 \2 '),
+    (r"(?i)\b(gim)(me)\b", r' \1 \2 '),
+    (r"(?i)\b(gon)(na)\b", r' \1 \2 '),
+    (r"(?i)\b(got)(ta)\b", r' \1 \2 '),
+    (r"(?i)\b(lem)(me)\b", r' \1 \2 '),
+    (r"(?i)\b(wan)(na)\s", r' \1 \2 '),
+    (r"(?i) ('t)(is|was)\b", r' \1 \2 ')]]
+
+# the HMM object used by a worker process to tag files, set up once by
+# _init_worker() on top of the shared model file
+worker_hmm = None
+
+def tokenize(sent):
+    """
+    Split a sentence of raw text into a list of words, following Penn Treebank
+    conventions: punctuation and brackets are split off, double quotes become ``
+    and '', and clitics like 's and n't are split from their words
+
+    :param sent: string sentence
+    """
+
+    sent = ' ' + sent + ' '
+    for (rule, replacement) in token_rules:
+        sent = rule.sub(replacement, sent)
+
+    return sent.split()
+
+def split_sents(text):
+    """
+    Split raw text into a list of sentences of raw text
+
+    :param text: string text
+    """
+
+    (sents, rest) = _split(text)
+    if rest.strip():
+        sents.append(rest.strip())
+
+    return sents
+
+def iter_sents(f, buffer_size=65536):
+    """
+    Read raw text from a file in large blocks, generating each of its sentences as
+    a list of words as soon as the sentence is complete. A sentence longer than
+    max_sent_size is cut at a space
+
+    :param f: file object to read
+    :param buffer_size: number of bytes to read at a time (default: 65536)
+    """
+
+    rest = ''
+    while True:
+        block = f.read(buffer_size)
+        if not block:
+            break
+
+        # the last sentence in a block may go on in the next one. Only its last
+        # word can hide a sentence end we haven't seen, so only look for one
+        # from there on
+        (sents, rest) = _split(rest + block, _last_word(rest))
+
+        # don't hold on to text which never ends a sentence without limit
+        while len(rest) > max_sent_size:
+            cut = rest.rfind(' ', 0, max_sent_size) + 1 or max_sent_size
+            if rest[:cut].strip():
+                sents.append(rest[:cut].strip())
+            rest = rest[cut:]
+
+        for sent in sents:
+            yield tokenize(sent)
+
+    if rest.strip():
+        yield tokenize(rest.strip())
+
+def iter_files(paths, buffer_size=65536):
+    """
+    Generate each sentence of a number of raw text files in turn, as a list of
+    words
+
+    :param paths: list of string paths of raw text files
+    :param buffer_size: number of bytes to read at a time (default: 65536)
+    """
+
+    for path in paths:
+        f = open(path, 'rb')
+        try:
+            for sent in iter_sents(f, buffer_size):
+                yield sent
+        finally:
+            f.close()
+
+def batches(items, batch_size):
+    """
+    Generate lists of at most batch_size items from an iterable
+
+    :param items: iterable to group
+    :param batch_size: most items in a list
+    """
+
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+
+    if batch:
+        yield batch
+
+def tag_file(hmm, path, batch_size=64):
+    """
+    Tokenize a raw text file and tag its sentences in batches, generating each
+    tagged sentence in turn
+
+    :param hmm: HMM object to tag with
+    :param path: string path of the file
+    :param batch_size: number of sentences to decode at a time (default: 64)
+    """
+
+    f = open(path, 'rb')
+    try:
+        for batch in batches(iter_sents(f), batch_size):
+            for tagged_sent in hmm.tag_iter(batch):
+                yield tagged_sent
+    finally:
+        f.close()
+
+def tag_files(model_path, paths, workers=2, batch_size=64, mode='viterbi',
+    time_budget=None):
+    """
+    Tag raw text files with a model file, generating a tuple like (path, list of
+    tagged sentences) for each file in order. Files are tagged in parallel, one
+    per worker process, with every worker attached to the same shared model
+
+    :param model_path: string path of a model file written by Tagger.save_model()
+    :param paths: list of string paths of raw text files
+    :param workers: number of worker processes. With 0, files are tagged in this
+        process (default: 2)
+    :param batch_size: number of sentences to decode at a time (default: 64)
+    :param mode: 'viterbi' or 'greedy' (default: 'viterbi')
+    :param time_budget: most seconds to spend on a sentence with Viterbi
+        before finishing it greedily (default: None, for no limit)
+    """
+
+    if workers <= 0:
+        _init_worker(model_path, mode, time_budget)
+        for path in paths:
+            yield _tag_document((path, batch_size))
+        return
+
+    from multiprocessing import Pool # only needed with workers
+    pool = Pool(workers, _init_worker, (model_path, mode, time_budget))
+    try:
+        for result in pool.imap(_tag_document, [(path, batch_size) for path in \
+            paths]):
+            yield result
+    finally:
+        pool.close()
+        pool.join()
+
+def _split(text, scan_start=0):
+    """
+    Return a tuple like (list of complete sentences, rest of the text) for raw
+    text which may stop partway through a sentence
+
+    :param text: string text
+    :param scan_start: where in the text to start looking for sentence ends, if
+        there are none before (default: 0)
+    """
+
+    sents = []
+    start = 0
+    for match in sent_end_re.finditer(text, scan_start):
+        # a period after an abbreviation or initials doesn't end the sentence
+        word = match.group(1)
+        if match.group(2) == '.' and word is not None and (word + '.' in \
+            abbreviations or initials_re.match(word)):
+            continue
+
+        sent = text[start:match.end()].strip()
+        if sent:
+            sents.append(sent)
+        start = match.end()
+
+    return (sents, text[start:])
+
+def _last_word(text):
+    """
+    Return where the last word of some text starts. A sentence end which the
+    text stops too soon for sent_end_re to see can only be there or after it, in
+    the spaces, opening quotes and brackets the lookahead ran out of
+
+    :param text: string text
+    """
+
+    end = len(text.rstrip(' \t\n\r\f\v"\'`([{'))
+
+    return max([text.rfind(space, 0, end) for space in ' \t\n\r\f\v']) + 1
+
+def _init_worker(model_path, mode='viterbi', time_budget=None):
+    """
+    Set up a worker process to tag files with a model
+
+    :param model_path: string path of a model file
+    :param mode: 'viterbi' or 'greedy' (default: 'viterbi')
+    :param time_budget: most seconds to spend on a sentence with Viterbi
+        (default: None, for no limit)
+    """
+
+    global worker_hmm
+    worker_hmm = load_model(model_path).new_hmm()
+    worker_hmm.set_decoding(mode, time_budget)
+
+def _tag_document(job):
+    """
+    Tag a raw text file in a worker, and return a tuple like (path, list of tagged
+    sentences)
+
+    :param job: tuple like (string path of the file, batch size)
+    """
+
+    (path, batch_size) = job
+    return (path, list(tag_file(worker_hmm, path, batch_size)))
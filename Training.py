@@ -0,0 +1,581 @@
+######### Training.py #########
+
+from nltk import ConditionalFreqDist, FreqDist # for frequency distributions
+from nltk.tag import str2tuple # for reading tagged words
+from Corpus import SentView # for counting compact corpora by id
+from UniversalTags import coarse_tag # for training on coarser tag sets
+from itertools import groupby, chain # for merging spilled counts and shards
+import heapq # for merging spilled counts
+import os # for spill file paths
+
+# the CompactCorpus a worker process counts sentence ranges of. Each worker gets
+# it once, when the pool starts it, rather than with every shard
+worker_corpus = None
+
+def share_corpus(corpus):
+    """
+    Set up a worker process to count sentence ranges of a corpus with
+    count_ranges()
+
+    :param corpus: CompactCorpus object the ranges are of
+    """
+
+    global worker_corpus
+    worker_corpus = corpus
+
+def count_sents(sents, start_tag):
+    """
+    Count everything training needs from a list of tagged sentences in a single
+    pass, and return a tuple of partial counts like (words_given_pos,
+    words_given_pos_upper, pos2_given_pos1, pos_tags). The first three are dicts
+    of condition -> dict of sample -> count, and pos_tags lists the tags seen in
+    order of first appearance.
+
+    Each sentence is counted as if it began with a (start_tag, start_tag) marker,
+    without copying it to add one.
+
+    :param sents: iterable of tagged sentences, or a SentView of a CompactCorpus
+    :param start_tag: start tag used to mark sentence beginning
+    """
+
+    # count compact corpora by word and tag id instead
+    if isinstance(sents, SentView):
+        return count_view(sents, start_tag)
+
+    words_given_pos = {start_tag: {}}
+    words_given_pos_upper = {start_tag: {}}
+    pos2_given_pos1 = {}
+    pos_tags = [] # tags in order of first appearance
+    num_sents = 0 # number of sentences, i.e. of start markers
+
+    for sent in sents:
+        num_sents += 1
+        pos1 = start_tag
+
+        for (word, pos) in sent:
+            # find (or start) the rows for this tag
+            if pos not in words_given_pos:
+                words_given_pos[pos] = {}
+                words_given_pos_upper[pos] = {}
+                pos_tags.append(pos)
+            if pos1 not in pos2_given_pos1:
+                pos2_given_pos1[pos1] = {}
+            lower_row = words_given_pos[pos]
+            upper_row = words_given_pos_upper[pos]
+            pos_row = pos2_given_pos1[pos1]
+
+            # count P(Wi|Ck) for the lowercase and original word, and P(Ci+1|Ci)
+            lower = word.lower()
+            lower_row[lower] = lower_row.get(lower, 0) + 1
+            upper_row[word] = upper_row.get(word, 0) + 1
+            pos_row[pos] = pos_row.get(pos, 0) + 1
+
+            pos1 = pos
+        # end words loop
+    # end sentences loop
+
+    # the start marker appears once in every sentence
+    if num_sents > 0:
+        words_given_pos[start_tag][start_tag] = num_sents
+        words_given_pos_upper[start_tag][start_tag] = num_sents
+
+    return (words_given_pos, words_given_pos_upper, pos2_given_pos1, pos_tags)
+
+def count_view(view, start_tag):
+    """
+    Count what count_sents() counts from a SentView of a CompactCorpus, working on
+    word and tag ids so that no sentence is built as a list, and every distinct
+    word is only converted to lowercase once. Return the same tuple as
+    count_sents()
+
+    :param view: SentView of tagged sentences
+    :param start_tag: start tag used to mark sentence beginning
+    """
+
+    corpus = view.corpus
+    token_words = corpus.token_words # for speed
+    token_tags = corpus.token_tags
+    offsets = corpus.offsets
+
+    # word id -> count for each tag id, and (tag id, tag id) -> count, where a
+    # tag id of -1 is the start marker
+    word_counts = [{} for pos in corpus.tags]
+    pos_counts = {}
+    first_seen = [] # tag ids in order of first appearance
+    num_sents = 0
+
+    for i in view.indices():
+        num_sents += 1
+        pos1 = -1
+        for k in xrange(offsets[i], offsets[i + 1]):
+            pos = token_tags[k]
+            row = word_counts[pos]
+            if not row:
+                first_seen.append(pos)
+            word = token_words[k]
+            row[word] = row.get(word, 0) + 1
+            pair = (pos1, pos)
+            pos_counts[pair] = pos_counts.get(pair, 0) + 1
+            pos1 = pos
+        # end words loop
+    # end sentences loop
+
+    # turn the ids back into words and tags
+    words = corpus.words
+    tags = corpus.tags
+    lowers = {} # word id -> lowercase word
+    words_given_pos = {start_tag: {}}
+    words_given_pos_upper = {start_tag: {}}
+    for pos in first_seen:
+        lower_row = {}
+        upper_row = {}
+        for (word, count) in word_counts[pos].iteritems():
+            if word not in lowers:
+                lowers[word] = words[word].lower()
+            lower = lowers[word]
+            lower_row[lower] = lower_row.get(lower, 0) + count
+            upper_row[words[word]] = count
+        words_given_pos[tags[pos]] = lower_row
+        words_given_pos_upper[tags[pos]] = upper_row
+
+    pos2_given_pos1 = {}
+    for ((pos1, pos2), count) in pos_counts.iteritems():
+        pos1 = start_tag if pos1 == -1 else tags[pos1]
+        pos2_given_pos1.setdefault(pos1, {})[tags[pos2]] = count
+
+    # the start marker appears once in every sentence
+    if num_sents > 0:
+        words_given_pos[start_tag][start_tag] = num_sents
+        words_given_pos_upper[start_tag][start_tag] = num_sents
+
+    return (words_given_pos, words_given_pos_upper, pos2_given_pos1, \
+        [tags[pos] for pos in first_seen])
+
+def count_to_runs(sents, start_tag, spill_dir, max_entries=1000000):
+    """
+    Count what count_sents() counts, but keep at most about max_entries word
+    counts in memory, spilling them to sorted run files whenever there are more.
+    Return a tuple like (lower runs, upper runs, tag totals, pos2_given_pos1,
+    pos_tags), where the runs are lists of file paths to pass to merge_runs(),
+    tag totals is a dict of tag -> number of words seen with it, and
+    pos2_given_pos1 is a ConditionalFreqDist (the tag bigram table is small
+    enough to always keep in memory)
+
+    :param sents: iterable of tagged sentences, e.g. streamed from disk
+    :param start_tag: start tag used to mark sentence beginning
+    :param spill_dir: string path of a directory to write run files to
+    :param max_entries: most word counts to hold in memory (default: 1000000)
+    """
+
+    lower_counts = {} # (word, tag) -> count for words converted to lowercase
+    upper_counts = {} # (word, tag) -> count for words in original case
+    lower_runs = []
+    upper_runs = []
+    tag_totals = {start_tag: 0}
+    pos2_given_pos1 = ConditionalFreqDist()
+    pos_tags = [] # tags in order of first appearance
+
+    for sent in sents:
+        pos1 = start_tag
+        tag_totals[start_tag] += 1
+
+        for (word, pos) in sent:
+            if pos not in tag_totals:
+                tag_totals[pos] = 0
+                pos_tags.append(pos)
+            tag_totals[pos] += 1
+
+            lower = (word.lower(), pos)
+            lower_counts[lower] = lower_counts.get(lower, 0) + 1
+            upper = (word, pos)
+            upper_counts[upper] = upper_counts.get(upper, 0) + 1
+            pos2_given_pos1[pos1][pos] += 1
+
+            pos1 = pos
+        # end words loop
+
+        # spill our counts to disk once we are holding too many of them
+        if len(lower_counts) + len(upper_counts) > max_entries:
+            lower_runs.append(_spill(lower_counts, spill_dir, len(lower_runs), \
+                'lower'))
+            upper_runs.append(_spill(upper_counts, spill_dir, len(upper_runs), \
+                'upper'))
+            lower_counts = {}
+            upper_counts = {}
+    # end sentences loop
+
+    # the start marker appears once in every sentence
+    if tag_totals[start_tag] > 0:
+        lower_counts[(start_tag, start_tag)] = tag_totals[start_tag]
+        upper_counts[(start_tag, start_tag)] = tag_totals[start_tag]
+
+    # spill whatever is left, so all counts can be merged the same way
+    lower_runs.append(_spill(lower_counts, spill_dir, len(lower_runs), 'lower'))
+    upper_runs.append(_spill(upper_counts, spill_dir, len(upper_runs), 'upper'))
+
+    return (lower_runs, upper_runs, tag_totals, pos2_given_pos1, pos_tags)
+
+def merge_runs(runs):
+    """
+    Merge sorted run files written by count_to_runs(), generating a tuple like
+    (word, list of (tag, count) tuples) for each word, in utf-8 word order
+
+    :param runs: list of run file paths
+    """
+
+    merged = heapq.merge(*[_read_run(run) for run in runs])
+
+    # counts for the same word are now next to each other, and so are counts for
+    # the same (word, tag) pair within them
+    for (word, word_counts) in groupby(merged, lambda entry: entry[0]):
+        tag_counts = []
+        for (pos, pos_counts) in groupby(word_counts, lambda entry: entry[1]):
+            tag_counts.append((pos.decode('utf-8'), \
+                sum([entry[2] for entry in pos_counts])))
+        yield (word.decode('utf-8'), tag_counts)
+
+def read_tagged_sents(path, start=0, end=None):
+    """
+    Generate the tagged sentences of a corpus file with one sentence per line,
+    as TaggedCorpusReader reads them, but a line at a time, so memory doesn't
+    grow with the size of the file. Only the sentences on lines starting within
+    the byte range [start, end) are read, so a file can be split into ranges
+    which each hold whole sentences
+
+    :param path: string path of the corpus file
+    :param start: byte offset to start at (default: 0)
+    :param end: byte offset to stop before (default: None, for the end of the
+        file)
+    """
+
+    f = open(path, 'rb')
+    try:
+        # the line running over start belongs to the range before ours
+        position = start
+        if start > 0:
+            f.seek(start - 1)
+            position += len(f.readline()) - 1
+
+        while end is None or position < end:
+            line = f.readline()
+            if not line:
+                break
+            position += len(line)
+
+            # lines of nothing but whitespace separate paragraphs
+            words = line.decode('utf-8').split()
+            if words:
+                yield [str2tuple(word) for word in words]
+    finally:
+        f.close()
+
+def count_files(shard):
+    """
+    Read a shard of corpus files, or byte ranges of them, and count everything
+    training needs from it. Return the same tuple as count_sents()
+
+    :param shard: tuple like (corpus_path, list of (corpus file, start, end)
+        tuples as returned by split_files(), start_tag)
+    """
+
+    (corpus_path, pieces, start_tag) = shard
+
+    return count_sents(chain.from_iterable([read_tagged_sents(\
+        os.path.join(corpus_path, name), start, end) for (name, start, end) in \
+        pieces]), start_tag)
+
+def count_shard(shard):
+    """
+    Count everything training needs from a shard of sentences. Return the same
+    tuple as count_sents()
+
+    :param shard: tuple like (list of tagged sentences, start_tag)
+    """
+
+    return count_sents(shard[0], shard[1])
+
+def count_ranges(shard):
+    """
+    Count everything training needs from ranges of sentences of the corpus given
+    to share_corpus(). Return the same tuple as count_sents()
+
+    :param shard: tuple like (list of (start, end) sentence index ranges,
+        start_tag)
+    """
+
+    return count_view(SentView(worker_corpus, shard[0]), shard[1])
+
+def split(items, num_shards):
+    """
+    Split a list into at most num_shards contiguous lists of about the same size
+
+    :param items: list to split
+    :param num_shards: number of lists to split into
+    """
+
+    num_shards = max(min(num_shards, len(items)), 1)
+    size = len(items) / float(num_shards)
+    shards = [items[int(round(i * size)):int(round((i + 1) * size))] for i in \
+        range(num_shards)]
+
+    # slices of a SentView are cheap views themselves (though pickling one
+    # pickles its whole corpus, so hand workers their ranges to count_ranges()
+    # instead), but make sure anything else is a plain list we can hand to
+    # another process
+    if isinstance(items, SentView):
+        return shards
+    return [list(shard) for shard in shards]
+
+def split_files(corpus_path, corpus_files, num_shards):
+    """
+    Split corpus files into at most num_shards contiguous shards of about the
+    same number of bytes, cutting a file into byte ranges where a shard ends
+    inside it, so even a single file is shared out. Return a list of shards, each
+    a list of (corpus file, start, end) tuples for read_tagged_sents()
+
+    :param corpus_path: path to corpus files
+    :param corpus_files: list of filenames for corpus text
+    :param num_shards: number of shards to split into
+    """
+
+    sizes = [os.path.getsize(os.path.join(corpus_path, name)) for name in \
+        corpus_files]
+    total = sum(sizes)
+    num_shards = max(min(num_shards, total), 1)
+
+    # cut the files, laid end to end, at evenly spaced offsets
+    cuts = [int(round(i * total / float(num_shards))) for i in \
+        range(num_shards + 1)]
+    shards = []
+    for i in range(num_shards):
+        shard = []
+        file_start = 0
+        for (name, size) in zip(corpus_files, sizes):
+            start = max(cuts[i] - file_start, 0)
+            end = min(cuts[i + 1] - file_start, size)
+            if start < end:
+                shard.append((name, start, end))
+            file_start += size
+        shards.append(shard)
+
+    return shards
+
+def count_parallel(counter, shards, workers, initializer=None, initargs=()):
+    """
+    Count shards across a pool of worker processes, and return a list of their
+    partial counts in the order of the shards
+
+    :param counter: function to count one shard with, e.g. count_shard
+    :param shards: list of arguments to pass to counter
+    :param workers: number of worker processes
+    :param initializer: function to set up each worker process with, e.g.
+        share_corpus. Its arguments reach the workers when they are forked,
+        without being pickled (default: None)
+    :param initargs: tuple of arguments to pass to initializer (default: ())
+    """
+
+    # don't bother starting processes for a single shard
+    if workers <= 1 or len(shards) <= 1:
+        if initializer is not None:
+            initializer(*initargs)
+        return [counter(shard) for shard in shards]
+
+    from multiprocessing import Pool # only needed with workers
+    pool = Pool(min(workers, len(shards)), initializer, initargs)
+    try:
+        return pool.map(counter, shards)
+    finally:
+        pool.close()
+        pool.join()
+
+def merge_counts(partials):
+    """
+    Merge partial counts into nltk ConditionalFreqDist objects, and return a tuple
+    like (words_given_pos, words_given_pos_upper, pos2_given_pos1, pos_tags)
+
+    :param partials: list of tuples returned by count_sents()
+    """
+
+    words_given_pos = ConditionalFreqDist()
+    words_given_pos_upper = ConditionalFreqDist()
+    pos2_given_pos1 = ConditionalFreqDist()
+    pos_tags = []
+    seen_tags = set()
+
+    for (lower, upper, pos2_pos1, tags) in partials:
+        for (cfd, counts) in [(words_given_pos, lower), \
+            (words_given_pos_upper, upper), (pos2_given_pos1, pos2_pos1)]:
+            for (cond, row) in counts.iteritems():
+                cfd[cond].update(row)
+
+        # keep tags in order of first appearance across the shards
+        for tag in tags:
+            if tag not in seen_tags:
+                seen_tags.add(tag)
+                pos_tags.append(tag)
+
+    return (words_given_pos, words_given_pos_upper, pos2_given_pos1, pos_tags)
+
+def coarsen_counts(tags, start_tag, words_given_pos, words_given_pos_upper,
+    pos2_given_pos1):
+    """
+    Return a tuple like (words_given_pos, words_given_pos_upper, pos2_given_pos1)
+    of new ConditionalFreqDists holding trained counts with their Penn Treebank
+    tags replaced by the tags of a coarser tag set, adding together the counts
+    of tags which become the same. This gives the same counts as training on a
+    corpus tagged with the coarse tags would
+
+    :param tags: tag set class, e.g. UniversalTags
+    :param start_tag: start tag used to mark sentence beginning, which is kept
+    :param words_given_pos: nltk.ConditionalFreqDist for P(Wi|Ck) with all words
+        converted to lowercase
+    :param words_given_pos_upper: nltk.ConditionalFreqDist for P(Wi|Ck) with
+        words left in original capitalization
+    :param pos2_given_pos1: nltk.ConditionalFreqDist for P(Ci+1|Ci)
+    """
+
+    to_coarse = lambda tag: tag if tag == start_tag else coarse_tag(tags, tag)
+
+    coarse_cfds = []
+    for (cfd, tag_samples) in [(words_given_pos, False), \
+        (words_given_pos_upper, False), (pos2_given_pos1, True)]:
+        coarse = ConditionalFreqDist()
+        for cond in cfd.conditions():
+            row = coarse[to_coarse(cond)]
+            for (sample, count) in cfd[cond].iteritems():
+                row[to_coarse(sample) if tag_samples else sample] += count
+        coarse_cfds.append(coarse)
+
+    return tuple(coarse_cfds)
+
+def copy_counts(cfd):
+    """
+    Return a new ConditionalFreqDist sharing the rows of another, so rows can be
+    swapped for changed copies without changing the original
+
+    :param cfd: nltk.ConditionalFreqDist to copy
+    """
+
+    copy = ConditionalFreqDist()
+    for cond in cfd.conditions():
+        copy[cond] = cfd[cond]
+
+    return copy
+
+def prune_counts(cfd, min_count):
+    """
+    Return a new ConditionalFreqDist holding only the words of an emission table
+    seen at least min_count times in all, leaving the rest to be tagged as unseen
+    words. Each tag keeps the total count it had, so the words left have the
+    same P(Wi|Ck) as before
+
+    :param cfd: nltk.ConditionalFreqDist for P(Wi|Ck)
+    :param min_count: fewest times a word must have been seen to be kept
+    """
+
+    totals = {} # word -> number of times seen with any tag
+    for cond in cfd.conditions():
+        for (word, count) in cfd[cond].iteritems():
+            totals[word] = totals.get(word, 0) + count
+
+    pruned = ConditionalFreqDist()
+    for cond in cfd.conditions():
+        row = PrunedFreqDist()
+        for (word, count) in cfd[cond].iteritems():
+            if totals[word] >= min_count:
+                row[word] = count
+        row.pruned = cfd[cond].N() - sum(row.itervalues())
+        pruned[cond] = row
+
+    return pruned
+
+def prune_stream(counts, min_count):
+    """
+    Generate the words of a stream of counts for write_model_from_counts() seen
+    at least min_count times in all, as prune_counts() keeps them
+
+    :param counts: iterable of (word, list of (tag, count) tuples)
+    :param min_count: fewest times a word must have been seen to be kept
+    """
+
+    for (word, tag_counts) in counts:
+        if sum([count for (tag, count) in tag_counts]) >= min_count:
+            yield (word, tag_counts)
+
+def _spill(counts, spill_dir, run_number, name):
+    """
+    Write word counts to a run file sorted by utf-8 word and tag, and return its
+    path
+
+    :param counts: dict of (word, tag) -> count
+    :param spill_dir: string path of the directory to write to
+    :param run_number: number of the run, for naming the file
+    :param name: string name of the table the counts are for
+    """
+
+    path = os.path.join(spill_dir, '%s-%06d.run' % (name, run_number))
+    lines = sorted([(_encode(word), _encode(pos), count) for ((word, pos), count) \
+        in counts.iteritems()])
+
+    f = open(path, 'wb')
+    f.writelines(["%s\t%s\t%d\n" % line for line in lines])
+    f.close()
+
+    return path
+
+def _read_run(path):
+    """
+    Generate (utf-8 word, utf-8 tag, count) tuples from a run file
+
+    :param path: string path of the run file
+    """
+
+    f = open(path, 'rb')
+    for line in f:
+        (word, pos, count) = line.rstrip('\n').split('\t')
+        yield (word, pos, int(count))
+    f.close()
+
+def _encode(word):
+    """
+    Return a word as a utf-8 byte string
+
+    :param word: string or unicode word
+    """
+
+    if isinstance(word, unicode):
+        return word.encode('utf-8')
+    return word
+
+
+class PrunedFreqDist(FreqDist):
+    """
+    A FreqDist left by prune_counts(), which still counts the samples pruned from
+    it in its total, so the frequencies of the samples left don't change
+    """
+
+    def __init__(self, samples=None, pruned=0):
+        """
+        Construct a PrunedFreqDist object
+
+        :param samples: samples to count (default: None)
+        :param pruned: total count of the samples pruned (default: 0)
+        """
+
+        FreqDist.__init__(self, samples)
+        self.pruned = pruned
+
+    def N(self):
+        "Return the total count of the samples, including the pruned ones"
+
+        return FreqDist.N(self) + self.pruned
+
+    def copy(self):
+        "Return a copy of the distribution, keeping the pruned count"
+
+        return PrunedFreqDist(self, self.pruned)
+
+    def __reduce__(self):
+        "Keep the pruned count when pickled, e.g. for worker processes"
+
+        return (PrunedFreqDist, (dict(self), self.pruned))
@@ -4,28 +4,46 @@ from __future__ import division # use float division
 import nltk # import the Natural Language Toolkit for parsing the Penn Treebank
 from Helper import msg # for logging
 from nltk.corpus.reader import TaggedCorpusReader # use NLTK's corpus reading tools
+from Corpus import CompactCorpus # for holding the corpus compactly
+import hashlib # for fingerprinting the corpus files
 
 class Treebank:
     "A class for parsing a tagged corpus for training and testing"
     
-    def __init__(self, corpus_path, corpus_files):
+    def __init__(self, corpus_path, corpus_files, compact=False):
         """
         Construct a Treebank object
         
         :param corpus_path: path to corpus files
         :param corpus_files: list of filenames for corpus text
+        :param compact: whether to read the whole corpus into a CompactCorpus up
+            front, rather than reading sentences from disk as they are needed
+            (default: False)
         """
 
         msg("Importing treebank...")
         
+        # remember where the corpus is, so it can be read again in shards
+        self.corpus_path = corpus_path
+        self.corpus_files = corpus_files
+        
         # get a corpus reader object for our corpus using NLTK
         treebank = TaggedCorpusReader(corpus_path, corpus_files)
         
-        # get all sentences from corpus in a tagged format
-        self.tagged_sents = treebank.tagged_sents()
+        # if we're compact, read the corpus once and keep it as arrays of ids
+        if compact:
+            self.corpus = CompactCorpus(treebank.tagged_sents())
+            self.tagged_sents = self.corpus.tagged_sents()
+            self.sents = self.corpus.sents()
         
-        # get all sentences from corpus in an untagged format
-        self.sents = treebank.sents()
+        else:
+            self.corpus = None
+            
+            # get all sentences from corpus in a tagged format
+            self.tagged_sents = treebank.tagged_sents()
+            
+            # get all sentences from corpus in an untagged format
+            self.sents = treebank.sents()
         
         msg("done!\n")
         
@@ -68,6 +86,12 @@ class Treebank:
         """
         
         msg("Getting POS tag list...")
+        
+        # a compact corpus already knows its tags, in order of appearance
+        if self.corpus is not None:
+            msg("done\n")
+            return list(self.corpus.tags)
+        
         tags = []
         
         # loop through sentences
@@ -84,6 +108,70 @@ class Treebank:
         
         return tags
         
+    def corpus_hash(self):
+        """
+        Return a hex digest of the names and contents of the corpus files, which
+        changes whenever the corpus does
+        """
+        
+        digest = hashlib.sha1()
+        for name in self.corpus_files:
+            digest.update(name + "\0")
+            f = open(self.corpus_path + name, 'rb')
+            for block in iter(lambda: f.read(1048576), ''):
+                digest.update(block)
+            f.close()
+            digest.update("\0")
+        
+        return digest.hexdigest()
+        
+    def iter_testing_sents(self, test_pct, start_test_pct):
+        """
+        Generate (untagged sentence, tagged sentence) tuples for testing one at a
+        time, rather than slicing the whole range out of the corpus
+        
+        :param test_pct: what pct of the corpus to retrieve
+        :param start_test_pct: where in the corpus to begin retrieval
+        """
+        
+        total_sents = len(self.tagged_sents)
+        first_sent_index = self._indices_by_pct(test_pct, start_test_pct)[0]
+        
+        for i in range(self.num_testing_sents(test_pct, start_test_pct)):
+            # wrap around the 0% corner the same way _sents_by_range does
+            index = (first_sent_index + i) % total_sents
+            yield (self.sents[index], self.tagged_sents[index])
+            
+    def num_testing_sents(self, test_pct, start_test_pct):
+        """
+        Return how many sentences are in a range of the corpus used for testing
+        
+        :param test_pct: what pct of the corpus the range covers
+        :param start_test_pct: where in the corpus the range begins
+        """
+        
+        (first_sent_index, last_sent_index) = self._indices_by_pct(test_pct, \
+            start_test_pct)
+        
+        return (last_sent_index - first_sent_index) % len(self.tagged_sents) + 1
+        
+    def testing_sent(self, test_pct, start_test_pct, index):
+        """
+        Get a single tagged sentence from a testing range without slicing the
+        whole range out of the corpus
+        
+        :param test_pct: what pct of the corpus the testing range covers
+        :param start_test_pct: where in the corpus the testing range begins
+        :param index: index of the sentence within the testing range
+        """
+        
+        first_sent_index = self._indices_by_pct(test_pct, start_test_pct)[0]
+        
+        # the range may go around the 0% corner, so wrap the index the same way
+        # _sents_by_range does
+        return self.tagged_sents[(first_sent_index + index) % \
+            len(self.tagged_sents)]
+    
     
     ######### `PRIVATE' FUNCTIONS #########
     
@@ -102,7 +190,22 @@ class Treebank:
         else:
             tb_sents = self.sents
         
-        total_sents = len(tb_sents)
+        # work out which sentences the percentages correspond to
+        (first_sent_index, last_sent_index) = self._indices_by_pct(pct, start_pct)
+             
+        # retrieve the sentences based on the indices we calculated
+        return self._sents_by_range(tb_sents, first_sent_index, last_sent_index)
+        
+    def _indices_by_pct(self, pct, start_pct):
+        """
+        Return a tuple of the first and last sentence index for a percentage of
+        the corpus
+        
+        :param pct: what pct of the corpus to cover
+        :param start_pct: what point in the corpus to begin
+        """
+        
+        total_sents = len(self.tagged_sents)
         last_index = total_sents - 1
         end_pct = pct + start_pct
         
@@ -122,8 +225,7 @@ class Treebank:
         if last_sent_index == last_index - 1:
              last_sent_index = last_index
              
-        # retrieve the sentences based on the indices we calculated
-        return self._sents_by_range(tb_sents, first_sent_index, last_sent_index)
+        return (first_sent_index, last_sent_index)
         
     def _sents_by_range(self, tb_sents, first_sent_index, last_sent_index):
         """
@@ -0,0 +1,79 @@
+######## UniversalTags.py ########
+
+from PennTags import PennTags # for looking tag sets up by name
+
+def coarse_tag(tags, tag):
+    """
+    Return the tag of a tag set which a Penn Treebank tag belongs to
+
+    :param tags: tag set class, e.g. UniversalTags
+    :param tag: string Penn Treebank tag
+    """
+
+    if tags.from_penn is None:
+        return tag
+    return tags.from_penn.get(tag, tags.unknown)
+
+def coarse_sent(tags, tagged_sent):
+    """
+    Return a tagged sentence with its Penn Treebank tags replaced by those of a
+    tag set
+
+    :param tags: tag set class, e.g. UniversalTags
+    :param tagged_sent: list of (word, tag) tuples
+    """
+
+    if tags.from_penn is None:
+        return tagged_sent
+    return [(word, coarse_tag(tags, tag)) for (word, tag) in tagged_sent]
+
+
+class UniversalTags:
+    """
+    A class to hold information about the coarse universal tag set of Petrov,
+    Das and McDonald (2012), whose 12 tags each stand for a group of Penn
+    Treebank tags. Tagging with it decodes over about a quarter as many tags
+    """
+    
+    ######### CLASS VARIABLES #########
+
+    name = 'universal' # what models and the command line call this tag set
+    
+    # the universal tag for each Penn Treebank tag. Tags missing from here, like
+    # the joined tags of ambiguous words, are X
+    from_penn = {'!': '.', '#': '.', '$': '.', "''": '.', '(': '.', ')': '.',
+        ',': '.', '-LRB-': '.', '-RRB-': '.', '.': '.', ':': '.', '?': '.',
+        '``': '.', '--': '.', 'CC': 'CONJ', 'CD': 'NUM', 'DT': 'DET',
+        'EX': 'DET', 'PDT': 'DET', 'WDT': 'DET', 'FW': 'X', 'LS': 'X', 'SYM': 'X',
+        'UH': 'X', 'UNK': 'X', 'IN': 'ADP', 'JJ': 'ADJ', 'JJR': 'ADJ',
+        'JJS': 'ADJ', 'MD': 'VERB', 'VB': 'VERB', 'VBD': 'VERB', 'VBG': 'VERB',
+        'VBN': 'VERB', 'VBP': 'VERB', 'VBZ': 'VERB', 'NN': 'NOUN', 'NNS': 'NOUN',
+        'NNP': 'NOUN', 'NNPS': 'NOUN', 'POS': 'PRT', 'RP': 'PRT', 'TO': 'PRT',
+        'PRP': 'PRON', 'PRP$': 'PRON', 'WP': 'PRON', 'WP$': 'PRON', 'RB': 'ADV',
+        'RBR': 'ADV', 'RBS': 'ADV', 'WRB': 'ADV'}
+    
+    # the tags the guesser reaches for, as in PennTags
+    proper_noun = 'NOUN'
+    common_noun = 'NOUN'
+    pl_proper_noun = 'NOUN'
+    pl_common_noun = 'NOUN'
+    verb_pp = 'VERB'
+    verb = 'VERB'
+    det = 'DET'
+    cardinal = 'NUM'
+    adv = 'ADV'
+    gerund = 'VERB'
+    adj = 'ADJ'
+    prep = 'ADP'
+    comp_adv = 'ADV'
+    comp_adj = 'ADJ'
+    verb_3s = 'VERB'
+    unknown = 'X'
+    default = 'NOUN'
+    default_upper = 'NOUN'
+    rare_tags = ['X'] # tags to add to POS list before testing
+    proper_nouns = [] # proper nouns are just nouns, so lowercase words can be too
+
+
+# every tag set, by name
+tag_sets = {PennTags.name: PennTags, UniversalTags.name: UniversalTags}
@@ -0,0 +1,98 @@
+######### Vocabulary.py #########
+
+from array import array # for packing the vocabulary
+import struct # for reading the vocabulary in place
+
+def pack_vocabulary(words):
+    """
+    Pack a sorted list of words into a list of (section name, packed string)
+    tuples for a model file. Word ids are positions in the list
+
+    :param words: list of distinct utf-8 words, sorted
+    """
+
+    blob = array('c')
+    offsets = array('I', [0])
+    for word in words:
+        blob.fromstring(word)
+        offsets.append(len(blob))
+
+    return [('vocab_words', blob.tostring()),
+        ('vocab_offsets', offsets.tostring())]
+
+def encode(word):
+    """
+    Return a word as a utf-8 byte string
+
+    :param word: string or unicode word
+    """
+
+    if isinstance(word, unicode):
+        return word.encode('utf-8')
+    return word
+
+
+class Vocabulary:
+    """
+    A class for looking words up in a packed vocabulary, read in place from a
+    buffer. Every surface form is stored once, in sorted order, and its id is its
+    position in that order
+    """
+
+    def __init__(self, buf, sections):
+        """
+        Construct a Vocabulary object
+
+        :param buf: string or mmap holding the packed vocabulary
+        :param sections: dict of section name -> (offset, length) in buf
+        """
+
+        self.buf = buf
+        self.words_offset = sections['vocab_words'][0]
+        (self.offsets_offset, length) = sections['vocab_offsets']
+        self.num_words = length // 4 - 1
+
+    ######### `PUBLIC' FUNCTIONS #########
+
+    def __len__(self):
+        """
+        Return the number of words in the vocabulary
+        """
+
+        return self.num_words
+
+    def word_id(self, word):
+        """
+        Binary search the vocabulary for a word, and return its id or None if it is
+        not there
+
+        :param word: string word
+        """
+
+        key = encode(word)
+        lo = 0
+        hi = self.num_words
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._word(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        if lo < self.num_words and self._word(lo) == key:
+            return lo
+
+        return None
+
+    ######### `PRIVATE' FUNCTIONS #########
+
+    def _word(self, word_id):
+        """
+        Return the utf-8 bytes of the word with a given id
+
+        :param word_id: id of the word
+        """
+
+        (start, end) = struct.unpack_from('<2I', self.buf, \
+            self.offsets_offset + 4 * word_id)
+        return self.buf[self.words_offset + start:self.words_offset + end]
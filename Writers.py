@@ -0,0 +1,291 @@
+######### Writers.py #########
+
+import struct # for the binary format
+import json # for the JSON lines format
+import sys # for writing to stdout
+
+# marks the start of a binary tagged file
+binary_magic = 'HMMTAGS1'
+
+def penn_line(tagged_sent):
+    """
+    Return a tagged sentence as space-separated word/TAG pairs
+
+    :param tagged_sent: list of (word, tag) tuples
+    """
+
+    return ' '.join(["%s/%s" % tagged_word for tagged_word in tagged_sent])
+
+def open_writer(path, format='penn', compression=None, buffer_size=1048576):
+    """
+    Return a Writer for tagged sentences in the given format
+
+    :param path: string path to write to, or '-' for stdout
+    :param format: 'penn', 'conll', 'json' or 'binary' (default: 'penn')
+    :param compression: 'gzip', 'bz2' or None. If None, it is guessed from a .gz
+        or .bz2 path (default: None)
+    :param buffer_size: number of bytes to collect before each write (default:
+        1048576)
+    """
+
+    if format not in formats:
+        raise Exception("Unknown output format %s!" % format)
+
+    if compression is None:
+        if path.endswith('.gz'):
+            compression = 'gzip'
+        elif path.endswith('.bz2'):
+            compression = 'bz2'
+
+    # open our file, compressing what we write to it if need be
+    if compression == 'bz2':
+        import bz2 # only needed for compressed output
+        if path == '-':
+            raise Exception("bz2 output can't go to stdout!")
+        f = bz2.BZ2File(path, 'wb')
+    elif compression == 'gzip':
+        import gzip # only needed for compressed output
+        if path == '-':
+            f = gzip.GzipFile(fileobj=sys.stdout, mode='wb')
+        else:
+            f = gzip.open(path, 'wb')
+    elif compression is not None:
+        raise Exception("Unknown compression %s!" % compression)
+    elif path == '-':
+        f = sys.stdout
+    else:
+        f = open(path, 'wb')
+
+    return formats[format](f, buffer_size, path != '-' or compression is not None)
+
+def read_binary(f):
+    """
+    Generate each tagged sentence, as a list of (word, tag) tuples, from a file
+    written by a BinaryWriter
+
+    :param f: file object to read
+    """
+
+    if f.read(len(binary_magic)) != binary_magic:
+        raise Exception("Not a binary tagged file!")
+
+    words = []
+    tags = []
+    while True:
+        kind = f.read(1)
+        if not kind:
+            return
+        length = struct.unpack('<I', f.read(4))[0]
+        if kind == 'W':
+            words.append(f.read(length))
+        elif kind == 'T':
+            tags.append(f.read(length))
+        else:
+            word_ids = struct.unpack('<%dI' % length, f.read(4 * length))
+            tag_ids = struct.unpack('<%dB' % length, f.read(length))
+            yield [(words[word_ids[i]], tags[tag_ids[i]]) for i in range(length)]
+
+
+class Writer:
+    """
+    A base class for writing tagged sentences to a file, collecting them into a
+    large buffer so the file sees a few big writes instead of one per sentence.
+    Subclasses turn sentences into strings with _format()
+    """
+
+    def __init__(self, f, buffer_size=1048576, close_file=True):
+        """
+        Construct a Writer object
+
+        :param f: file object to write to
+        :param buffer_size: number of bytes to collect before each write (default:
+            1048576)
+        :param close_file: whether close() should close f too (default: True)
+        """
+
+        self.f = f
+        self.buffer_size = buffer_size
+        self.close_file = close_file
+        self.parts = [] # strings waiting to be written
+        self.size = 0 # their total length
+        self.num_sents = 0
+
+    ######### `PUBLIC' FUNCTIONS #########
+
+    def write_sent(self, tagged_sent):
+        """
+        Write a tagged sentence
+
+        :param tagged_sent: list of (word, tag) tuples
+        """
+
+        data = self._format(tagged_sent)
+        self.parts.append(data)
+        self.size += len(data)
+        self.num_sents += 1
+        if self.size >= self.buffer_size:
+            self.flush()
+
+    def write_sents(self, tagged_sents):
+        """
+        Write tagged sentences as they are pulled from an iterable, e.g. from
+        HMM.tag_iter(), and return how many were written
+
+        :param tagged_sents: iterable of tagged sentences
+        """
+
+        count = 0
+        for tagged_sent in tagged_sents:
+            self.write_sent(tagged_sent)
+            count += 1
+
+        return count
+
+    def flush(self):
+        """
+        Write out everything collected so far
+        """
+
+        if self.parts:
+            self.f.write(''.join(self.parts))
+            self.parts = []
+            self.size = 0
+
+        # bz2 files in particular can't be flushed
+        if hasattr(self.f, 'flush'):
+            self.f.flush()
+
+    def close(self):
+        """
+        Write out everything collected so far and close the file
+        """
+
+        self.flush()
+        if self.close_file:
+            self.f.close()
+
+    ######### `PRIVATE' FUNCTIONS #########
+
+    def _format(self, tagged_sent):
+        """
+        Return a tagged sentence as a string to write
+
+        :param tagged_sent: list of (word, tag) tuples
+        """
+
+        raise NotImplementedError
+
+
+class PennWriter(Writer):
+    "A class for writing tagged sentences as lines of word/TAG pairs"
+
+    def _format(self, tagged_sent):
+        """
+        Return a tagged sentence as a string to write
+
+        :param tagged_sent: list of (word, tag) tuples
+        """
+
+        return penn_line(tagged_sent) + "\n"
+
+
+class ConllWriter(Writer):
+    """
+    A class for writing tagged sentences CoNLL style: one line per word with its
+    number in the sentence, the word and its tag separated by tabs, and a blank
+    line after each sentence
+    """
+
+    def _format(self, tagged_sent):
+        """
+        Return a tagged sentence as a string to write
+
+        :param tagged_sent: list of (word, tag) tuples
+        """
+
+        return ''.join(["%d\t%s\t%s\n" % (i + 1, tagged_sent[i][0], \
+            tagged_sent[i][1]) for i in range(len(tagged_sent))]) + "\n"
+
+
+class JsonWriter(Writer):
+    """
+    A class for writing tagged sentences as JSON lines, each like {"words": [...],
+    "tags": [...]}
+    """
+
+    def _format(self, tagged_sent):
+        """
+        Return a tagged sentence as a string to write
+
+        :param tagged_sent: list of (word, tag) tuples
+        """
+
+        return json.dumps({'words': [word for (word, tag) in tagged_sent],
+            'tags': [tag for (word, tag) in tagged_sent]}) + "\n"
+
+
+class BinaryWriter(Writer):
+    """
+    A class for writing tagged sentences compactly as word ids and tag ids. Each
+    word and tag is written out once, the first time it is used, and takes the
+    next id; read_binary() reads the file back
+    """
+
+    def __init__(self, f, buffer_size=1048576, close_file=True):
+        """
+        Construct a BinaryWriter object, and start the file
+
+        :param f: file object to write to
+        :param buffer_size: number of bytes to collect before each write (default:
+            1048576)
+        :param close_file: whether close() should close f too (default: True)
+        """
+
+        Writer.__init__(self, f, buffer_size, close_file)
+        self.word_ids = {}
+        self.tag_ids = {}
+        self.parts.append(binary_magic)
+        self.size += len(binary_magic)
+
+    def _format(self, tagged_sent):
+        """
+        Return a tagged sentence as a string to write
+
+        :param tagged_sent: list of (word, tag) tuples
+        """
+
+        parts = []
+        word_ids = []
+        tag_ids = []
+        for (word, tag) in tagged_sent:
+            word_ids.append(self._intern(word, self.word_ids, 'W', parts))
+            tag_ids.append(self._intern(tag, self.tag_ids, 'T', parts))
+
+        parts.append('S' + struct.pack('<I%dI%dB' % (len(word_ids), \
+            len(tag_ids)), len(word_ids), *(word_ids + tag_ids)))
+
+        return ''.join(parts)
+
+    def _intern(self, item, ids, kind, parts):
+        """
+        Return the id of a word or tag, defining it first if it is new
+
+        :param item: string word or tag
+        :param ids: dict of item -> id to look in
+        :param kind: 'W' for a word or 'T' for a tag
+        :param parts: list of strings to add a definition to
+        """
+
+        item_id = ids.get(item)
+        if item_id is None:
+            item_id = ids[item] = len(ids)
+            if isinstance(item, unicode):
+                item = item.encode('utf-8')
+            parts.append(kind + struct.pack('<I', len(item)) + item)
+
+        return item_id
+
+
+# the writer class for each output format
+formats = {'penn': PennWriter, 'conll': ConllWriter, 'json': JsonWriter,
+    'binary': BinaryWriter}
@@ -1,18 +1,188 @@
 ######### hmm-tagger.py #########
 
-from TreebankCleaner import TreebankCleaner # import cleaning class
-from Tagger import Tagger # import the tagging controller
 import os # for path info
 import sys # for command line options
 
+def option(name, default):
+  """
+  Return the value given after a command line option, or a default
+  
+  :param name: string option, e.g. '--workers'
+  :param default: value to return if the option was not given
+  """
+  
+  if name in sys.argv:
+    return sys.argv[sys.argv.index(name) + 1]
+  return default
+
+if '--check-startup' in sys.argv:
+  from Startup import check_startup # only needed when checking startup
+  
+  # time the imports and model load of a tagging process, failing if it is slow
+  # or pulls in the training modules
+  timings = check_startup(option('--model', None))
+  print "imports: %0.3fs, model load: %0.3fs" % (timings['import_time'], \
+    timings['load_time'])
+  sys.exit(0)
+
 if '--clean' in sys.argv:
+  from TreebankCleaner import TreebankCleaner # only needed when cleaning
+  
   # initialize treebank cleaner with the current path and pre-downloaded file(s)
   t = TreebankCleaner(os.getcwd()+'/', ['treebank3_sect2.txt'])
   # do cleaning
   t.clean()
 
-# initialize a tagging object with the cleaned corpus file(s)
-t = Tagger(os.getcwd()+'/', ['treebank3_sect2.txt_cleaned'])
+# a model file to tag with, or to write after training on the whole corpus
+model_path = option('--model', None)
+
+scratch_model = None
+if ('--serve' in sys.argv or '--tag' in sys.argv) and model_path is None:
+  # keep the model we train in shared memory, so workers can attach to it
+  model_path = scratch_model = '/dev/shm/hmm-tagger-%d.model' % os.getpid()
+
+if '--save-model' in sys.argv or (model_path and not os.path.exists(model_path)):
+  from Tagger import Tagger # only needed when training, as it imports nltk
+  from UniversalTags import tag_sets # for the tag set to train on
+  
+  # initialize a tagging object with the cleaned corpus file(s), training on
+  # the Penn tags or on a coarser tag set
+  t = Tagger(os.getcwd()+'/', ['treebank3_sect2.txt_cleaned'], \
+    tags=tag_sets[option('--tagset', 'penn')])
+  
+  # train once on the whole corpus, and write out the model, leaving out the
+  # words seen fewer than --prune times if asked
+  min_count = int(option('--prune', 1))
+  if '--out-of-core' in sys.argv:
+    t.train_out_of_core(option('--save-model', model_path), \
+      int(option('--max-entries', 1000000)), quantize='--quantize' in sys.argv, \
+      min_count=min_count)
+  else:
+    t.train_files(int(option('--train-workers', 1)))
+    if min_count > 1:
+      t.prune(min_count)
+    t.save_model(option('--save-model', model_path), '--quantize' in sys.argv)
+
+# decode greedily, or give Viterbi a time budget for each sentence, if asked
+mode = 'greedy' if '--greedy' in sys.argv else 'viterbi'
+time_budget = option('--time-budget', None)
+if time_budget is not None:
+  time_budget = float(time_budget)
 
-# perform ten-fold cross-validation
-t.run_test_cycles()
+if '--serve' in sys.argv or '--tag' in sys.argv:
+  try:
+    if '--serve' in sys.argv:
+      from TagServer import serve # only needed when serving
+      
+      # listen on host:port, or on a unix socket path
+      address = option('--serve', None)
+      if ':' in address:
+        (host, port) = address.rsplit(':', 1)
+        address = (host, int(port))
+      
+      serve(model_path, address, int(option('--batch-size', 32)), \
+        float(option('--max-wait', 0.005)), int(option('--workers', 2)), mode, \
+        time_budget)
+    else:
+      from Tokenizer import tag_files # only needed when tagging raw text
+      from Writers import open_writer # for writing tagged text
+      
+      # tag every raw text file named after --tag, up to the next option
+      paths = []
+      for arg in sys.argv[sys.argv.index('--tag') + 1:]:
+        if arg.startswith('--'):
+          break
+        paths.append(arg)
+      
+      writer = open_writer(option('--output', '-'), \
+        option('--format', 'penn'), option('--compress', None))
+      if '--pipeline' in sys.argv:
+        from Pipeline import Pipeline # only needed for pipelines
+        from Tokenizer import iter_files # for reading the files as one stream
+        
+        # read, decode and write at once, and report which of them held us back
+        pipeline = Pipeline(model_path, int(option('--workers', 2)), \
+          int(option('--batch-size', 64)), int(option('--queue-size', 4)), \
+          mode, time_budget)
+        try:
+          stats = pipeline.run(iter_files(paths), \
+            lambda sent, tagged_sent: writer.write_sent(tagged_sent))
+        finally:
+          pipeline.close()
+        pipeline.report(stats)
+      else:
+        for (path, tagged_sents) in tag_files(model_path, paths, \
+          int(option('--workers', 2)), int(option('--batch-size', 64)), mode, \
+          time_budget):
+          writer.write_sents(tagged_sents)
+      writer.close()
+  finally:
+    # a model we trained just for this run is of no use to the next one, which
+    # gets a new path, so don't leave it taking up memory in /dev/shm
+    if scratch_model is not None and os.path.exists(scratch_model):
+      os.remove(scratch_model)
+elif '--save-model' not in sys.argv:
+  from Tagger import Tagger # only needed when training, as it imports nltk
+  from UniversalTags import tag_sets # for the tag set to train on
+  
+  # initialize a tagging object with the cleaned corpus file(s), held compactly
+  # in memory since every test cycle reads all of it
+  t = Tagger(os.getcwd()+'/', ['treebank3_sect2.txt_cleaned'], compact=True, \
+    tags=tag_sets[option('--tagset', 'penn')])
+  
+  if '--benchmark' in sys.argv:
+    # train on growing amounts of the corpus to see how we scale
+    sizes = option('--benchmark-sizes', None)
+    if sizes is not None:
+      sizes = [float(size) for size in sizes.split(',')]
+    t.run_scaling_benchmark(sizes, option('--benchmark-json', None))
+    sys.exit(0)
+  
+  if '--check-out-of-core' in sys.argv:
+    # train out of core on growing copies of the corpus, failing if the memory
+    # it takes grows with them
+    t.check_out_of_core(int(option('--max-entries', 20000)))
+    sys.exit(0)
+  
+  if '--benchmark-pruning' in sys.argv:
+    # compare the size, speed and accuracy of models pruned at each threshold
+    thresholds = option('--prune-thresholds', None)
+    if thresholds is not None:
+      thresholds = [int(threshold) for threshold in thresholds.split(',')]
+    t.run_pruning_benchmark(thresholds, option('--benchmark-json', None))
+    sys.exit(0)
+  
+  if '--pipeline' in sys.argv:
+    # tag and score the end of the corpus with reading, decoding and scoring
+    # running at once, and report how busy each was
+    t.run_pipeline(int(option('--workers', 2)), \
+      int(option('--batch-size', 64)), int(option('--queue-size', 4)))
+    sys.exit(0)
+  
+  if '--benchmark-decoder' in sys.argv:
+    # time the tuned decoder against the straightforward one
+    t.run_decoder_benchmark()
+    sys.exit(0)
+  
+  # record the metrics of each cycle and of the run, if asked
+  metrics = None
+  if '--metrics' in sys.argv:
+    from Metrics import Metrics # only needed when recording metrics
+    metrics = Metrics(option('--metrics', None), \
+      option('--metrics-format', 'json'))
+  
+  # compare greedy and time-budgeted decoding with Viterbi, if asked
+  modes = None
+  if '--compare-modes' in sys.argv:
+    modes = []
+    for (name, decoding_mode, budget) in Tagger.decoding_modes:
+      # --time-budget replaces the default budget of the budgeted mode
+      if budget is not None and time_budget is not None:
+        budget = time_budget
+      modes.append((name, decoding_mode, budget))
+  
+  # perform ten-fold cross-validation, also testing quantized models and
+  # refined coarse tags if asked, and picking up from the cycles checkpointed by
+  # earlier runs if asked
+  t.run_test_cycles('--quantize' in sys.argv, metrics, \
+    option('--checkpoint', None), modes, '--refine' in sys.argv)